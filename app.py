@@ -1,24 +1,40 @@
 import streamlit as st
 import asyncio
-from src.services.crawler_service import CrawlerService
-from src.services.vector_store_service import VectorStoreService
-from src.services.rag_service import RAGService
+import json
+from src.services.collection_manager import CollectionManager
+from src.services.answer_cache import SemanticAnswerCache
+from src.services.trace_service import TraceStore
+from src.services.crawl_jobs import CrawlJobRunner, ACTIVE_STATES, SOURCE_ARCHIVE
 from src.models.database import init_db, CrawlHistory
+from src.utils.metrics import registry as metrics_registry
 import os
-import time
+from typing import AsyncIterator, Iterator, TypeVar
+
+T = TypeVar('T')
+
+@st.cache_resource
+def get_shared_services():
+    """Services shared by every session and rerun; crawl jobs keep running in the background"""
+    collections = CollectionManager()  # Collections load on first query
+    trace_store = TraceStore()
+    job_runner = CrawlJobRunner(collections, trace_store=trace_store)
+    job_runner.start()
+    return collections, SemanticAnswerCache(), trace_store, job_runner
 
 # Initialize services
-crawler_service = CrawlerService()
-vector_store_service = VectorStoreService()  # This will now try to load existing vector store
+collections, answer_cache, trace_store, job_runner = get_shared_services()
 
-# Initialize database
+# Thread-local session proxy, created once per process
 db_session = init_db()
 
-def initialize_rag_service():
-    """Initialize RAG service if vector store exists and return it"""
-    if vector_store_service.vector_store is not None:
+def initialize_rag_service(names):
+    """Initialize a RAG service over the selected collections, if any, and return it"""
+    if names:
         try:
-            rag_service = RAGService(vector_store_service)
+            # Imported on first use: the LLM stack is slow to import and only chat needs it
+            from src.services.rag_service import RAGService
+            
+            rag_service = RAGService(collections.view(names), answer_cache, trace_store=trace_store)
             rag_service.initialize_chain()  # Initialize the chain immediately
             return rag_service
         except Exception as e:
@@ -26,19 +42,52 @@ def initialize_rag_service():
             return None
     return None
 
-def show_crawl_progress(url: str, max_pages: int):
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for i in range(max_pages):
-        progress_bar.progress((i + 1) / max_pages)
-        status_text.text(f"Crawling page {i + 1} of {max_pages}")
-        time.sleep(0.1)  # Simulate progress
+def iterate_async(async_iterator: AsyncIterator[T]) -> Iterator[T]:
+    """Drive an async iterator from Streamlit's synchronous script thread"""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(async_iterator.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+def show_crawl_jobs():
+    """Progress of queued and running crawl jobs, read back from crawl_history"""
+    db_session.expire_all()
+    jobs = (
+        db_session.query(CrawlHistory)
+        .filter(CrawlHistory.job_state.in_(ACTIVE_STATES))
+        .order_by(CrawlHistory.id)
+        .all()
+    )
+    if not jobs:
+        st.caption("No crawl jobs running.")
+        return
+    for job in jobs:
+        progress = json.loads(job.progress) if job.progress else {}
+        pages = progress.get('pages', 0)
+        # Reindex jobs without a page cap have no known total
+        st.progress(
+            min(pages / job.max_pages, 1.0) if job.max_pages else 0.0,
+            text=f"#{job.id} {job.url} → {job.collection} ({job.job_state}): "
+                 f"{pages} pages, {progress.get('chunks', 0)} chunks"
+        )
+        if st.button("Cancel", key=f"cancel_job_{job.id}"):
+            job_runner.cancel(job.id)
+
+# Poll job progress without rerunning the whole page where Streamlit supports it
+if hasattr(st, 'fragment'):
+    show_crawl_jobs = st.fragment(run_every=2)(show_crawl_jobs)
 
 def main():
     # Initialize session state variables
     if 'rag_service' not in st.session_state:
-        st.session_state.rag_service = initialize_rag_service()
+        st.session_state.rag_service = None
+        st.session_state.rag_collections = None
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     if 'messages' not in st.session_state:
@@ -51,52 +100,86 @@ def main():
         api_key = st.text_input("OpenAI API Key", type="password")
         if api_key:
             os.environ["OPENAI_API_KEY"] = api_key
-            # Reinitialize services if API key is provided
-            if st.session_state.rag_service is None and vector_store_service.vector_store is not None:
-                st.session_state.rag_service = RAGService(vector_store_service)
+        available = collections.list_collections()
+        selected = st.multiselect(
+            "Collections to search",
+            available,
+            default=available,
+            help="Each crawled site is indexed into its own collection"
+        )
+    
+    # (Re)build the RAG service when the selection changes, or once a key
+    # is given or a background crawl job has created the first collection
+    if os.getenv("OPENAI_API_KEY") and (
+        st.session_state.rag_service is None or st.session_state.rag_collections != selected
+    ):
+        st.session_state.rag_service = initialize_rag_service(selected)
+        st.session_state.rag_collections = selected
     
     # Tabs for different sections
-    tab1, tab2, tab3 = st.tabs(["Crawler", "RAG Search", "History"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Crawler", "RAG Search", "History", "Metrics"])
     
     # Crawler Section
     with tab1:
         st.header("Web Crawler")
         url = st.text_input("Enter URL to crawl")
         max_pages = st.number_input("Maximum pages to crawl", min_value=1, value=10)
+        collection = st.text_input(
+            "Collection",
+            placeholder="Defaults to the site's host name",
+            help="Pages are indexed into this collection; crawling a site again updates its collection"
+        )
+        discover_sitemaps = st.checkbox(
+            "Seed from sitemaps",
+            help="Queue the pages listed in the site's sitemaps before following links"
+        )
         
         if st.button("Start Crawling"):
-            with st.spinner("Crawling website..."):
+            if not url:
+                st.warning("Please enter a URL to crawl")
+            else:
+                # Crawl and index in a background job; pages unchanged since
+                # the last crawl are skipped. A crawl stays on the URL's host,
+                # so it runs in one process: workers are partitioned by host
                 try:
-                    # Run crawler
-                    crawl_results = asyncio.run(crawler_service.crawl(url, max_pages))
-                    
-                    # Store results in vector store
-                    vector_store_service.create_vector_store(crawl_results)
-                    
-                    # Initialize RAG service
-                    st.session_state.rag_service = RAGService(vector_store_service)
-                    st.session_state.rag_service.initialize_chain()
-                    
-                    # Save to database
-                    crawl_history = CrawlHistory(
-                        url=url,
-                        status=True,
-                        pages_crawled=len(crawl_results)
+                    job_id = job_runner.submit(
+                        url,
+                        int(max_pages),
+                        discover_sitemaps=discover_sitemaps,
+                        collection=collection.strip().lower() or None
                     )
-                    db_session.add(crawl_history)
-                    db_session.commit()
-                    
-                    st.success(f"Successfully crawled {len(crawl_results)} pages!")
-                    
-                except Exception as e:
-                    st.error(f"Error during crawling: {str(e)}")
-                    crawl_history = CrawlHistory(
-                        url=url,
-                        status=False,
-                        error_message=str(e)
+                    st.success(f"Queued crawl job #{job_id}. You can keep chatting while it runs.")
+                except ValueError as e:
+                    st.error(str(e))
+        
+        reindex_pages = st.number_input(
+            "Maximum pages to reindex",
+            min_value=0,
+            value=0,
+            help="0 reindexes every archived page under the URL"
+        )
+        if st.button(
+            "Reindex from archive",
+            help="Rebuild the collection from archived copies of the pages under this URL, without fetching them"
+        ):
+            if not url:
+                st.warning("Please enter the URL of an archived site")
+            else:
+                try:
+                    job_id = job_runner.submit(
+                        url,
+                        int(reindex_pages),
+                        collection=collection.strip().lower() or None,
+                        source=SOURCE_ARCHIVE
                     )
-                    db_session.add(crawl_history)
-                    db_session.commit()
+                    st.success(f"Queued reindex job #{job_id}.")
+                except ValueError as e:
+                    st.error(str(e))
+        
+        st.subheader("Crawl jobs")
+        show_crawl_jobs()
+        if not hasattr(st, 'fragment') and st.button("Refresh progress"):
+            st.rerun()
     
     # RAG Search Section
     with tab2:
@@ -128,7 +211,7 @@ def main():
                 return
             
             if st.session_state.rag_service is None:
-                st.warning("Please crawl a website first!")
+                st.warning("Please crawl a website first, or select a collection to search!")
                 return
 
             # Add user message to chat history
@@ -143,50 +226,44 @@ def main():
             with chat_container:
                 with st.chat_message("assistant"):
                     try:
-                        with st.spinner("Thinking..."):
-                            # Get response with context from chat history
-                            context = "\n".join([
-                                f"{msg['role']}: {msg['content']}" 
-                                for msg in st.session_state.chat_history[-3:]  # Use last 3 messages for context
-                            ])
-                            
-                            # Combine context with current query
-                            contextualized_query = f"""
-                            Previous conversation:
-                            {context}
-                            
-                            Current question: {query}
-                            
-                            Please provide a response that takes into account the conversation history.
-                            """
-                            
-                            response = st.session_state.rag_service.query(contextualized_query)
-                            
-                            # Display the response
-                            st.write(response["answer"])
-                            
-                            # Store sources
-                            sources = [doc.metadata['url'] for doc in response["source_documents"]]
-                            with st.expander("Sources"):
-                                for source in sources:
-                                    st.write(f"- {source}")
-                            
-                            # Add assistant response to chat history
-                            st.session_state.messages.append({
-                                "role": "assistant",
-                                "content": response["answer"],
-                                "sources": sources
-                            })
-                            
-                            # Update chat history for context
-                            st.session_state.chat_history.append({
-                                "role": "user",
-                                "content": query
-                            })
-                            st.session_state.chat_history.append({
-                                "role": "assistant",
-                                "content": response["answer"]
-                            })
+                        # Use last 3 messages for context
+                        history = st.session_state.chat_history[-3:]
+                        
+                        # Render tokens as they arrive; sources come before the first token
+                        answer_placeholder = st.empty()
+                        answer_placeholder.markdown("_Thinking..._")
+                        answer = ""
+                        sources = []
+                        events = st.session_state.rag_service.stream_query(query, history)
+                        for event in iterate_async(events):
+                            if event["type"] == "sources":
+                                sources = [doc.metadata['url'] for doc in event["source_documents"]]
+                            else:
+                                answer += event["content"]
+                                answer_placeholder.markdown(answer + "▌")
+                        answer_placeholder.markdown(answer)
+                        
+                        # Store sources
+                        with st.expander("Sources"):
+                            for source in sources:
+                                st.write(f"- {source}")
+                        
+                        # Add assistant response to chat history
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": answer,
+                            "sources": sources
+                        })
+                        
+                        # Update chat history for context
+                        st.session_state.chat_history.append({
+                            "role": "user",
+                            "content": query
+                        })
+                        st.session_state.chat_history.append({
+                            "role": "assistant",
+                            "content": answer
+                        })
 
                     except Exception as e:
                         st.error(f"Error during search: {str(e)}")
@@ -197,11 +274,42 @@ def main():
         history = db_session.query(CrawlHistory).order_by(CrawlHistory.timestamp.desc()).all()
         
         for entry in history:
-            status = "✅" if entry.status else "❌"
+            if entry.job_state in ACTIVE_STATES:
+                status = "⏳"
+            else:
+                status = "✅" if entry.status else "❌"
             st.write(f"{status} {entry.url} - {entry.timestamp}")
+            if entry.job_state:
+                kind = "Reindex" if entry.source == SOURCE_ARCHIVE else "Job"
+                st.write(f"{kind} #{entry.id}: {entry.job_state}, {entry.pages_crawled or 0} pages into {entry.collection or 'default'}")
             if entry.error_message:
                 st.write(f"Error: {entry.error_message}")
             st.write("---")
+    
+    # Metrics Section
+    with tab4:
+        st.header("Pipeline Metrics")
+        st.caption("Stage timings since the app started; also written to logs/metrics.prom")
+        rows = metrics_registry.summary()
+        if rows:
+            st.dataframe(rows, use_container_width=True)
+        else:
+            st.info("No metrics recorded yet. Run a crawl or ask a question.")
+        
+        st.subheader("Recent traces")
+        for trace in trace_store.recent(limit=20):
+            duration = trace['duration_seconds'] or 0.0
+            label = f"{trace['kind']}: {trace['subject'].strip()[:80]} ({duration:.2f}s, {trace['started_at']})"
+            with st.expander(label):
+                st.table([
+                    {'stage': stage, 'count': int(entry['count']), 'seconds': round(entry['seconds'], 3)}
+                    for stage, entry in sorted(trace['stages'].items(), key=lambda item: -item[1]['seconds'])
+                ])
+                if trace['counters']:
+                    st.json(trace['counters'])
+        
+        with st.expander("Prometheus text format"):
+            st.code(metrics_registry.render(), language="text")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1 @@
+# This file can be empty, it just needs to exist
@@ -0,0 +1,306 @@
+"""Offline crawler benchmark against a synthetic local site.
+
+Starts one aiohttp server per synthetic host on 127.0.0.1 in a separate
+process, crawls it with CrawlerService and reports throughput, fetch latency
+percentiles, parse time and peak RSS. Results are written as JSON so runs
+can be compared:
+
+    python -m benchmarks.crawler_benchmark --pages 500 --output run.json
+    python -m benchmarks.crawler_benchmark --pages 500 --compare run.json
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+from sqlalchemy import create_engine
+
+from src.models.database import Base
+from src.services.crawler_service import CrawlerService
+from src.services.frontier_service import CrawlFrontier
+from src.services.host_scheduler import HostScheduler
+from src.services.page_archive import PageArchive
+from src.services.page_record_service import PageRecordService
+from src.utils.metrics import registry
+
+WORDS = (
+    "crawler index vector search page link token latency queue frontier host "
+    "robots sitemap chunk embed query answer cache document metric archive"
+).split()
+
+
+@dataclass
+class SiteConfig:
+    """Shape of the synthetic site"""
+    pages: int = 1000
+    hosts: int = 4
+    fanout: int = 8
+    page_words: int = 800
+    latency_ms: float = 5.0
+    error_rate: float = 0.01
+    slow_hosts: int = 1
+    slow_latency_ms: float = 100.0
+    seed: int = 42
+
+
+@dataclass
+class BenchmarkResult:
+    site: Dict
+    max_pages: int
+    parse_workers: int
+    max_concurrency: int
+    pages: int = 0
+    elapsed_seconds: float = 0.0
+    pages_per_second: float = 0.0
+    fetch_p50_ms: float = 0.0
+    fetch_p99_ms: float = 0.0
+    parse_total_seconds: float = 0.0
+    parse_mean_ms: float = 0.0
+    connections_per_page: float = 0.0
+    body_bytes_per_page: float = 0.0
+    peak_rss_mb: float = 0.0
+    peak_child_rss_mb: float = 0.0
+    crawl_stats: Dict[str, int] = field(default_factory=dict)
+    started_at: str = ''
+
+
+def page_links(config: SiteConfig, host: int, page: int, ports: List[int]) -> List[str]:
+    """Deterministic outgoing links of a page"""
+    rng = random.Random(config.seed * 1_000_003 + host * 10_007 + page)
+    links = []
+    for _ in range(config.fanout):
+        target_host = host if rng.random() < 0.7 else rng.randrange(config.hosts)
+        links.append(f"http://127.0.0.1:{ports[target_host]}/page/{rng.randrange(config.pages)}")
+    return links
+
+
+def page_html(config: SiteConfig, host: int, page: int, ports: List[int]) -> str:
+    rng = random.Random(config.seed + host * 7919 + page)
+    text = ' '.join(rng.choice(WORDS) for _ in range(config.page_words))
+    links = ''.join(f'<a href="{link}">link</a> ' for link in page_links(config, host, page, ports))
+    return (
+        f"<html><head><title>Host {host} page {page}</title></head>"
+        f"<body><nav>menu</nav><p>{text}</p>{links}<footer>footer</footer></body></html>"
+    )
+
+
+def make_app(config: SiteConfig, host: int, ports: List[int]) -> web.Application:
+    latency = (config.slow_latency_ms if host < config.slow_hosts else config.latency_ms) / 1000
+
+    async def handle_page(request: web.Request) -> web.Response:
+        page = int(request.match_info['page'])
+        await asyncio.sleep(latency)
+        rng = random.Random(config.seed ^ (host << 20) ^ page)
+        if page >= config.pages or rng.random() < config.error_rate:
+            return web.Response(status=500)
+        return web.Response(text=page_html(config, host, page, ports), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/page/{page}', handle_page)
+    return app
+
+
+def serve_site(config: SiteConfig, ports_queue, stop_event):
+    """Run the synthetic hosts until `stop_event` is set (child process entry point)"""
+    async def main():
+        # Bind every host first so pages can link across hosts by port
+        sockets = []
+        for _ in range(config.hosts):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(('127.0.0.1', 0))
+            sockets.append(sock)
+        ports = [sock.getsockname()[1] for sock in sockets]
+
+        runners = []
+        for host, sock in enumerate(sockets):
+            runner = web.AppRunner(make_app(config, host, ports), access_log=None)
+            await runner.setup()
+            await web.SockSite(runner, sock).start()
+            runners.append(runner)
+        ports_queue.put(ports)
+        while not stop_event.is_set():
+            await asyncio.sleep(0.1)
+        for runner in runners:
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def fetch_timer(latencies: List[float]) -> aiohttp.TraceConfig:
+    """TraceConfig that records request durations in milliseconds"""
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        latencies.append((time.perf_counter() - context.start) * 1000)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_crawl(crawler: CrawlerService, start_url: str, max_pages: int) -> int:
+    pages = 0
+    async for _ in crawler.iter_crawl(start_url, max_pages, resume=False):
+        pages += 1
+    return pages
+
+
+def run_benchmark(config: SiteConfig, max_pages: int, parse_workers: int, max_concurrency: int) -> BenchmarkResult:
+    ctx = multiprocessing.get_context('spawn')
+    ports_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    server = ctx.Process(target=serve_site, args=(config, ports_queue, stop_event), daemon=True)
+    server.start()
+    ports = ports_queue.get(timeout=30)
+
+    result = BenchmarkResult(
+        site=asdict(config),
+        max_pages=max_pages,
+        parse_workers=parse_workers,
+        max_concurrency=max_concurrency,
+        started_at=datetime.now().isoformat(timespec='seconds')
+    )
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Keep benchmark state out of crawler_rag.db
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+            Base.metadata.create_all(engine)
+            crawler = CrawlerService(
+                scheduler=HostScheduler(default_delay=0.001, max_concurrency=max_concurrency, respect_robots=False),
+                frontier_factory=lambda key: CrawlFrontier(key, engine=engine),
+                page_records=PageRecordService(engine),
+                parse_workers=parse_workers,
+                archive=PageArchive(os.path.join(tmp_dir, 'page_archive'), engine=engine)
+            )
+            crawler.allowed_hosts = {f"127.0.0.1:{port}" for port in ports}
+            latencies: List[float] = []
+            crawler.trace_configs.append(fetch_timer(latencies))
+
+            parse_times: List[float] = []
+            parse_content = crawler.parse_content
+
+            async def timed_parse(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await parse_content(*args, **kwargs)
+                finally:
+                    parse_times.append(time.perf_counter() - start)
+
+            crawler.parse_content = timed_parse
+
+            start = time.perf_counter()
+            result.pages = asyncio.run(run_crawl(crawler, f"http://127.0.0.1:{ports[0]}/page/0", max_pages))
+            result.elapsed_seconds = time.perf_counter() - start
+            crawler.close()
+
+            result.pages_per_second = result.pages / result.elapsed_seconds if result.elapsed_seconds else 0.0
+            result.fetch_p50_ms = percentile(latencies, 0.50)
+            result.fetch_p99_ms = percentile(latencies, 0.99)
+            result.parse_total_seconds = sum(parse_times)
+            result.parse_mean_ms = statistics.mean(parse_times) * 1000 if parse_times else 0.0
+            result.crawl_stats = dict(crawler.crawl_stats)
+            if result.pages:
+                connections = crawler.trace.stages.get('connect', {}).get('count', 0)
+                body_bytes = registry.counters.get('crawl_body_bytes_total', {}).get((), 0)
+                result.connections_per_page = connections / result.pages
+                result.body_bytes_per_page = body_bytes / result.pages
+    finally:
+        stop_event.set()
+        server.join(timeout=10)
+
+    # ru_maxrss is reported in kilobytes on Linux
+    result.peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    result.peak_child_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return result
+
+
+def compare(current: BenchmarkResult, baseline_path: str, max_regression: float) -> bool:
+    """Print metric deltas against a saved run; returns False on a regression"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    # (metric, higher_is_better)
+    metrics = [
+        ('pages_per_second', True),
+        ('fetch_p50_ms', False),
+        ('fetch_p99_ms', False),
+        ('parse_mean_ms', False),
+        ('connections_per_page', False),
+        ('body_bytes_per_page', False),
+        ('peak_rss_mb', False),
+    ]
+    ok = True
+    for name, higher_is_better in metrics:
+        before, after = baseline.get(name, 0.0), getattr(current, name)
+        change = (after - before) / before if before else 0.0
+        regressed = change < -max_regression if higher_is_better else change > max_regression
+        ok = ok and not regressed
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{name:>20}: {before:10.2f} -> {after:10.2f} ({change:+.1%}){flag}")
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=500, help="Maximum pages to crawl")
+    parser.add_argument('--site-pages', type=int, default=2000, help="Pages per synthetic host")
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--fanout', type=int, default=8)
+    parser.add_argument('--page-words', type=int, default=800)
+    parser.add_argument('--latency-ms', type=float, default=5.0)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--slow-hosts', type=int, default=1)
+    parser.add_argument('--slow-latency-ms', type=float, default=100.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--output', help="Write the result as JSON to this path")
+    parser.add_argument('--compare', help="Compare against a previous JSON result")
+    parser.add_argument('--max-regression', type=float, default=0.10, help="Allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    config = SiteConfig(
+        pages=args.site_pages,
+        hosts=args.hosts,
+        fanout=args.fanout,
+        page_words=args.page_words,
+        latency_ms=args.latency_ms,
+        error_rate=args.error_rate,
+        slow_hosts=args.slow_hosts,
+        slow_latency_ms=args.slow_latency_ms,
+        seed=args.seed
+    )
+    result = run_benchmark(config, args.pages, args.parse_workers, args.concurrency)
+    print(json.dumps(asdict(result), indent=2))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(asdict(result), f, indent=2)
+    if args.compare:
+        return 0 if compare(result, args.compare, args.max_regression) else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
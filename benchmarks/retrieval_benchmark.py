@@ -0,0 +1,280 @@
+"""Offline retrieval benchmark with deterministic fake embeddings.
+
+Builds a synthetic corpus of topical chunks, embeds it with a hashing
+embedding that needs no network, indexes it with each index configuration
+and reports recall@k against exact search, build time, index memory and
+query throughput and latency percentiles, one query at a time and batched.
+Results are written as JSON so runs can be compared:
+
+    python -m benchmarks.retrieval_benchmark --chunks 20000 --output run.json
+    python -m benchmarks.retrieval_benchmark --indexes flat hnsw --batch-size 64
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.services.faiss_index import IndexConfig
+from src.services.vector_store_service import VectorStoreService
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic embeddings: the normalized sum of a fixed random vector per word.
+
+    Texts that share words get nearby vectors, so a topical corpus has the
+    clustered structure real embeddings give, without any API calls.
+    """
+
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+        self._words: Dict[str, np.ndarray] = {}
+
+    def _word(self, word: str) -> np.ndarray:
+        vector = self._words.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._words[word] = vector
+        return vector
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.split():
+            vector += self._word(word)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+@dataclass
+class CorpusConfig:
+    """Shape of the synthetic corpus and query set"""
+    chunks: int = 20000
+    topics: int = 100
+    topic_words: int = 50
+    shared_words: int = 500
+    chunk_words: int = 120
+    topic_share: float = 0.6  # Fraction of a chunk's words drawn from its topic
+    queries: int = 500
+    query_words: int = 8
+    dim: int = 128
+    seed: int = 42
+
+
+@dataclass
+class IndexResult:
+    index_type: str
+    config: Dict
+    trained: bool = False  # False while an IVF index is still a flat staging index
+    build_seconds: float = 0.0
+    index_memory_mb: float = 0.0
+    recall_at_k: float = 0.0
+    single_qps: float = 0.0
+    single_p50_ms: float = 0.0
+    single_p99_ms: float = 0.0
+    batch_qps: float = 0.0
+    batch_p50_ms: float = 0.0  # Per batch
+    batch_p99_ms: float = 0.0
+
+
+@dataclass
+class BenchmarkResult:
+    corpus: Dict
+    k: int
+    batch_size: int
+    results: List[IndexResult] = field(default_factory=list)
+    started_at: str = ''
+
+
+def make_corpus(config: CorpusConfig):
+    """Deterministic chunk texts and queries; each query takes words from one chunk"""
+    rng = random.Random(config.seed)
+    shared = [f"w{i}" for i in range(config.shared_words)]
+    topics = [
+        [f"t{topic}_{i}" for i in range(config.topic_words)]
+        for topic in range(config.topics)
+    ]
+    texts = []
+    for _ in range(config.chunks):
+        vocabulary = topics[rng.randrange(config.topics)]
+        texts.append(' '.join(
+            rng.choice(vocabulary) if rng.random() < config.topic_share else rng.choice(shared)
+            for _ in range(config.chunk_words)
+        ))
+    queries = [
+        ' '.join(rng.sample(texts[rng.randrange(config.chunks)].split(), config.query_words))
+        for _ in range(config.queries)
+    ]
+    return texts, queries
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Row indexes of the exact k nearest corpus vectors of every query, by L2 distance"""
+    neighbours = []
+    corpus_norms = (corpus ** 2).sum(axis=1)
+    for start in range(0, len(queries), 256):
+        batch = queries[start:start + 256]
+        distances = corpus_norms[None, :] - 2 * batch @ corpus.T
+        top = np.argpartition(distances, k, axis=1)[:, :k]
+        order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+        neighbours.append(np.take_along_axis(top, order, axis=1))
+    return np.vstack(neighbours)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def index_configs(names: List[str], nlist: int) -> List[IndexConfig]:
+    configs = {
+        'flat': IndexConfig(index_type='flat'),
+        'hnsw': IndexConfig(index_type='hnsw'),
+        'ivf_flat': IndexConfig(index_type='ivf_flat', nlist=nlist, nprobe=max(1, nlist // 16)),
+        'ivf_pq': IndexConfig(index_type='ivf_pq', nlist=nlist, nprobe=max(1, nlist // 16), pq_m=16, pq_nbits=8),
+    }
+    return [configs[name] for name in names]
+
+
+def benchmark_index(
+    config: IndexConfig,
+    embeddings: HashingEmbeddings,
+    texts: List[str],
+    vectors: np.ndarray,
+    queries: List[str],
+    query_vectors: np.ndarray,
+    truth: np.ndarray,
+    k: int,
+    batch_size: int
+) -> IndexResult:
+    result = IndexResult(index_type=config.index_type, config=config.model_dump())
+    ids = np.arange(1, len(texts) + 1, dtype=np.int64)  # Row i is stored under id i + 1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = VectorStoreService(
+            store_dir=os.path.join(tmp_dir, 'store'),
+            embeddings=embeddings,
+            index_config=config,
+            retrieval_mode='vector'
+        )
+        start = time.perf_counter()
+        for offset in range(0, len(texts), 1000):
+            end = min(offset + 1000, len(texts))
+            metadatas = [
+                {'url': f"bench://page/{i // 8}", 'title': '', 'chunk': i % 8, 'start_index': 0}
+                for i in range(offset, end)
+            ]
+            store.add_embedded_chunks(texts[offset:end], vectors[offset:end], metadatas, ids[offset:end].tolist())
+        result.build_seconds = time.perf_counter() - start
+        result.trained = not store.vector_store.is_staging
+        result.index_memory_mb = store.memory_bytes() / 1024 / 1024
+
+        latencies = []
+        start = time.perf_counter()
+        for query, vector in zip(queries, query_vectors):
+            query_start = time.perf_counter()
+            store.search_ids(query, k, query_vector=vector.tolist())
+            latencies.append((time.perf_counter() - query_start) * 1000)
+        elapsed = time.perf_counter() - start
+        result.single_qps = len(queries) / elapsed if elapsed else 0.0
+        result.single_p50_ms = percentile(latencies, 0.50)
+        result.single_p99_ms = percentile(latencies, 0.99)
+
+        batch_latencies = []
+        hits = []
+        start = time.perf_counter()
+        for offset in range(0, len(queries), batch_size):
+            batch_start = time.perf_counter()
+            hits.extend(store.batch_search_ids(
+                queries[offset:offset + batch_size], k,
+                query_vectors=query_vectors[offset:offset + batch_size].tolist()
+            ))
+            batch_latencies.append((time.perf_counter() - batch_start) * 1000)
+        elapsed = time.perf_counter() - start
+        result.batch_qps = len(queries) / elapsed if elapsed else 0.0
+        result.batch_p50_ms = percentile(batch_latencies, 0.50)
+        result.batch_p99_ms = percentile(batch_latencies, 0.99)
+        store.close()
+
+    found = [{doc_id - 1 for doc_id, _ in query_hits} for query_hits in hits]
+    result.recall_at_k = float(np.mean([len(rows & set(expected)) / k for rows, expected in zip(found, truth.tolist())]))
+    return result
+
+
+def run_benchmark(config: CorpusConfig, index_names: List[str], k: int, batch_size: int, nlist: int) -> BenchmarkResult:
+    embeddings = HashingEmbeddings(config.dim)
+    texts, queries = make_corpus(config)
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    truth = exact_neighbours(vectors, query_vectors, k)
+
+    result = BenchmarkResult(
+        corpus=asdict(config),
+        k=k,
+        batch_size=batch_size,
+        started_at=datetime.now().isoformat(timespec='seconds')
+    )
+    for index_config in index_configs(index_names, nlist):
+        result.results.append(benchmark_index(
+            index_config, embeddings, texts, vectors, queries, query_vectors, truth, k, batch_size
+        ))
+    return result
+
+
+def print_table(result: BenchmarkResult):
+    print(
+        f"{'index':>9} {'recall@' + str(result.k):>9} {'build s':>8} {'mem MB':>8} "
+        f"{'qps':>9} {'p50 ms':>8} {'p99 ms':>8} {'batch qps':>10}"
+    )
+    for row in result.results:
+        print(
+            f"{row.index_type:>9} {row.recall_at_k:9.3f} {row.build_seconds:8.2f} {row.index_memory_mb:8.1f} "
+            f"{row.single_qps:9.0f} {row.single_p50_ms:8.2f} {row.single_p99_ms:8.2f} {row.batch_qps:10.0f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=20000)
+    parser.add_argument('--topics', type=int, default=100)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--dim', type=int, default=128, help="Must be a multiple of 16 for ivf_pq")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--nlist', type=int, default=128, help="IVF lists; IVF indexes need 39 vectors per list to train")
+    parser.add_argument(
+        '--indexes', nargs='+', default=['flat', 'hnsw', 'ivf_flat', 'ivf_pq'],
+        choices=['flat', 'hnsw', 'ivf_flat', 'ivf_pq']
+    )
+    parser.add_argument('--output', help="Write the result as JSON to this path")
+    args = parser.parse_args(argv)
+
+    config = CorpusConfig(chunks=args.chunks, topics=args.topics, queries=args.queries, dim=args.dim, seed=args.seed)
+    result = run_benchmark(config, args.indexes, args.k, args.batch_size, args.nlist)
+    print_table(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(asdict(result), f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, DateTime, Boolean, Float, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from datetime import datetime
+from functools import lru_cache
+
+DATABASE_URL = 'sqlite:///crawler_rag.db'
+ASYNC_DATABASE_URL = DATABASE_URL.replace('sqlite://', 'sqlite+aiosqlite://', 1)
 
 Base = declarative_base()
 
@@ -14,9 +18,155 @@ class CrawlHistory(Base):
     status = Column(Boolean, default=False)
     pages_crawled = Column(Integer, default=0)
     error_message = Column(String, nullable=True)
+    # Background job fields; see src/services/crawl_jobs.py
+    job_state = Column(String, nullable=True)  # queued, running, succeeded, failed, cancelled
+    max_pages = Column(Integer, nullable=True)
+    workers = Column(Integer, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    progress = Column(Text, nullable=True)  # JSON counters, updated while the job runs
+    discover_sitemaps = Column(Boolean, nullable=True)
+    collection = Column(String, nullable=True)  # Vector store collection the job indexes into
+    source = Column(String, nullable=True)  # 'crawl', or 'archive' to reindex archived pages
 
-def init_db():
-    engine = create_engine('sqlite:///crawler_rag.db')
+class PipelineTrace(Base):
+    """Per-stage timings and counters of one crawl or query"""
+    __tablename__ = 'pipeline_traces'
+    __table_args__ = (
+        Index('ix_trace_kind_started', 'kind', 'started_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    crawl_history_id = Column(Integer, ForeignKey('crawl_history.id'), nullable=True)
+    kind = Column(String, nullable=False)  # 'crawl' or 'query'
+    subject = Column(Text, nullable=False)  # Start URL or question
+    started_at = Column(DateTime, default=datetime.utcnow)
+    duration_seconds = Column(Float, nullable=True)
+    stages = Column(Text, nullable=True)  # JSON {stage: {count, seconds}}
+    counters = Column(Text, nullable=True)  # JSON {name: value}
+
+class FrontierEntry(Base):
+    """A URL discovered by a crawl, with its crawl state"""
+    __tablename__ = 'crawl_frontier'
+    __table_args__ = (
+        UniqueConstraint('crawl_key', 'url', name='uq_frontier_crawl_url'),
+        Index('ix_frontier_priority_pop', 'crawl_key', 'state', 'priority', 'id'),
+        Index('ix_frontier_partition_priority_pop', 'crawl_key', 'partition', 'state', 'priority', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    crawl_key = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    state = Column(String, nullable=False, default='queued')
+    depth = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    partition = Column(Integer, default=0)  # Host partition, for multi-worker crawls
+    priority = Column(Float, default=0.0)  # Lower pops first; sitemap seeds use -lastmod
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class PageRecord(Base):
+    """Validators and hashes of the last successful fetch of a page"""
+    __tablename__ = 'page_records'
+    __table_args__ = (
+        Index('ix_page_records_simhash', 'simhash'),  # Near-duplicate originals are looked up by SimHash
+    )
+    
+    id = Column(Integer, primary_key=True)
+    url = Column(String, nullable=False, unique=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    body_hash = Column(String, nullable=True)
+    content_hash = Column(String, nullable=True)
+    title = Column(String, nullable=True)
+    links = Column(Text, nullable=True)  # JSON list of outgoing links
+    simhash = Column(String, nullable=True)  # Hex SimHash of the extracted text
+    duplicate_of = Column(String, nullable=True)  # URL this page near-duplicates
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+class ArchiveRecord(Base):
+    """Where one archived fetch of a page is stored; see src/services/page_archive.py"""
+    __tablename__ = 'archive_records'
+    __table_args__ = (
+        Index('ix_archive_url_id', 'url', 'id'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    url = Column(String, nullable=False)
+    crawl_id = Column(Integer, ForeignKey('crawl_history.id'), nullable=True)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(Integer, nullable=False)
+    content_type = Column(String, nullable=True)
+    title = Column(String, nullable=True)
+    body_hash = Column(String, nullable=True)
+    duplicate_of = Column(String, nullable=True)  # Canonical or near-duplicate original; not indexed
+    segment = Column(String, nullable=True)  # Segment file name; NULL when the page was gone
+    offset = Column(Integer, nullable=True)
+    length = Column(Integer, nullable=True)
+
+_engine = None
+
+def get_engine():
+    """Return the process-wide engine, creating tables on first use"""
+    global _engine
+    if _engine is None:
+        _engine = create_engine(DATABASE_URL)
+        Base.metadata.create_all(_engine)
+        add_missing_columns(_engine)
+        add_missing_indexes(_engine)
+    return _engine
+
+@lru_cache(maxsize=None)
+def create_shared_engine(database_url: str = DATABASE_URL):
+    """Return an engine for a database written by several processes at once.
+    
+    WAL lets readers run alongside the single writer, and the busy timeout
+    makes writers wait for the lock instead of failing.
+    """
+    engine = create_engine(database_url, connect_args={'timeout': 60})
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+    
     Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    return Session() 
\ No newline at end of file
+    add_missing_columns(engine)
+    add_missing_indexes(engine)
+    return engine
+
+def get_async_engine(database_url: str = ASYNC_DATABASE_URL):
+    """Return an aiosqlite engine for writes from the event loop; the schema comes from `get_engine`"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    
+    get_engine()
+    return create_async_engine(database_url, connect_args={'timeout': 60})
+
+def add_missing_columns(engine):
+    """Add columns introduced since a table was created; create_all skips existing tables"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def add_missing_indexes(engine):
+    """Create indexes introduced since a table was created"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+@lru_cache(maxsize=None)
+def get_session_registry() -> scoped_session:
+    """Process-wide session registry; every thread gets its own session on the shared engine"""
+    return scoped_session(sessionmaker(bind=get_engine()))
+
+def init_db():
+    """Return a session proxy that is safe to share across threads and Streamlit reruns"""
+    return get_session_registry()
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    vector: Optional[np.ndarray]
+    result: Dict[str, Any]
+    created_at: float
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive key for exact matches"""
+    return ' '.join(query.lower().split())
+
+
+class SemanticAnswerCache:
+    """Answer cache that matches exact questions and close paraphrases.
+
+    Exact matches need no embedding. Paraphrases match when the cosine
+    similarity of their query embeddings reaches `similarity_threshold`.
+    Entries expire after `ttl_seconds`, the least recently used are evicted
+    beyond `max_entries`, and everything is dropped when the vector store
+    version changes.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 512):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries: 'OrderedDict[str, CachedAnswer]' = OrderedDict()
+        self.store_version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, store_version: int):
+        if self.store_version != store_version:
+            if self.entries:
+                logger.info("Vector store changed; clearing answer cache")
+            self.entries.clear()
+            self.store_version = store_version
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key in [key for key, entry in self.entries.items() if entry.created_at < cutoff]:
+            del self.entries[key]
+
+    def get_exact(self, query: str, store_version: int) -> Optional[Dict[str, Any]]:
+        """Return the cached result for the same question, if any"""
+        with self._lock:
+            self._check_version(store_version)
+            self._expire()
+            key = normalize_query(query)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def get_similar(self, query_vector: Sequence[float], store_version: int) -> Optional[Dict[str, Any]]:
+        """Return the cached result of the closest paraphrase above the threshold"""
+        with self._lock:
+            self._check_version(store_version)
+            self._expire()
+            candidates = [(key, entry) for key, entry in self.entries.items() if entry.vector is not None]
+            if not candidates:
+                self.misses += 1
+                return None
+            matrix = np.vstack([entry.vector for _, entry in candidates])
+            similarities = matrix @ self._unit(query_vector)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            key, entry = candidates[best]
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry.result
+
+    def put(self, query: str, query_vector: Optional[Sequence[float]], store_version: int, result: Dict[str, Any]):
+        with self._lock:
+            self._check_version(store_version)
+            key = normalize_query(query)
+            vector = self._unit(query_vector) if query_vector is not None else None
+            self.entries[key] = CachedAnswer(query=query, vector=vector, result=result, created_at=time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
@@ -0,0 +1,157 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from src.services.html_parser import parse_html
+from src.services.page_archive import PageArchive, read_archived
+from src.services.url_canonicalizer import UrlCanonicalizer
+from src.utils.metrics import Trace, registry
+
+logger = logging.getLogger(__name__)
+
+
+def load_archived_page(
+    path: str,
+    offset: int,
+    length: int,
+    url: str,
+    title: str,
+    reparse: bool,
+    max_content_length: int
+) -> Optional[Dict]:
+    """Read one archived page and, with `reparse`, extract its text again (process pool entry point)"""
+    _, headers, body, text = read_archived(path, offset, length)
+    if not reparse:
+        return {'url': url, 'title': title, 'content': text}
+    content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+    result = parse_html(url, body, content_type, max_content_length)
+    if result is None:
+        return None
+    return {key: result[key] for key in ('url', 'title', 'content', 'timings')}
+
+
+class ArchiveReplay:
+    """Feeds archived pages to `IndexingPipeline` in place of a crawl.
+
+    Offers the `iter_crawl`, `crawl_stats` and `removed_urls` interface of
+    `CrawlerService`. The newest archived fetch of every live page under
+    the start URL is read back from the archive; with `reparse`, text is
+    extracted again from the raw HTML, so changes to the parser take
+    effect, otherwise the text extracted at crawl time is reused. Reading
+    and parsing run in a process pool, so a reindex makes no requests and
+    runs as fast as the disk and CPUs allow. Chunks whose text has not
+    changed are served from the embedding cache.
+    """
+
+    def __init__(
+        self,
+        archive: Optional[PageArchive] = None,
+        parse_workers: Optional[int] = None,
+        reparse: bool = True,
+        crawl_ids: Optional[Sequence[int]] = None,
+        max_content_length: int = 100000,
+        canonicalizer: Optional[UrlCanonicalizer] = None
+    ):
+        self.archive = archive or PageArchive()
+        # Pages are archived under canonical URLs, so the start URL is matched in that form
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        # Worker processes for reading and parsing; 0 uses a thread of the event loop
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.reparse = reparse
+        self.crawl_ids = crawl_ids  # Only replay pages archived by these crawls
+        self.max_content_length = max_content_length
+        self.crawl_stats: Dict[str, int] = {}
+        self.removed_urls: List[str] = []
+        self.trace = Trace('crawl', '')
+        self.executor: Optional[Executor] = None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def iter_crawl(
+        self,
+        start_url: str,
+        max_pages: Optional[int] = None,
+        trace: Optional[Trace] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """Yield archived pages at or below `start_url`, up to `max_pages` (0 or None: all).
+
+        Crawl options such as `incremental` are accepted and ignored: every
+        archived page is yielded, so the caller replaces its chunks. Pages
+        that are gone or near-duplicates in the archive end up in
+        `removed_urls`, so the caller drops their chunks.
+        """
+        self.crawl_stats = {'archived': 0, 'replayed': 0, 'empty': 0, 'removed': 0}
+        self.removed_urls = []
+        self.trace = trace or Trace('crawl', start_url)
+        url_prefix = self.canonicalizer.canonicalize(start_url)
+        with self.trace.stage('archive_lookup'):
+            rows = await asyncio.to_thread(self.archive.latest, url_prefix, self.crawl_ids, max_pages or None)
+            removed_urls = await asyncio.to_thread(self.archive.removed, url_prefix, self.crawl_ids)
+        self.crawl_stats['archived'] = len(rows)
+        logger.info(f"Replaying {len(rows)} archived pages under {start_url}")
+
+        if self.parse_workers > 0 and self.executor is None:
+            # spawn avoids forking the threads of the Streamlit server
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        # Enough pages in flight to keep every worker busy, few enough to bound memory
+        window = max(self.parse_workers, 1) * 4
+        pending = set()
+        try:
+            for row in rows:
+                pending.add(self._submit(row))
+                if len(pending) >= window:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for page in self._pages(done):
+                        yield page
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for page in self._pages(done):
+                    yield page
+            # Only once every page was replayed, as for a crawl
+            self.removed_urls = removed_urls
+            self.crawl_stats['removed'] = len(removed_urls)
+        finally:
+            for future in pending:
+                future.cancel()
+            self.trace.counters.update(self.crawl_stats)
+            for outcome, count in self.crawl_stats.items():
+                registry.inc('archive_pages_total', count, outcome=outcome)
+            if trace is None:
+                self.trace.finish()
+                registry.write()
+            logger.info(f"Archive replay of {start_url} completed. Stats: {self.crawl_stats}")
+
+    def _submit(self, row) -> asyncio.Future:
+        """Read and parse one page in the process pool, or a thread when there is none"""
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, load_archived_page,
+            self.archive.path(row.segment), row.offset, row.length, row.url,
+            row.title or row.url, self.reparse, self.max_content_length
+        )
+
+    def _pages(self, done) -> List[Dict]:
+        pages = []
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Could not read archived page: {str(e)}")
+                result = None
+            if not result or not result['content'].strip():
+                self.crawl_stats['empty'] += 1
+                continue
+            for stage, seconds in result.pop('timings', {}).items():
+                self.trace.record(stage, seconds)
+            self.crawl_stats['replayed'] += 1
+            pages.append(result)
+        return pages
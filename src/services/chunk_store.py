@@ -0,0 +1,146 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import json
+import logging
+import zlib
+
+from sqlalchemy import Column, Integer, LargeBinary, MetaData, String, Table, Text, create_engine, delete, func, select
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+chunks_table = Table(
+    'chunks',
+    metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),  # FAISS vector id
+    Column('url', String, nullable=False, index=True),
+    Column('title', String),
+    Column('chunk', Integer),
+    Column('start_index', Integer),
+    Column('crawl_id', Integer),
+    Column('text', LargeBinary, nullable=False),  # zlib-compressed UTF-8
+    Column('extra', Text),  # JSON of any other metadata keys
+)
+
+# Metadata keys stored in their own columns
+_COLUMNS = ('url', 'title', 'chunk', 'start_index', 'crawl_id')
+
+# SQLite caps the number of bound parameters per statement
+_BATCH = 500
+
+ChunkEntry = Tuple[str, Dict[str, Any]]
+
+
+class ChunkStore:
+    """Chunk text and metadata in SQLite, keyed by vector id.
+
+    Text is zlib-compressed per row and only decompressed for the chunks a
+    caller asks for, so nothing but the FAISS index has to stay in memory.
+
+    Every change goes through one connection whose transaction stays open
+    until `commit`. The vector store commits right after saving its index,
+    so an unsaved index and its chunks are rolled back together if the
+    process dies; a save only writes the rows that changed.
+    """
+
+    def __init__(self, path: str, compression_level: int = 6, engine: Optional[Engine] = None):
+        # One connection is shared by the caller's threads under the vector store's lock
+        self.engine = engine or create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+        self.compression_level = compression_level
+        metadata.create_all(self.engine)
+        self._conn: Optional[Connection] = None
+
+    @property
+    def conn(self) -> Connection:
+        if self._conn is None:
+            self._conn = self.engine.connect()
+        return self._conn
+
+    def _row(self, doc_id: int, text: str, entry_metadata: Dict[str, Any]) -> Dict[str, Any]:
+        extra = {key: value for key, value in entry_metadata.items() if key not in _COLUMNS}
+        row = {key: entry_metadata.get(key) for key in _COLUMNS}
+        row['url'] = row['url'] or ''
+        row.update(
+            id=int(doc_id),
+            text=zlib.compress(text.encode('utf-8'), self.compression_level),
+            extra=json.dumps(extra, ensure_ascii=False) if extra else None,
+        )
+        return row
+
+    @staticmethod
+    def _entry(row) -> ChunkEntry:
+        entry_metadata = {'url': row.url, 'title': row.title, 'chunk': row.chunk, 'start_index': row.start_index}
+        if row.crawl_id is not None:
+            entry_metadata['crawl_id'] = row.crawl_id
+        if row.extra:
+            entry_metadata.update(json.loads(row.extra))
+        return zlib.decompress(row.text).decode('utf-8'), entry_metadata
+
+    def put(self, ids: Sequence[int], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        """Store chunks, replacing any existing ones with the same ids"""
+        rows = [self._row(doc_id, text, entry_metadata) for doc_id, text, entry_metadata in zip(ids, texts, metadatas)]
+        if rows:
+            self.conn.execute(chunks_table.insert().prefix_with('OR REPLACE'), rows)
+
+    def get_many(self, ids: Iterable[int]) -> Dict[int, ChunkEntry]:
+        """Return (text, metadata) of the given chunks; missing ids are left out"""
+        ids = list(dict.fromkeys(int(doc_id) for doc_id in ids))
+        found = {}
+        for start in range(0, len(ids), _BATCH):
+            rows = self.conn.execute(select(chunks_table).where(chunks_table.c.id.in_(ids[start:start + _BATCH])))
+            found.update((row.id, self._entry(row)) for row in rows)
+        return found
+
+    def for_url(self, url: str) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Every chunk of a page as (id, text, metadata), in page order"""
+        rows = self.conn.execute(
+            select(chunks_table).where(chunks_table.c.url == url).order_by(chunks_table.c.chunk)
+        )
+        return [(row.id, *self._entry(row)) for row in rows]
+
+    def ids_for_urls(self, urls: Iterable[str]) -> List[int]:
+        urls = list(urls)
+        ids = []
+        for start in range(0, len(urls), _BATCH):
+            rows = self.conn.execute(select(chunks_table.c.id).where(chunks_table.c.url.in_(urls[start:start + _BATCH])))
+            ids.extend(row.id for row in rows)
+        return ids
+
+    def has_url(self, url: str) -> bool:
+        return self.conn.execute(select(chunks_table.c.id).where(chunks_table.c.url == url).limit(1)).first() is not None
+
+    def delete(self, ids: Iterable[int]):
+        ids = [int(doc_id) for doc_id in ids]
+        for start in range(0, len(ids), _BATCH):
+            self.conn.execute(delete(chunks_table).where(chunks_table.c.id.in_(ids[start:start + _BATCH])))
+
+    def iter_texts(self, batch_size: int = 1000) -> Iterator[Tuple[List[int], List[str]]]:
+        """Yield (ids, texts) batches of every chunk in id order"""
+        last_id = None
+        while True:
+            statement = select(chunks_table.c.id, chunks_table.c.text).order_by(chunks_table.c.id).limit(batch_size)
+            if last_id is not None:
+                statement = statement.where(chunks_table.c.id > last_id)
+            rows = self.conn.execute(statement).all()
+            if not rows:
+                return
+            yield [row.id for row in rows], [zlib.decompress(row.text).decode('utf-8') for row in rows]
+            last_id = rows[-1].id
+
+    def __len__(self) -> int:
+        return self.conn.execute(select(func.count()).select_from(chunks_table)).scalar() or 0
+
+    def clear(self):
+        self.conn.execute(delete(chunks_table))
+
+    def commit(self):
+        """Make every change since the last commit durable"""
+        if self._conn is not None and self._conn.in_transaction():
+            self._conn.commit()
+
+    def close(self):
+        """Close the connection, dropping uncommitted changes"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
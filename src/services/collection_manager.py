@@ -0,0 +1,298 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+import logging
+import os
+import re
+import shutil
+import threading
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.services.faiss_index import FaissIndex, IndexConfig
+from src.services.lexical_index import reciprocal_rank_fusion
+from src.services.vector_store_service import LEGACY_DOCSTORE_FILE, VectorStoreService
+
+logger = logging.getLogger(__name__)
+
+# Served from the pre-collections `vector_store` directory
+DEFAULT_COLLECTION = 'default'
+
+_NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9._-]{0,63}$')
+
+
+def collection_name(url: str) -> str:
+    """Default collection of a crawl: the start URL's host, without www."""
+    host = (urlparse(url).hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    name = re.sub(r'[^a-z0-9._-]+', '-', host).strip('.-')[:64]
+    return name or DEFAULT_COLLECTION
+
+
+class CollectionManager:
+    """Named vector stores, one per site or crawl, served from one process.
+
+    Each collection has its own index directory under `root_dir`, next to
+    its chunk and BM25 databases. A collection is loaded on first use and
+    the least recently used ones are dropped from memory once the loaded
+    collections are estimated to exceed `memory_budget_mb`; they are
+    reloaded from disk when next used. Collections are saved as they are
+    written, so eviction loses nothing.
+
+    Writers must hold a collection through `use()`, which pins it in
+    memory: an evicted service that is still being written would race a
+    freshly loaded copy of the same directory.
+    """
+
+    def __init__(
+        self,
+        root_dir: str = 'collections',
+        memory_budget_mb: int = 1024,
+        embeddings: Optional[Embeddings] = None,
+        index_config: Optional[IndexConfig] = None,
+        retrieval_mode: str = 'hybrid',
+        default_store_dir: str = 'vector_store'
+    ):
+        self.root_dir = root_dir
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self._embeddings = embeddings
+        self.index_config = index_config
+        self.retrieval_mode = retrieval_mode
+        self.default_store_dir = default_store_dir
+        self.loaded: 'OrderedDict[str, VectorStoreService]' = OrderedDict()
+        self.memory: Dict[str, int] = {}  # Estimated bytes per loaded collection
+        self.measured_versions: Dict[str, int] = {}  # Store version when `memory` was estimated
+        self.pins: Dict[str, int] = {}
+        # Bumped on every load, so a reloaded collection never reuses a cache version
+        self.generations: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """One embedding client shared by every collection"""
+        if self._embeddings is None:
+            from langchain_openai import OpenAIEmbeddings
+            
+            self._embeddings = CachedEmbeddings(OpenAIEmbeddings(), EmbeddingCache())
+        return self._embeddings
+
+    @staticmethod
+    def is_valid_name(name: str) -> bool:
+        # .tmp and .old directories are left by interrupted saves
+        return bool(_NAME_PATTERN.match(name)) and not name.endswith(('.tmp', '.old'))
+
+    def validate_name(self, name: str) -> str:
+        if not self.is_valid_name(name):
+            raise ValueError(f"Invalid collection name: {name!r}")
+        return name
+
+    def store_dir(self, name: str) -> str:
+        if name == DEFAULT_COLLECTION:
+            return self.default_store_dir
+        return os.path.join(self.root_dir, self.validate_name(name))
+
+    def exists(self, name: str) -> bool:
+        """True if the collection has been saved or is loaded"""
+        if name in self.loaded:
+            return True
+        store_dir = self.store_dir(name)
+        return FaissIndex.exists(store_dir) or os.path.exists(os.path.join(store_dir, LEGACY_DOCSTORE_FILE))
+
+    def list_collections(self) -> List[str]:
+        """Names of every saved or loaded collection"""
+        names = set(self.loaded)
+        if self.exists(DEFAULT_COLLECTION):
+            names.add(DEFAULT_COLLECTION)
+        if os.path.isdir(self.root_dir):
+            for entry in os.listdir(self.root_dir):
+                if self.is_valid_name(entry) and self.exists(entry):
+                    names.add(entry)
+        return sorted(names)
+
+    def get(self, name: str) -> VectorStoreService:
+        """Return a collection for reading, loading it if needed; creates it if it does not exist"""
+        with self._lock:
+            service = self.loaded.get(name)
+            if service is not None:
+                self.loaded.move_to_end(name)
+                return service
+            service = VectorStoreService(
+                store_dir=self.store_dir(name),
+                embeddings=self.embeddings,
+                index_config=self.index_config,
+                retrieval_mode=self.retrieval_mode
+            )
+            self.loaded[name] = service
+            self._measure(name, service)
+            self.generations[name] = self.generations.get(name, 0) + 1
+            logger.info(f"Loaded collection {name} ({self.memory[name] / 1024 / 1024:.1f} MB)")
+            self._enforce_budget(keep=name)
+            return service
+
+    def acquire(self, name: str) -> VectorStoreService:
+        """Load a collection and pin it in memory until `release`"""
+        with self._lock:
+            service = self.get(name)
+            self.pins[name] = self.pins.get(name, 0) + 1
+            return service
+
+    def release(self, name: str):
+        """Unpin a collection; re-estimates its size if it was written meanwhile"""
+        with self._lock:
+            self.pins[name] -= 1
+            service = self.loaded.get(name)
+            if service is not None and service.version != self.measured_versions.get(name):
+                self._measure(name, service)
+                self._enforce_budget()
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[VectorStoreService]:
+        """Hold a collection in memory while reading or writing it"""
+        service = self.acquire(name)
+        try:
+            yield service
+        finally:
+            self.release(name)
+
+    def _measure(self, name: str, service: VectorStoreService):
+        self.memory[name] = service.memory_bytes()
+        self.measured_versions[name] = service.version
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        """Evict the least recently used unpinned collections, other than `keep`, until the budget holds"""
+        total = sum(self.memory.values())
+        for name in list(self.loaded):
+            if total <= self.memory_budget:
+                break
+            if self.pins.get(name) or name == keep:
+                continue
+            total -= self.memory[name]
+            self.evict(name)
+        if total > self.memory_budget:
+            logger.warning(
+                f"Loaded collections use about {total / 1024 / 1024:.0f} MB, "
+                f"over the {self.memory_budget / 1024 / 1024:.0f} MB budget"
+            )
+
+    def evict(self, name: str) -> bool:
+        """Drop a collection from memory; it is reloaded from disk when next used"""
+        with self._lock:
+            if self.pins.get(name) or name not in self.loaded:
+                return False
+            self.loaded.pop(name).close()
+            self.memory.pop(name, None)
+            self.measured_versions.pop(name, None)
+            logger.info(f"Evicted collection {name} from memory")
+            return True
+
+    def delete(self, name: str):
+        """Remove a collection from memory and disk"""
+        with self._lock:
+            if self.pins.get(name):
+                raise ValueError(f"Collection {name} is in use")
+            service = self.loaded.pop(name, None)
+            if service is not None:
+                service.close()
+            self.memory.pop(name, None)
+            self.measured_versions.pop(name, None)
+            store_dir = self.store_dir(name)
+            shutil.rmtree(store_dir, ignore_errors=True)
+            for suffix in ('_lexical.db', '_chunks.db'):
+                if os.path.exists(store_dir + suffix):
+                    os.remove(store_dir + suffix)
+        logger.info(f"Deleted collection {name}")
+
+    def view(self, names: Sequence[str]) -> 'CollectionView':
+        """A read-only store that searches the given collections together"""
+        return CollectionView(self, names)
+
+
+class CollectionView:
+    """Searches one or several collections as if they were one store.
+
+    Offers the `embeddings`, `version`, `similarity_search` and
+    `batch_similarity_search` interface of `VectorStoreService` that
+    `RAGService` relies on. Results carry their
+    collection in `metadata['collection']`.
+    """
+
+    def __init__(self, manager: CollectionManager, names: Sequence[str]):
+        if not names:
+            raise ValueError("No collections to search")
+        self.manager = manager
+        self.names = [manager.validate_name(name) for name in names]
+        self.retrieval_mode = manager.retrieval_mode
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.manager.embeddings
+
+    @property
+    def version(self) -> int:
+        """Changes whenever any of the collections changes or is reloaded"""
+        state = []
+        for name in self.names:
+            with self.manager.use(name) as service:
+                state.append((name, self.manager.generations[name], service.version))
+        return hash(tuple(state))
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Search every collection and merge the hits into one top-k list.
+
+        Vector hits are merged by L2 distance, which is comparable across
+        collections built with the same embeddings. BM25 and hybrid scores
+        depend on each collection's statistics, so those lists are merged by
+        reciprocal rank fusion instead.
+        """
+        query_vectors = [query_vector] if query_vector is not None else None
+        return self.batch_similarity_search([query], k, mode, query_vectors)[0]
+
+    def batch_similarity_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_vectors: Optional[List[List[float]]] = None
+    ) -> List[List[Document]]:
+        """`similarity_search` for many queries, with one batched search per collection"""
+        mode = mode or self.retrieval_mode
+        if mode != 'lexical' and query_vectors is None and queries:
+            # Embed once for all collections
+            query_vectors = self.embeddings.embed_documents(queries)
+
+        rankings: List[List[List[Tuple[str, int]]]] = [[] for _ in queries]
+        scored: List[List[Tuple[float, str, int]]] = [[] for _ in queries]
+        documents: Dict[Tuple[str, int], Document] = {}
+        for name in self.names:
+            with self.manager.use(name) as service:
+                if mode != 'lexical' and service.vector_store is None:
+                    continue
+                results = service.batch_search_ids(queries, k, mode, query_vectors)
+                found = service.get_documents(doc_id for hits in results for doc_id, _ in hits)
+                for doc_id, document in found.items():
+                    documents[(name, doc_id)] = Document(
+                        page_content=document.page_content,
+                        metadata={**document.metadata, 'collection': name}
+                    )
+            for position, hits in enumerate(results):
+                rankings[position].append([(name, doc_id) for doc_id, _ in hits])
+                scored[position].extend((score, name, doc_id) for doc_id, score in hits)
+
+        merged_results = []
+        for position in range(len(queries)):
+            if mode == 'vector':
+                merged = [(name, doc_id) for _, name, doc_id in sorted(scored[position])]
+            else:
+                merged = [key for key, _ in reciprocal_rank_fusion(rankings[position])]
+            merged_results.append([documents[key] for key in merged if key in documents][:k])
+        return merged_results
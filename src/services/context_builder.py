@@ -0,0 +1,145 @@
+from typing import Dict, List, Optional, Set
+import logging
+import re
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+class ContextBuilder:
+    """Turns ranked retrieval hits into the documents placed in the prompt.
+
+    Overlapping or adjacent chunks of the same page are merged, results can
+    be diversified with maximal marginal relevance, and documents are packed
+    in order until the token budget is spent.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 3000,
+        max_documents: int = 6,
+        use_mmr: bool = True,
+        mmr_lambda: float = 0.7,
+        model_name: str = 'gpt-3.5-turbo'
+    ):
+        self.token_budget = token_budget
+        self.max_documents = max_documents
+        self.use_mmr = use_mmr
+        self.mmr_lambda = mmr_lambda
+        self.model_name = model_name
+        self._encoding = None
+
+    @property
+    def encoding(self):
+        """tiktoken encoding for the chat model, loaded on first use"""
+        if self._encoding is None:
+            import tiktoken
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model_name)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding('cl100k_base')
+        return self._encoding
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text))
+
+    def build(self, documents: List[Document]) -> List[Document]:
+        """Merge, diversify and pack ranked documents into the token budget"""
+        merged = self.merge_overlapping(documents)
+        ordered = self.mmr(merged) if self.use_mmr else merged
+        packed = self.pack(ordered)
+        logger.info(f"Context: {len(documents)} hits -> {len(merged)} merged -> {len(packed)} packed")
+        return packed
+
+    def merge_overlapping(self, documents: List[Document]) -> List[Document]:
+        """Merge chunks of the same URL whose character ranges overlap or touch.
+
+        The merged document keeps the rank of its best-ranked chunk. Chunks
+        without offsets are only deduplicated by exact text.
+        """
+        by_url: Dict[str, List[tuple]] = {}
+        results: List[tuple] = []
+        seen_texts: Set[str] = set()
+        for rank, doc in enumerate(documents):
+            if doc.page_content in seen_texts:
+                continue
+            seen_texts.add(doc.page_content)
+            start = doc.metadata.get('start_index')
+            if start is None or start < 0:
+                results.append((rank, doc))
+            else:
+                by_url.setdefault(doc.metadata.get('url', ''), []).append((start, rank, doc))
+
+        for chunks in by_url.values():
+            chunks.sort(key=lambda item: item[0])
+            start, rank, doc = chunks[0]
+            text = doc.page_content
+            metadata = dict(doc.metadata)
+            for next_start, next_rank, next_doc in chunks[1:]:
+                end = start + len(text)
+                if next_start <= end:
+                    text += next_doc.page_content[end - next_start:]
+                    rank = min(rank, next_rank)
+                else:
+                    results.append((rank, Document(page_content=text, metadata=metadata)))
+                    start, rank, text, metadata = next_start, next_rank, next_doc.page_content, dict(next_doc.metadata)
+            results.append((rank, Document(page_content=text, metadata=metadata)))
+
+        results.sort(key=lambda item: item[0])
+        return [doc for _, doc in results]
+
+    def mmr(self, documents: List[Document]) -> List[Document]:
+        """Reorder by maximal marginal relevance.
+
+        Relevance comes from the retrieval rank and redundancy from word-set
+        overlap with already selected documents, so no extra embedding calls
+        are needed.
+        """
+        if len(documents) <= 2:
+            return documents
+        words = [set(_WORD_PATTERN.findall(doc.page_content.lower())) for doc in documents]
+        count = len(documents)
+        remaining = list(range(count))
+        selected: List[int] = []
+        while remaining:
+            best: Optional[int] = None
+            best_score = float('-inf')
+            for index in remaining:
+                relevance = 1.0 - index / count
+                redundancy = max((self._jaccard(words[index], words[other]) for other in selected), default=0.0)
+                score = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+                if score > best_score:
+                    best, best_score = index, score
+            selected.append(best)
+            remaining.remove(best)
+        return [documents[index] for index in selected]
+
+    @staticmethod
+    def _jaccard(a: Set[str], b: Set[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def pack(self, documents: List[Document]) -> List[Document]:
+        """Take documents in order while they fit the token budget.
+
+        A first document larger than the whole budget is truncated rather
+        than leaving the prompt empty.
+        """
+        packed: List[Document] = []
+        used = 0
+        for doc in documents:
+            if len(packed) >= self.max_documents:
+                break
+            tokens = self.count_tokens(doc.page_content)
+            if used + tokens <= self.token_budget:
+                packed.append(doc)
+                used += tokens
+            elif not packed:
+                truncated = self.encoding.decode(self.encoding.encode(doc.page_content)[:self.token_budget])
+                packed.append(Document(page_content=truncated, metadata=doc.metadata))
+                break
+        return packed
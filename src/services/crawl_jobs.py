@@ -0,0 +1,296 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Union
+import asyncio
+import json
+import logging
+import threading
+
+from sqlalchemy import insert, select, update
+
+from src.models.database import CrawlHistory, get_async_engine
+from src.services.collection_manager import CollectionManager, collection_name
+from src.services.trace_service import TraceStore
+
+if TYPE_CHECKING:
+    from src.services.archive_replay import ArchiveReplay
+    from src.services.crawler_service import CrawlerService
+    from src.services.distributed_crawler import DistributedCrawler
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# Where a job's pages come from
+SOURCE_CRAWL = 'crawl'
+SOURCE_ARCHIVE = 'archive'  # Reindex pages from the page archive without fetching
+
+
+@dataclass
+class CrawlJob:
+    id: int
+    url: str
+    max_pages: int
+    collection: str
+    workers: int = 1
+    discover_sitemaps: bool = False
+    source: str = SOURCE_CRAWL
+
+
+class CrawlJobRunner:
+    """Runs crawl-and-index jobs on a background event loop.
+
+    Jobs are queued and picked up by `max_concurrent_jobs` consumers on a
+    daemon thread, so they outlive the Streamlit script run that submitted
+    them and never block chat users. Each job indexes into a named
+    collection, by default one per site. Job state, live progress counters and
+    final stats are written to `crawl_history` through aiosqlite; the UI
+    reads them back to show progress. Jobs left queued or running by a
+    previous process are picked up again on start, resuming their frontier.
+    """
+
+    def __init__(
+        self,
+        collections: CollectionManager,
+        max_concurrent_jobs: int = 2,
+        crawler_factory: Optional[Callable[[], 'CrawlerService']] = None,
+        trace_store: Optional[TraceStore] = None,
+        progress_interval: float = 1.0
+    ):
+        self.collections = collections
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.crawler_factory = crawler_factory  # Defaults to CrawlerService
+        self.trace_store = trace_store or TraceStore()
+        self.progress_interval = progress_interval  # Seconds between progress writes per job
+        self.table = CrawlHistory.__table__
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.engine = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.running: Dict[int, asyncio.Task] = {}
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the background loop and job consumers if they are not running yet"""
+        with self._start_lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run_loop, name='crawl-jobs', daemon=True)
+            self.thread.start()
+        self._started.wait()
+
+    def _run_loop(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._setup())
+        self._started.set()
+        self.loop.run_forever()
+
+    async def _setup(self):
+        self.engine = get_async_engine()
+        self.queue = asyncio.Queue()
+        for _ in range(self.max_concurrent_jobs):
+            asyncio.create_task(self._consume())
+        await self._recover_jobs()
+
+    def _call(self, coroutine):
+        """Run a coroutine on the job loop from another thread and wait for its result"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def submit(
+        self,
+        url: str,
+        max_pages: int = 10,
+        workers: int = 1,
+        discover_sitemaps: bool = False,
+        collection: Optional[str] = None,
+        source: str = SOURCE_CRAWL
+    ) -> int:
+        """Queue a crawl of `url` into `collection` (default: the site's host); returns the job id.
+
+        With `source='archive'`, the archived pages under `url` are
+        reindexed instead of crawled; `max_pages=0` reindexes all of them.
+        Raises ValueError if a crawl of the same URL is already queued or
+        running, since crawls of one URL share its frontier.
+        """
+        if source not in (SOURCE_CRAWL, SOURCE_ARCHIVE):
+            raise ValueError(f"Unknown job source: {source}")
+        collection = self.collections.validate_name(collection or collection_name(url))
+        job = CrawlJob(0, url, max_pages, collection, workers, discover_sitemaps, source)
+        return self._call(self._submit(job))
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a queued or running job; returns False if it was already finished"""
+        return self._call(self._cancel(job_id))
+
+    async def _submit(self, job: CrawlJob) -> int:
+        async with self.engine.begin() as conn:
+            if job.source == SOURCE_CRAWL:
+                active = (await conn.execute(
+                    select(self.table.c.id).where(
+                        self.table.c.url == job.url,
+                        self.table.c.source.is_not(SOURCE_ARCHIVE),
+                        self.table.c.job_state.in_(ACTIVE_STATES)
+                    ).limit(1)
+                )).scalar_one_or_none()
+                if active is not None:
+                    raise ValueError(f"Crawl job #{active} for {job.url} is already queued or running")
+            result = await conn.execute(insert(self.table).values(
+                url=job.url,
+                timestamp=datetime.utcnow(),
+                status=False,
+                pages_crawled=0,
+                job_state=QUEUED,
+                max_pages=job.max_pages,
+                workers=job.workers,
+                discover_sitemaps=job.discover_sitemaps,
+                collection=job.collection,
+                source=job.source
+            ))
+        job.id = result.inserted_primary_key[0]
+        await self.queue.put(job)
+        logger.info(f"Queued {job.source} job {job.id} for {job.url}")
+        return job.id
+
+    async def _cancel(self, job_id: int) -> bool:
+        task = self.running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        # Still queued: consumers skip jobs whose row is no longer queued
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(self.table)
+                .where(self.table.c.id == job_id, self.table.c.job_state == QUEUED)
+                .values(job_state=CANCELLED, finished_at=datetime.utcnow())
+            )
+        return result.rowcount > 0
+
+    async def _recover_jobs(self):
+        """Requeue jobs that were queued or running when the previous process stopped"""
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(
+                select(self.table).where(self.table.c.job_state.in_(ACTIVE_STATES)).order_by(self.table.c.id)
+            )).all()
+        for row in rows:
+            await self._update(row.id, job_state=QUEUED)
+            await self.queue.put(CrawlJob(
+                row.id,
+                row.url,
+                row.max_pages if row.max_pages is not None else 10,
+                row.collection or collection_name(row.url),
+                row.workers or 1,
+                bool(row.discover_sitemaps),
+                row.source or SOURCE_CRAWL
+            ))
+        if rows:
+            logger.info(f"Requeued {len(rows)} unfinished crawl jobs")
+
+    async def _update(self, job_id: int, **values):
+        async with self.engine.begin() as conn:
+            await conn.execute(update(self.table).where(self.table.c.id == job_id).values(**values))
+
+    async def _job_state(self, job_id: int) -> Optional[str]:
+        async with self.engine.connect() as conn:
+            return (await conn.execute(
+                select(self.table.c.job_state).where(self.table.c.id == job_id)
+            )).scalar_one_or_none()
+
+    async def _consume(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if await self._job_state(job.id) != QUEUED:
+                    continue
+                task = asyncio.create_task(self._run_job(job))
+                self.running[job.id] = task
+                # Wait without propagating the job's cancellation into this consumer
+                await asyncio.wait({task})
+            except Exception as e:
+                logger.error(f"Crawl job consumer error: {str(e)}")
+            finally:
+                self.running.pop(job.id, None)
+                self.queue.task_done()
+
+    def _make_crawler(self, job: CrawlJob) -> Union['CrawlerService', 'DistributedCrawler', 'ArchiveReplay']:
+        # Imported on first job, so starting the app does not load the crawl stack
+        from src.services.archive_replay import ArchiveReplay
+        from src.services.crawler_service import CrawlerService
+        from src.services.distributed_crawler import DistributedCrawler
+        
+        # Every job gets its own crawler: a crawler holds the state of one crawl
+        if job.source == SOURCE_ARCHIVE:
+            return ArchiveReplay()
+        if job.workers > 1:
+            crawler = DistributedCrawler(workers=job.workers)
+        else:
+            crawler = (self.crawler_factory or CrawlerService)()
+        crawler.crawl_id = job.id
+        return crawler
+
+    async def _run_job(self, job: CrawlJob):
+        from src.services.indexing_pipeline import IndexingPipeline
+        
+        await self._update(job.id, job_state=RUNNING, started_at=datetime.utcnow(), error_message=None)
+        crawler = self._make_crawler(job)
+        latest: Dict[str, int] = {}
+        # Pinned for the whole job, so the collection is not evicted mid-write
+        store = await asyncio.to_thread(self.collections.acquire, job.collection)
+        pipeline = IndexingPipeline(crawler, store, on_progress=latest.update, crawl_id=job.id)
+        flusher = asyncio.create_task(self._flush_progress(job.id, latest))
+        try:
+            stats = await pipeline.run(
+                job.url,
+                job.max_pages,
+                incremental=True,
+                is_indexed=store.has_url,
+                discover_sitemaps=job.discover_sitemaps
+            )
+            flusher.cancel()
+            await self._update(
+                job.id,
+                job_state=SUCCEEDED,
+                status=True,
+                pages_crawled=stats['pages'],
+                progress=json.dumps(stats),
+                finished_at=datetime.utcnow()
+            )
+            logger.info(f"Crawl job {job.id} finished: {stats}")
+        except asyncio.CancelledError:
+            flusher.cancel()
+            await self._update(job.id, job_state=CANCELLED, progress=json.dumps(latest), finished_at=datetime.utcnow())
+            logger.info(f"Crawl job {job.id} cancelled")
+            raise
+        except Exception as e:
+            flusher.cancel()
+            await self._update(
+                job.id,
+                job_state=FAILED,
+                error_message=str(e),
+                progress=json.dumps(latest),
+                finished_at=datetime.utcnow()
+            )
+            logger.error(f"Crawl job {job.id} failed: {str(e)}")
+        finally:
+            await asyncio.to_thread(self.collections.release, job.collection)
+            if hasattr(crawler, 'close'):
+                crawler.close()
+            if pipeline.trace is not None:
+                await asyncio.to_thread(self.trace_store.save, pipeline.trace, job.id)
+
+    async def _flush_progress(self, job_id: int, latest: Dict[str, int]):
+        """Write the job's live counters every `progress_interval` seconds"""
+        written = None
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            if latest and latest != written:
+                written = dict(latest)
+                await self._update(job_id, pages_crawled=written.get('pages', 0), progress=json.dumps(written))
@@ -1,19 +1,26 @@
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
-from typing import List, Dict, Optional, Set
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, List, Dict, Optional, Set, Union
+import importlib.util
 import logging
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlparse
+import multiprocessing
 import os
-import chardet
+import time
 from aiohttp import TCPConnector
 from rich.progress import Progress, SpinnerColumn, TextColumn
-import time
 from datetime import datetime
-import sys
-
-# Increase recursion limit
-sys.setrecursionlimit(10000)
+from src.services.host_scheduler import HostScheduler
+from src.services.html_parser import parse_html
+from src.services.near_duplicate import NearDuplicateDetector
+from src.services.page_archive import PageArchive
+from src.services.frontier_service import CrawlFrontier, FrontierBackend, DONE, FAILED
+from src.services.page_record_service import PageRecordService, PageSnapshot, content_hash
+from src.services.sitemap_service import SitemapDiscovery
+from src.services.url_canonicalizer import UrlCanonicalizer
+from src.utils.fingerprint_set import FingerprintSet
+from src.utils.metrics import Trace, registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,135 +29,261 @@ file_handler = logging.FileHandler('logs/crawler.log')
 file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
 logger.addHandler(file_handler)
 
+# Default for `archive`, so that passing None can turn archiving off
+DEFAULT_ARCHIVE = object()
+
 class CrawlerService:
-    def __init__(self):
-        self.visited_urls: Set[str] = set()
+    def __init__(
+        self,
+        scheduler: Optional[HostScheduler] = None,
+        frontier_factory: Callable[[str], FrontierBackend] = CrawlFrontier,
+        page_records: Optional[PageRecordService] = None,
+        parse_workers: Optional[int] = None,
+        canonicalizer: Optional[UrlCanonicalizer] = None,
+        archive: Union[PageArchive, None, object] = DEFAULT_ARCHIVE
+    ):
+        # URLs fetched by this crawl, as 8-byte fingerprints; the frontier keeps the exact URLs
+        self.visited_urls = FingerprintSet()
         self.session = None
-        self.rate_limit = 1  # Seconds between requests
-        self.last_request_time = 0
-        self.batch_size = 5  # Reduced batch size
+        self.frontier_factory = frontier_factory
+        self.frontier: Optional[FrontierBackend] = None
+        self.idle_poll_interval = 0.5  # Seconds between checks of a shared frontier that is briefly empty
+        self.page_records = page_records or PageRecordService()
+        # Raw responses and extracted text of fetched pages, for reindexing without a recrawl;
+        # pass None to crawl without archiving
+        self.archive: Optional[PageArchive] = PageArchive() if archive is DEFAULT_ARCHIVE else archive
+        self.crawl_id: Optional[int] = None  # Crawl history id recorded with archived pages
+        self.incremental = False
+        self.is_indexed: Callable[[str], bool] = lambda url: True
+        self.crawl_stats: Dict[str, int] = {}
+        self.removed_urls: List[str] = []
+        self.near_duplicates = NearDuplicateDetector()
+        # Every URL is canonicalized before it is queued, so each page is fetched once
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        # Extra netlocs that may be crawled besides the start URL's own
+        self.allowed_hosts: Set[str] = set()
+        # Stage timings of the current crawl
+        self.trace = Trace('crawl', '')
+        # aiohttp request hooks; the first one times DNS and connects into `trace`
+        self.trace_configs: List[aiohttp.TraceConfig] = [self.timing_trace_config()]
+        self.user_agent = 'RAGCrawler/1.0'
+        self.rate_limit = 1  # Seconds between requests to the same host
+        self.scheduler = scheduler or HostScheduler(
+            default_delay=self.rate_limit,
+            max_concurrency=10,
+            user_agent=self.user_agent
+        )
+        self.batch_size = self.scheduler.max_concurrency  # URLs in flight at once
         self.progress = None
         self.task_id = None
         self.max_content_length = 100000  # Maximum content length in characters
-        
-    def truncate_content(self, content: str) -> str:
-        """Truncate content to maximum length"""
-        if len(content) > self.max_content_length:
-            return content[:self.max_content_length]
-        return content
+        self.max_pages_limit = 10_000_000  # Upper bound on max_pages for one crawl
+        self.max_body_bytes = 1024 * 1024  # Bodies larger than this are abandoned mid-stream
+        self.read_chunk_size = 64 * 1024
+        # Keep-alive pool settings; the scheduler still spaces requests per host
+        self.connections_per_host = 4
+        self.keepalive_timeout = 30  # Seconds an idle connection is kept for reuse
+        self.dns_cache_ttl = 300  # Seconds a resolved host is cached
+        # Worker processes for HTML parsing; 0 parses inline on the event loop
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.parse_executor: Optional[Executor] = None
+
+    def get_parse_executor(self) -> Optional[Executor]:
+        """Return the parse process pool, starting it on first use"""
+        if self.parse_workers > 0 and self.parse_executor is None:
+            # spawn avoids forking the threads of the Streamlit server
+            self.parse_executor = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.parse_executor
+
+    def close(self):
+        """Shut down the parse process pool, close the archive segment and delete visited-set spill files"""
+        self.visited_urls.clear()
+        if self.archive is not None:
+            self.archive.close()
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
+            self.parse_executor = None
+
+    def timing_trace_config(self) -> aiohttp.TraceConfig:
+        """aiohttp hooks that record DNS lookups and new connections in the current trace"""
+        async def on_dns_start(session, context, params):
+            context.dns_start = time.perf_counter()
+
+        async def on_dns_end(session, context, params):
+            self.trace.record('dns', time.perf_counter() - context.dns_start)
+
+        async def on_connect_start(session, context, params):
+            context.connect_start = time.perf_counter()
+
+        async def on_connect_end(session, context, params):
+            self.trace.record('connect', time.perf_counter() - context.connect_start)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_dns_resolvehost_start.append(on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(on_dns_end)
+        trace_config.on_connection_create_start.append(on_connect_start)
+        trace_config.on_connection_create_end.append(on_connect_end)
+        return trace_config
 
     async def is_valid_url(self, url: str, base_url: str) -> bool:
-        """Check if URL is valid and belongs to the same domain"""
+        """Check if URL is valid and belongs to the same domain.
+        
+        Query strings are allowed; `url` is expected to be canonical already,
+        with fragments and tracking parameters removed.
+        """
         try:
             if not url:
                 return False
             # Parse URLs
             parsed_url = urlparse(url)
-            parsed_base = urlparse(base_url)
+            parsed_base = urlparse(self.canonicalizer.canonicalize(base_url))
             
             # Skip certain file types and patterns
             skip_extensions = {'.pdf', '.jpg', '.jpeg', '.png', '.gif', '.css', '.js'}
-            if any(url.lower().endswith(ext) for ext in skip_extensions):
+            if any(parsed_url.path.lower().endswith(ext) for ext in skip_extensions):
                 return False
                 
-            # Skip URLs with fragments or queries
-            if parsed_url.fragment or parsed_url.query:
+            # Fragments only survive in URLs that were not canonicalized
+            if parsed_url.fragment:
                 return False
                 
-            # Check if URLs belong to the same domain
-            return parsed_url.netloc == parsed_base.netloc or not parsed_url.netloc
+            # Check if URLs belong to the same domain (or an explicitly allowed host)
+            return (
+                parsed_url.netloc == parsed_base.netloc
+                or not parsed_url.netloc
+                or parsed_url.netloc in self.allowed_hosts
+            )
         except Exception as e:
             logger.error(f"Error validating URL {url}: {str(e)}")
             return False
 
-    async def respect_rate_limit(self):
-        """Ensure we don't exceed rate limit"""
-        current_time = time.time()
-        time_since_last_request = current_time - self.last_request_time
-        if time_since_last_request < self.rate_limit:
-            await asyncio.sleep(self.rate_limit - time_since_last_request)
-        self.last_request_time = time.time()
+    async def respect_rate_limit(self, url: str) -> bool:
+        """Load robots.txt for the URL's host and check that it may be fetched"""
+        await self.scheduler.load_robots(self.session, url)
+        if not self.scheduler.can_fetch(url):
+            logger.info(f"Disallowed by robots.txt: {url}")
+            return False
+        return True
+
+    @staticmethod
+    def accept_encoding() -> str:
+        """Encodings to negotiate; brotli only when a decoder is installed"""
+        if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+            return 'gzip, deflate, br'
+        return 'gzip, deflate'
+
+    async def read_body(self, response: aiohttp.ClientResponse, url: str) -> Optional[bytes]:
+        """Read the raw body of an HTML response, or None if it should be skipped.
+        
+        Oversized bodies are rejected from `Content-Length` before reading,
+        or abandoned as soon as the streamed (decompressed) size passes
+        `max_body_bytes`, instead of being downloaded in full.
+        """
+        content_type = response.headers.get('Content-Type', '').lower()
+        
+        if 'text/html' not in content_type:
+            logger.info(f"Skipping non-HTML content type ({content_type}): {url}")
+            return None
+        
+        # Content-Length is the encoded size, a lower bound of the decoded size
+        if response.content_length is not None and response.content_length > self.max_body_bytes:
+            logger.info(f"Skipping large file ({response.content_length} bytes): {url}")
+            registry.inc('crawl_aborted_bodies_total', reason='content_length')
+            return None
+        
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(self.read_chunk_size):
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                logger.info(f"Skipping large file (over {self.max_body_bytes} bytes): {url}")
+                registry.inc('crawl_aborted_bodies_total', reason='streamed')
+                return None
+            chunks.append(chunk)
+        registry.inc('crawl_body_bytes_total', size)
+        return b''.join(chunks)
 
     async def extract_text(self, response: aiohttp.ClientResponse, url: str) -> Optional[Dict[str, str]]:
         """Extract text content from response"""
+        content = await self.read_body(response, url)
+        if content is None:
+            return None
+        return await self.parse_content(content, url, response.headers.get('Content-Type', ''))
+
+    async def parse_content(self, content: bytes, url: str, content_type: str = '') -> Optional[Dict[str, str]]:
+        """Parse an HTML body into title, text and links off the event loop.
+        
+        Only the raw bytes and Content-Type go to the worker, and only
+        url/title/content/links come back.
+        """
+        executor = self.get_parse_executor()
+        if executor is None:
+            return parse_html(url, content, content_type, self.max_content_length)
         try:
-            content_type = response.headers.get('Content-Type', '').lower()
-            
-            if 'text/html' not in content_type:
-                logger.info(f"Skipping non-HTML content type ({content_type}): {url}")
-                return None
-                
-            content = await response.read()
-            if len(content) > 1024 * 1024:  # Skip files larger than 1MB
-                logger.info(f"Skipping large file: {url}")
-                return None
-                
-            encoding = chardet.detect(content)['encoding'] or 'utf-8'
-            text = content.decode(encoding, errors='replace')
-            
-            # Try lxml first, fall back to html.parser if lxml is not available
-            try:
-                soup = BeautifulSoup(text, 'lxml')
-            except:
-                soup = BeautifulSoup(text, 'html.parser')
-            
-            # Remove unwanted elements
-            for element in soup(['script', 'style', 'nav', 'footer', 'iframe']):
-                element.decompose()
-            
-            # Get text and title
-            text = ' '.join(soup.get_text(separator=' ', strip=True).split())
-            text = self.truncate_content(text)  # Truncate long content
-            title = soup.title.string if soup.title else url
-            
-            # Extract links (limited number)
-            links = []
-            for link in soup.find_all('a', href=True, limit=100):  # Limit number of links
-                href = link.get('href')
-                if href:
-                    full_url = urljoin(url, href)
-                    links.append(full_url)
-            
-            # Clear soup to free memory
-            soup.decompose()
-            
-            return {
-                'url': url,
-                'title': title[:500],  # Limit title length
-                'content': text,
-                'links': links[:100]  # Limit number of links
-            }
-            
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                executor, parse_html, url, content, content_type, self.max_content_length
+            )
         except Exception as e:
             logger.error(f"Error extracting content from {url}: {str(e)}")
             return None
-        finally:
-            # Force garbage collection
-            if 'soup' in locals():
-                del soup
-            if 'content' in locals():
-                del content
-            if 'text' in locals():
-                del text
 
     async def crawl_url(self, url: str, base_url: str) -> Optional[Dict]:
-        """Crawl a single URL"""
-        if url in self.visited_urls:
+        """Crawl a single URL.
+        
+        Pages that are unchanged since the last crawl come back with
+        `unchanged` set and no content, so callers can follow their links
+        without re-chunking or re-embedding them.
+        """
+        if not self.visited_urls.add(url):
             return None
-            
-        self.visited_urls.add(url)
-        await self.respect_rate_limit()
+        state = FAILED
         
         try:
             if not await self.is_valid_url(url, base_url):
+                state = DONE
+                return None
+            if not await self.respect_rate_limit(url):
+                state = DONE
                 return None
+            
+            previous = self.page_records.get(url)
+            if previous and not (self.incremental and self.is_indexed(url)):
+                # Without indexed content to fall back on, the page must be reprocessed
+                previous.etag = previous.last_modified = None
+                previous.body_hash = previous.content_hash = None
+            headers = previous.conditional_headers() if previous else {}
                 
-            async with self.session.get(url, timeout=30, ssl=False) as response:
-                if response.status != 200:
-                    logger.warning(f"Failed to fetch {url}: Status {response.status}")
+            async with self.scheduler.slot(url):
+                fetch_start = time.perf_counter()
+                async with self.session.get(url, timeout=30, ssl=False, headers=headers) as response:
+                    if response.status == 304 and previous:
+                        state = DONE
+                        self.crawl_stats['not_modified'] += 1
+                        result = self.unchanged_result(previous)
+                        await self.enqueue_links(result, base_url)
+                        return result
+                    if response.status in (404, 410) and previous:
+                        state = DONE
+                        self.removed_urls.append(url)
+                        await asyncio.to_thread(self.forget_page, url, response.status)
+                        logger.info(f"Page is gone: {url}")
+                        return None
+                    if response.status != 200:
+                        logger.warning(f"Failed to fetch {url}: Status {response.status}")
+                        return None
+                        
+                    content = await self.read_body(response, url)
+                    response_headers = response.headers
+                self.trace.record('fetch', time.perf_counter() - fetch_start)
+                state = DONE
+                if content is None:
                     return None
-                    
-                result = await self.extract_text(response, url)
+                result = await self.process_content(url, content, response_headers, previous)
+                await self.enqueue_links(result, base_url)
                 if result and self.progress and self.task_id:
                     self.progress.update(self.task_id, advance=1)
                 return result
@@ -159,15 +292,189 @@ class CrawlerService:
             logger.error(f"Timeout while crawling {url}")
         except Exception as e:
             logger.error(f"Error crawling {url}: {str(e)}")
+        finally:
+            if self.frontier:
+                self.frontier.mark(url, state)
         return None
 
+    async def enqueue_links(self, result: Optional[Dict], base_url: str):
+        """Queue the links of a crawled page before the page is marked done.
+        
+        Pushing here rather than after the page is yielded means the frontier
+        is never idle while a finished page's links are still pending, which
+        other workers of a partitioned crawl rely on.
+        """
+        if not result or not self.frontier:
+            return
+        skip = result.get('unchanged') or result.get('duplicate_of')
+        if not (skip or result['content'].strip()):
+            return
+        # The frontier drops URLs already seen by this crawl
+        links = [
+            self.canonicalizer.canonicalize(link)
+            for link in result.get('links', [])[:100]  # Limit number of new URLs per page
+        ]
+        new_urls = [
+            link for link in links
+            if link not in self.visited_urls and await self.is_valid_url(link, base_url)
+        ]
+        self.frontier.push(new_urls)
+
+    async def process_content(
+        self,
+        url: str,
+        content: bytes,
+        headers: Dict[str, str],
+        previous: Optional[PageSnapshot]
+    ) -> Optional[Dict]:
+        """Parse a fetched body unless it matches the last crawl, and record it"""
+        self.crawl_stats['fetched'] += 1
+        body_hash = content_hash(content)
+        if previous and previous.body_hash == body_hash:
+            self.crawl_stats['unchanged'] += 1
+            return self.unchanged_result(previous)
+        
+        result = await self.parse_content(content, url, headers.get('Content-Type', ''))
+        if result is None:
+            return None
+        for stage, seconds in result.pop('timings', {}).items():
+            self.trace.record(stage, seconds)
+        
+        text_hash = content_hash(result['content'].encode('utf-8'))
+        canonical = await self.declared_canonical(url, result)
+        if canonical:
+            # Index the page under its canonical URL only; crawl that instead
+            self.crawl_stats['canonicalized'] += 1
+            self.frontier.push([canonical])
+            if previous and self.is_indexed(url):
+                self.removed_urls.append(url)
+            await self.save_snapshot(url, headers, content, body_hash, text_hash, result, canonical)
+            logger.info(f"Canonical URL of {url} is {canonical}")
+            return {**result, 'content': '', 'duplicate_of': canonical}
+        
+        if previous and previous.content_hash == text_hash:
+            self.crawl_stats['unchanged'] += 1
+            await self.save_snapshot(url, headers, content, body_hash, text_hash, result, previous.duplicate_of)
+            return self.unchanged_result(previous)
+        
+        duplicate_of = None
+        if result.get('simhash') is not None:
+            duplicate_of = await self.near_duplicate_of(url, result['simhash'])
+        await self.save_snapshot(url, headers, content, body_hash, text_hash, result, duplicate_of)
+        if result.get('simhash') is not None and not duplicate_of:
+            self.near_duplicates.saved(result['simhash'])
+        if duplicate_of:
+            # Drop the page before it is chunked; remove it if an older copy was indexed
+            self.crawl_stats['near_duplicates'] += 1
+            if previous and self.is_indexed(url):
+                self.removed_urls.append(url)
+            logger.info(f"Near-duplicate of {duplicate_of}: {url}")
+            return {**result, 'content': '', 'duplicate_of': duplicate_of}
+        
+        self.crawl_stats['changed'] += 1
+        return result
+
+    async def near_duplicate_of(self, url: str, simhash: int) -> Optional[str]:
+        """URL of an earlier page of this crawl that `url` near-duplicates, if any"""
+        original = self.near_duplicates.check(simhash, url)
+        if original is None:
+            return None
+        duplicate_of = self.near_duplicates.pending.get(original)
+        if duplicate_of is None:
+            duplicate_of = await asyncio.to_thread(self.page_records.original_with_simhash, original)
+        if duplicate_of is None:
+            # The original has since been recrawled with other text or removed
+            self.near_duplicates.keep(simhash, url)
+        return duplicate_of
+
+    async def declared_canonical(self, url: str, result: Dict) -> Optional[str]:
+        """The page's rel=canonical URL if it names another crawlable page of the site"""
+        canonical = self.canonicalizer.resolve_canonical(url, result.get('canonical'))
+        if not canonical or canonical == self.canonicalizer.canonicalize(url) or not self.frontier:
+            return None
+        if not await self.is_valid_url(canonical, url):
+            return None
+        return canonical
+
+    async def save_snapshot(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        content: bytes,
+        body_hash: str,
+        text_hash: str,
+        result: Dict,
+        duplicate_of: Optional[str]
+    ):
+        """Record validators, hashes and fingerprint of a parsed page, and archive its response.
+
+        Compression and database commits run in a worker thread, off the event loop.
+        """
+        await asyncio.to_thread(
+            self._write_snapshot, url, headers, content, body_hash, text_hash, result, duplicate_of
+        )
+
+    def _write_snapshot(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        content: bytes,
+        body_hash: str,
+        text_hash: str,
+        result: Dict,
+        duplicate_of: Optional[str]
+    ):
+        if self.archive is not None:
+            try:
+                self.archive.append(
+                    url, 200, headers.items(), content, result['content'],
+                    title=result['title'],
+                    crawl_id=self.crawl_id,
+                    duplicate_of=duplicate_of,
+                    body_hash=body_hash
+                )
+            except Exception as e:
+                # The archive is a convenience for reindexing; a failed write must not fail the crawl
+                logger.warning(f"Could not archive {url}: {str(e)}")
+        self.page_records.save(PageSnapshot(
+            url=url,
+            etag=headers.get('ETag'),
+            last_modified=headers.get('Last-Modified'),
+            body_hash=body_hash,
+            content_hash=text_hash,
+            title=result['title'],
+            links=result['links'],
+            simhash=result.get('simhash'),
+            duplicate_of=duplicate_of
+        ))
+
+    def forget_page(self, url: str, status: int):
+        """Drop the record of a page that is gone and mark it gone in the archive"""
+        self.page_records.delete(url)
+        if self.archive is not None:
+            self.archive.mark_gone(url, status, self.crawl_id)
+
+    def unchanged_result(self, previous: PageSnapshot) -> Dict:
+        """Result for a page whose text has not changed since the last crawl"""
+        if previous.simhash is not None and not previous.duplicate_of:
+            # Indexed pages still count as originals for near-duplicate lookups
+            self.near_duplicates.add(previous.simhash)
+        return {
+            'url': previous.url,
+            'title': previous.title or previous.url,
+            'content': '',
+            'links': previous.links,
+            'unchanged': True
+        }
+
     async def process_batch(self, urls: List[str], base_url: str) -> List[Dict]:
         """Process a batch of URLs concurrently"""
         tasks = []
         for url in urls:
             if len(tasks) >= self.batch_size:
                 # Wait for some tasks to complete before adding more
-                completed, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                completed, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                tasks = list(pending)
                 for task in completed:
                     result = await task
                     if result:
@@ -183,23 +490,118 @@ class CrawlerService:
                 if result:
                     yield result
 
-    async def crawl(self, start_url: str, max_pages: int = 10) -> List[Dict]:
-        """Crawl website starting from given URL"""
-        # Limit maximum pages to prevent memory issues
-        max_pages = min(max_pages, 10000)
+    def open_frontier(self, start_url: str, resume: bool) -> FrontierBackend:
+        """Open the frontier for a crawl, resuming unfinished work if asked"""
+        frontier = self.frontier_factory(start_url)
+        pending = frontier.resume() if resume else 0
+        if pending:
+            logger.info(f"Resuming crawl of {start_url} with {pending} queued URLs")
+        else:
+            frontier.clear()
+            frontier.push([self.canonicalizer.canonicalize(start_url)])
+        return frontier
+
+    async def seed_from_sitemaps(self, start_url: str) -> int:
+        """Queue the site's sitemap URLs, most recently modified first; returns URLs added.
+        
+        Needs an open `session` and `frontier`.
+        """
+        discovery = SitemapDiscovery(self.session, self.scheduler, self.canonicalizer, self.page_records)
+        with self.trace.stage('sitemaps'):
+            entries = await discovery.discover(start_url)
+            entries = [(url, lastmod) for url, lastmod in entries if await self.is_valid_url(url, start_url)]
+            added = self.frontier.push([url for url, _ in entries], priorities=discovery.priorities(entries))
+        self.crawl_stats['sitemap_urls'] += added
+        logger.info(f"Seeded {added} new URLs from sitemaps of {start_url}")
+        return added
+
+    async def crawl(
+        self,
+        start_url: str,
+        max_pages: int = 10,
+        resume: bool = True,
+        incremental: bool = False,
+        is_indexed: Optional[Callable[[str], bool]] = None,
+        trace: Optional[Trace] = None,
+        frontier: Optional[FrontierBackend] = None,
+        discover_sitemaps: bool = False
+    ) -> List[Dict]:
+        """Crawl website starting from given URL and return all pages at once.
+        
+        Prefer `iter_crawl` for large crawls; this holds every page in memory.
+        """
+        return [
+            page async for page in self.iter_crawl(
+                start_url, max_pages, resume, incremental, is_indexed, trace, frontier, discover_sitemaps
+            )
+        ]
+
+    async def iter_crawl(
+        self,
+        start_url: str,
+        max_pages: int = 10,
+        resume: bool = True,
+        incremental: bool = False,
+        is_indexed: Optional[Callable[[str], bool]] = None,
+        trace: Optional[Trace] = None,
+        frontier: Optional[FrontierBackend] = None,
+        discover_sitemaps: bool = False
+    ) -> AsyncIterator[Dict]:
+        """Crawl website starting from given URL, yielding pages as they are parsed.
+        
+        The queue lives in the SQLite frontier, so an interrupted crawl of the
+        same start URL picks up where it stopped when `resume` is True.
+        
+        With `incremental`, pages are refetched with conditional GETs and only
+        pages whose text changed since the last crawl are yielded; the
+        caller is expected to keep the previously indexed content of the rest.
+        `is_indexed` tells the crawler which URLs the caller actually holds;
+        pages it does not hold are always reprocessed. URLs that now return
+        404/410, or that turn out to be near-duplicates of another page, are
+        collected in `removed_urls`.
+        
+        Stage timings go to `trace`; pass one in to add later stages (such as
+        indexing) to the same trace, otherwise a new one is finished here.
+        
+        `frontier` is an already opened frontier to crawl instead, such as one
+        host partition of a distributed crawl. When it is momentarily empty
+        but other workers still have URLs in flight, the crawl waits for
+        their links rather than stopping.
+        
+        With `discover_sitemaps`, the frontier is first seeded from the
+        sitemaps in the site's robots.txt (or /sitemap.xml), so pages are
+        found without following links; pages whose sitemap lastmod is newer
+        than their last fetch are crawled first.
+        """
+        max_pages = min(max_pages, self.max_pages_limit)
         
         self.visited_urls.clear()
-        results = []
-        urls_to_crawl = [start_url]
+        self.scheduler.reset()
+        self.frontier = frontier or self.open_frontier(start_url, resume)
+        self.incremental = incremental
+        self.is_indexed = is_indexed or (lambda url: True)
+        self.removed_urls = []
+        self.crawl_stats = {
+            'fetched': 0, 'not_modified': 0, 'unchanged': 0, 'changed': 0,
+            'near_duplicates': 0, 'canonicalized': 0, 'sitemap_urls': 0
+        }
+        self.near_duplicates = NearDuplicateDetector()
+        self.trace = trace or Trace('crawl', start_url)
+        pages_crawled = 0
+        pages_yielded = 0
         start_time = datetime.now()
         
         # Ensure logs directory exists
         os.makedirs('logs', exist_ok=True)
         
-        # Create aiohttp session with connection pooling and limits
+        # Keep connections alive per host and cache DNS, so a same-host crawl
+        # pays for one handshake and lookup per pooled connection, not per page
         connector = TCPConnector(
             limit=self.batch_size,
-            force_close=True,
+            limit_per_host=self.connections_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
             enable_cleanup_closed=True
         )
         timeout = aiohttp.ClientTimeout(total=30)
@@ -207,6 +609,8 @@ class CrawlerService:
         async with aiohttp.ClientSession(
             connector=connector,
             timeout=timeout,
+            headers={'User-Agent': self.user_agent, 'Accept-Encoding': self.accept_encoding()},
+            trace_configs=self.trace_configs,
             raise_for_status=False
         ) as session:
             self.session = session
@@ -220,40 +624,52 @@ class CrawlerService:
                 self.task_id = progress.add_task(f"Crawling {start_url}...", total=max_pages)
                 
                 try:
-                    while urls_to_crawl and len(results) < max_pages:
+                    if discover_sitemaps:
+                        await self.seed_from_sitemaps(start_url)
+                    
+                    while pages_crawled < max_pages:
                         # Process URLs in batches
-                        batch = urls_to_crawl[:self.batch_size]
-                        urls_to_crawl = urls_to_crawl[self.batch_size:]
+                        batch = self.frontier.pop_batch(self.batch_size)
+                        while not batch and not self.frontier.is_idle():
+                            await asyncio.sleep(self.idle_poll_interval)
+                            batch = self.frontier.pop_batch(self.batch_size)
+                        if not batch:
+                            break
                         
                         async for result in self.process_batch(batch, start_url):
-                            if result and len(result['content'].strip()) > 0:
-                                results.append({
-                                    'url': result['url'],
-                                    'title': result['title'],
-                                    'content': result['content']
-                                })
+                            skip = result and (result.get('unchanged') or result.get('duplicate_of'))
+                            if result and (skip or len(result['content'].strip()) > 0):
+                                pages_crawled += 1
                                 
-                                # Add new URLs to crawl
-                                new_urls = [
-                                    url for url in result.get('links', [])
-                                    if url not in self.visited_urls
-                                ][:100]  # Limit number of new URLs per page
-                                urls_to_crawl.extend(new_urls)
+                                if not skip:
+                                    pages_yielded += 1
+                                    yield {
+                                        'url': result['url'],
+                                        'title': result['title'],
+                                        'content': result['content']
+                                    }
                                 
-                                if len(results) >= max_pages:
+                                if pages_crawled >= max_pages:
                                     break
                                 
-                        # Log progress
-                        logger.info(f"Crawled {len(results)} pages. Queue size: {len(urls_to_crawl)}")
-                        
-                        # Clear completed URLs from memory
-                        urls_to_crawl = urls_to_crawl[-1000:]  # Keep only last 1000 URLs
+                        # Log progress; the queue size needs a full frontier scan, so it is left out
+                        logger.info(f"Crawled {pages_crawled} pages ({pages_yielded} changed)")
                         
                 except Exception as e:
                     logger.error(f"Error during crawl: {str(e)}")
                 finally:
                     end_time = datetime.now()
                     duration = end_time - start_time
-                    logger.info(f"Crawling completed. Total pages: {len(results)}. Duration: {duration}")
-                    
-        return results 
\ No newline at end of file
+                    self.trace.counters.update(self.crawl_stats)
+                    for outcome, count in self.crawl_stats.items():
+                        registry.inc('crawl_pages_total', count, outcome=outcome)
+                    if trace is None:
+                        self.trace.finish()
+                        registry.write()
+                    logger.info(
+                        f"Crawling completed. Total pages: {pages_crawled}. "
+                        f"Stats: {self.crawl_stats}. "
+                        f"Near-duplicate ratio: {self.near_duplicates.duplicate_ratio:.1%}. "
+                        f"Visited set: {len(self.visited_urls)} URLs in {self.visited_urls.memory_bytes} bytes. "
+                        f"Duration: {duration}"
+                    ) 
\ No newline at end of file
@@ -0,0 +1,320 @@
+from contextlib import suppress
+from dataclasses import dataclass
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, FrozenSet, List, Optional
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+from urllib.parse import urlparse
+
+import aiohttp
+
+from src.models.database import DATABASE_URL, create_shared_engine
+from src.services.crawler_service import CrawlerService
+from src.services.frontier_service import CrawlFrontier, FrontierBackend
+from src.services.host_scheduler import HostScheduler
+from src.services.page_archive import ARCHIVE_DIR, PageArchive
+from src.services.page_record_service import PageRecordService
+from src.services.url_canonicalizer import UrlCanonicalizer
+from src.utils.metrics import Trace, registry
+
+logger = logging.getLogger(__name__)
+
+# (crawl_key, partition, partitions) -> frontier; must be picklable for spawned workers
+FrontierFactory = Callable[[str, Optional[int], int], FrontierBackend]
+
+
+def sqlite_frontier(database_url: str, crawl_key: str, partition: Optional[int], partitions: int) -> CrawlFrontier:
+    """Frontier backed by a SQLite file shared by every worker on this machine"""
+    return CrawlFrontier(crawl_key, create_shared_engine(database_url), partitions=partitions, partition=partition)
+
+
+@dataclass
+class WorkerSpec:
+    """Everything a worker process needs to crawl its host partition"""
+    crawl_key: str
+    partition: int
+    partitions: int
+    max_pages: int
+    frontier_factory: FrontierFactory
+    database_url: str = DATABASE_URL
+    incremental: bool = False
+    # Pages with a stored record whose content the caller does not hold
+    not_indexed: FrozenSet[str] = frozenset()
+    allowed_hosts: FrozenSet[str] = frozenset()
+    default_delay: float = 1.0
+    max_concurrency: int = 10
+    parse_workers: int = 0
+    archive_dir: Optional[str] = ARCHIVE_DIR  # None crawls without archiving
+    crawl_id: Optional[int] = None
+    # The coordinator's rules, so every worker queues links in the same canonical form
+    canonicalizer: Optional[UrlCanonicalizer] = None
+
+
+def run_worker(spec: WorkerSpec, events, stop_event):
+    """Crawl one host partition and stream its pages to the coordinator (child process entry point)"""
+    engine = create_shared_engine(spec.database_url)
+    crawler = CrawlerService(
+        scheduler=HostScheduler(default_delay=spec.default_delay, max_concurrency=spec.max_concurrency),
+        page_records=PageRecordService(engine),
+        parse_workers=spec.parse_workers,
+        # Every worker appends to segments of its own
+        archive=PageArchive(spec.archive_dir, engine=engine) if spec.archive_dir else None,
+        canonicalizer=spec.canonicalizer
+    )
+    crawler.allowed_hosts = set(spec.allowed_hosts)
+    crawler.crawl_id = spec.crawl_id
+    # Passing a trace keeps iter_crawl from writing this process's metrics file
+    trace = Trace('crawl', spec.crawl_key)
+    error = None
+    try:
+        asyncio.run(_crawl_partition(crawler, spec, trace, events, stop_event))
+    except Exception as e:
+        error = str(e)
+        logger.error(f"Worker {spec.partition} failed: {error}")
+    finally:
+        crawler.close()
+        events.put({
+            'type': 'done',
+            'partition': spec.partition,
+            'stats': dict(crawler.crawl_stats),
+            'removed_urls': list(crawler.removed_urls),
+            'stages': trace.stages,
+            'error': error
+        })
+
+
+async def _crawl_partition(crawler: CrawlerService, spec: WorkerSpec, trace: Trace, events, stop_event):
+    frontier = spec.frontier_factory(spec.crawl_key, spec.partition, spec.partitions)
+
+    async def crawl():
+        async for page in crawler.iter_crawl(
+            spec.crawl_key,
+            spec.max_pages,
+            incremental=spec.incremental,
+            is_indexed=lambda url: url not in spec.not_indexed,
+            trace=trace,
+            frontier=frontier
+        ):
+            events.put({'type': 'page', 'partition': spec.partition, 'page': page, 'stats': dict(crawler.crawl_stats)})
+
+    task = asyncio.create_task(crawl())
+    while not task.done():
+        await asyncio.wait({task}, timeout=0.5)
+        if stop_event.is_set():
+            # URLs cut off mid-flight stay in flight and are requeued by the next resume
+            task.cancel()
+    with suppress(asyncio.CancelledError):
+        await task
+
+
+class DistributedCrawler:
+    """Coordinator of a crawl split across worker processes by host.
+
+    Every worker owns a hash partition of hosts, so per-host politeness still
+    holds while each worker runs its own event loop and interpreter. Workers
+    share the frontier (and with it URL dedupe) and page records through the
+    database, and stream parsed pages back here, so a single indexer
+    consumes them. Offers the `iter_crawl`, `crawl_stats` and
+    `removed_urls` interface of `CrawlerService`, so `IndexingPipeline` can
+    drive either.
+
+    `frontier_factory` selects the frontier backend; it defaults to the
+    shared SQLite file and can be swapped for a networked store to run
+    workers on several machines.
+
+    A crawl runs at most one worker per host it may visit: the start URL's
+    and `allowed_hosts`. Extra workers would own no hosts and only wait.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        database_url: str = DATABASE_URL,
+        frontier_factory: Optional[FrontierFactory] = None,
+        default_delay: float = 1.0,
+        max_concurrency: int = 10,
+        max_restarts: int = 3
+    ):
+        self.workers = workers or os.cpu_count() or 1  # Upper bound; see `partitions_for`
+        self.partitions = self.workers  # Worker processes of the current crawl
+        self.database_url = database_url
+        self.frontier_factory = frontier_factory or partial(sqlite_frontier, database_url)
+        self.default_delay = default_delay
+        self.max_concurrency = max_concurrency  # Per worker
+        self.max_restarts = max_restarts  # Per partition, for workers that die without reporting
+        self.allowed_hosts: set = set()
+        self.crawl_stats: Dict[str, int] = {}
+        self.removed_urls: List[str] = []
+        self.trace = Trace('crawl', '')
+        self.canonicalizer = UrlCanonicalizer()
+        self.archive_dir: Optional[str] = ARCHIVE_DIR  # None crawls without archiving
+        self.crawl_id: Optional[int] = None  # Crawl history id recorded with archived pages
+
+    def partitions_for(self, start_url: str) -> int:
+        """Worker processes worth starting: partitions are per host, so no more than the hosts to crawl"""
+        hosts = {urlparse(self.canonicalizer.canonicalize(start_url)).netloc} | set(self.allowed_hosts)
+        partitions = min(self.workers, len(hosts))
+        if partitions < self.workers:
+            logger.info(f"Crawl of {start_url} spans {len(hosts)} hosts; using {partitions} of {self.workers} workers")
+        return partitions
+
+    def not_indexed_urls(self, is_indexed: Optional[Callable[[str], bool]]) -> FrozenSet[str]:
+        """URLs with a page record that the caller does not hold; workers must refetch them in full"""
+        if is_indexed is None:
+            return frozenset()
+        page_records = PageRecordService(create_shared_engine(self.database_url))
+        return frozenset(url for url in page_records.urls() if not is_indexed(url))
+
+    def open_frontier(self, start_url: str, resume: bool) -> FrontierBackend:
+        """Open the whole frontier, resuming or seeding it before workers start"""
+        frontier = self.frontier_factory(start_url, None, self.partitions)
+        pending = frontier.resume() if resume else 0
+        if pending:
+            moved = frontier.repartition()
+            logger.info(f"Resuming crawl of {start_url} with {pending} queued URLs ({moved} repartitioned)")
+        else:
+            frontier.clear()
+            frontier.push([self.canonicalizer.canonicalize(start_url)])
+        return frontier
+
+    async def seed_from_sitemaps(self, frontier: FrontierBackend, start_url: str) -> int:
+        """Queue the site's sitemap URLs before the workers start; returns URLs added"""
+        seeder = CrawlerService(
+            scheduler=HostScheduler(default_delay=self.default_delay),
+            page_records=PageRecordService(create_shared_engine(self.database_url)),
+            parse_workers=0,
+            canonicalizer=self.canonicalizer,
+            archive=None  # Only fetches sitemaps
+        )
+        seeder.allowed_hosts = set(self.allowed_hosts)
+        seeder.frontier = frontier
+        seeder.trace = self.trace
+        seeder.crawl_stats = {'sitemap_urls': 0}
+        async with aiohttp.ClientSession(headers={'User-Agent': seeder.user_agent}) as session:
+            seeder.session = session
+            added = await seeder.seed_from_sitemaps(start_url)
+        self.crawl_stats['sitemap_urls'] = added
+        return added
+
+    async def crawl(self, start_url: str, max_pages: int = 10, **kwargs) -> List[Dict]:
+        """Crawl with all workers and return every page at once"""
+        return [page async for page in self.iter_crawl(start_url, max_pages, **kwargs)]
+
+    async def iter_crawl(
+        self,
+        start_url: str,
+        max_pages: int = 10,
+        resume: bool = True,
+        incremental: bool = False,
+        is_indexed: Optional[Callable[[str], bool]] = None,
+        trace: Optional[Trace] = None,
+        discover_sitemaps: bool = False
+    ) -> AsyncIterator[Dict]:
+        """Crawl with `workers` processes, yielding pages as any worker parses them.
+
+        Arguments match `CrawlerService.iter_crawl`. `max_pages` is a global
+        budget: once the workers together have crawled that many pages they
+        are told to stop, and pages already in flight are still yielded.
+        """
+        self.partitions = self.partitions_for(start_url)
+        frontier = self.open_frontier(start_url, resume)
+        self.crawl_stats = {}
+        self.removed_urls = []
+        self.trace = trace or Trace('crawl', start_url)
+        if discover_sitemaps:
+            await self.seed_from_sitemaps(frontier, start_url)
+        not_indexed = self.not_indexed_urls(is_indexed) if incremental else frozenset()
+
+        context = multiprocessing.get_context('spawn')
+        events = context.Queue(maxsize=1024)
+        stop_event = context.Event()
+        specs = {
+            partition: WorkerSpec(
+                crawl_key=start_url,
+                partition=partition,
+                partitions=self.partitions,
+                max_pages=max_pages,
+                frontier_factory=self.frontier_factory,
+                database_url=self.database_url,
+                incremental=incremental,
+                not_indexed=not_indexed,
+                allowed_hosts=frozenset(self.allowed_hosts),
+                default_delay=self.default_delay,
+                max_concurrency=self.max_concurrency,
+                archive_dir=self.archive_dir,
+                crawl_id=self.crawl_id,
+                canonicalizer=self.canonicalizer
+            )
+            for partition in range(self.partitions)
+        }
+        processes: Dict[int, multiprocessing.process.BaseProcess] = {}
+        restarts = {partition: 0 for partition in specs}
+
+        def start(partition: int):
+            process = context.Process(target=run_worker, args=(specs[partition], events, stop_event), daemon=True)
+            process.start()
+            processes[partition] = process
+
+        for partition in specs:
+            start(partition)
+        logger.info(f"Started {self.partitions} crawl workers for {start_url}")
+
+        finished = set()
+        worker_stats: Dict[int, Dict[str, int]] = {}
+        try:
+            while len(finished) < len(specs):
+                try:
+                    event = await asyncio.to_thread(events.get, True, 0.5)
+                except queue.Empty:
+                    self._recover_dead_workers(start_url, processes, finished, restarts, start)
+                    continue
+
+                partition = event['partition']
+                if event['type'] == 'page':
+                    worker_stats[partition] = event['stats']
+                    crawled = sum(stats.get('fetched', 0) + stats.get('not_modified', 0) for stats in worker_stats.values())
+                    if crawled >= max_pages:
+                        stop_event.set()
+                    yield event['page']
+                elif event['type'] == 'done':
+                    finished.add(partition)
+                    for key, value in event['stats'].items():
+                        self.crawl_stats[key] = self.crawl_stats.get(key, 0) + value
+                    self.removed_urls.extend(event['removed_urls'])
+                    self.trace.merge(event['stages'])
+                    if event['error']:
+                        logger.error(f"Crawl worker {partition} stopped with an error: {event['error']}")
+        finally:
+            stop_event.set()
+            # Joined in threads, so other jobs on this event loop keep running meanwhile
+            await asyncio.gather(*(asyncio.to_thread(process.join, 10) for process in processes.values()))
+            for process in processes.values():
+                if process.is_alive():
+                    process.terminate()
+            self.trace.counters.update(self.crawl_stats)
+            for outcome, count in self.crawl_stats.items():
+                registry.inc('crawl_pages_total', count, outcome=outcome)
+            if trace is None:
+                self.trace.finish()
+                registry.write()
+            logger.info(f"Distributed crawl of {start_url} completed. Stats: {self.crawl_stats}")
+
+    def _recover_dead_workers(self, start_url, processes, finished, restarts, start):
+        """Requeue the in-flight URLs of workers that died without reporting, and restart them"""
+        for partition, process in processes.items():
+            if partition in finished or process.is_alive() or process.exitcode is None:
+                continue
+            # A worker that exited normally has its 'done' event in the queue
+            if process.exitcode == 0:
+                continue
+            self.frontier_factory(start_url, partition, self.partitions).resume()
+            if restarts[partition] < self.max_restarts:
+                restarts[partition] += 1
+                logger.warning(f"Crawl worker {partition} died (exit code {process.exitcode}); restarting")
+                start(partition)
+            else:
+                logger.error(f"Crawl worker {partition} died {restarts[partition] + 1} times; giving up on it")
+                finished.add(partition)
@@ -0,0 +1,160 @@
+from typing import Dict, List, Optional, Sequence
+import hashlib
+import logging
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import (
+    Column, Float, LargeBinary, MetaData, String, Table, create_engine, delete, func, literal_column, select,
+    update
+)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+embedding_table = Table(
+    'embeddings',
+    metadata,
+    Column('model', String, primary_key=True),
+    Column('text_hash', String, primary_key=True),
+    Column('vector', LargeBinary, nullable=False),  # float32 bytes
+    Column('last_used', Float, nullable=False, index=True),
+)
+
+# SQLite caps the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    """Return the cache key for a chunk of text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model, hash of text).
+
+    Vectors are stored as float32 blobs in SQLite. When the cache grows past
+    `max_entries`, the least recently used tenth is evicted.
+    """
+
+    def __init__(self, path: str = 'embedding_cache.db', max_entries: int = 1_000_000, engine: Optional[Engine] = None):
+        self.engine = engine or create_engine(f'sqlite:///{path}')
+        self.max_entries = max_entries
+        metadata.create_all(self.engine)
+        with self.engine.connect() as conn:
+            self.size = conn.execute(select(func.count()).select_from(embedding_table)).scalar() or 0
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given hashes, refreshing their LRU stamp"""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self.engine.begin() as conn:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                rows = conn.execute(
+                    select(embedding_table.c.text_hash, embedding_table.c.vector)
+                    .where(embedding_table.c.model == model, embedding_table.c.text_hash.in_(batch))
+                ).all()
+                for row in rows:
+                    found[row.text_hash] = np.frombuffer(row.vector, dtype=np.float32).tolist()
+                if rows:
+                    conn.execute(
+                        update(embedding_table)
+                        .where(
+                            embedding_table.c.model == model,
+                            embedding_table.c.text_hash.in_([row.text_hash for row in rows])
+                        )
+                        .values(last_used=time.time())
+                    )
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, Sequence[float]]):
+        """Store vectors by text hash, evicting old entries if over capacity"""
+        if not vectors:
+            return
+        now = time.time()
+        rows = [
+            {
+                'model': model,
+                'text_hash': key,
+                'vector': np.asarray(vector, dtype=np.float32).tobytes(),
+                'last_used': now,
+            }
+            for key, vector in vectors.items()
+        ]
+        statement = insert(embedding_table).on_conflict_do_nothing(index_elements=['model', 'text_hash'])
+        with self.engine.begin() as conn:
+            result = conn.execute(statement, rows)
+        self.size += max(result.rowcount, 0)
+        if self.size > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries down to 90% of capacity"""
+        target = int(self.max_entries * 0.9)
+        with self.engine.begin() as conn:
+            size = conn.execute(select(func.count()).select_from(embedding_table)).scalar() or 0
+            excess = size - target
+            if excess > 0:
+                # A batch is stored with one stamp, so a cutoff on last_used alone could drop far more
+                rowid = literal_column('rowid')
+                oldest = (
+                    select(rowid)
+                    .select_from(embedding_table)
+                    .order_by(embedding_table.c.last_used, rowid)
+                    .limit(excess)
+                )
+                result = conn.execute(delete(embedding_table).where(rowid.in_(oldest)))
+                size -= max(result.rowcount, 0)
+                logger.info(f"Evicted {result.rowcount} cached embeddings")
+        self.size = size
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from the cache to the API"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model_name: Optional[str] = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model_name = model_name or self._model_name(embeddings)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _model_name(embeddings: Embeddings) -> str:
+        name = getattr(embeddings, 'model', None) or type(embeddings).__name__
+        dimensions = getattr(embeddings, 'dimensions', None)
+        return f"{name}:{dimensions}" if dimensions else name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        cached = self.cache.get_many(self.model_name, hashes)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, fresh)
+            cached.update(fresh)
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_hash(text)
+        cached = self.cache.get_many(self.model_name, [key])
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model_name, {key: vector})
+        return vector
@@ -0,0 +1,302 @@
+from typing import List, Literal, Optional, Tuple
+import json
+import logging
+import os
+
+import faiss
+import numpy as np
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.faiss'
+CONFIG_FILE = 'index_config.json'
+TOMBSTONES_FILE = 'tombstones.npy'
+
+
+class IndexConfig(BaseModel):
+    """Index type and parameters for a vector store"""
+    index_type: Literal['flat', 'ivf_flat', 'hnsw', 'ivf_pq'] = 'flat'
+    nlist: int = Field(1024, ge=1, description="IVF: number of inverted lists")
+    nprobe: int = Field(16, ge=1, description="IVF: lists visited per query")
+    hnsw_m: int = Field(32, ge=4, description="HNSW: neighbours per node")
+    ef_construction: int = Field(200, ge=8, description="HNSW: build-time search depth")
+    ef_search: int = Field(64, ge=8, description="HNSW: query-time search depth")
+    max_tombstone_ratio: float = Field(
+        0.1, gt=0, le=1, description="HNSW: fraction of removed vectors kept in the graph before it is rebuilt"
+    )
+    pq_m: int = Field(16, ge=1, description="PQ: sub-quantizers; code size is pq_m * pq_nbits / 8 bytes")
+    pq_nbits: int = Field(8, ge=4, le=16, description="PQ: bits per sub-quantizer code")
+    train_size: int = Field(100_000, ge=1, description="Maximum vectors sampled for training")
+    mmap_threshold_mb: int = Field(64, ge=0, description="Indexes larger than this load memory-mapped")
+
+    @property
+    def needs_training(self) -> bool:
+        return self.index_type in ('ivf_flat', 'ivf_pq')
+
+    @property
+    def min_train_vectors(self) -> int:
+        """Vectors needed before training gives usable centroids"""
+        minimum = 39 * self.nlist
+        if self.index_type == 'ivf_pq':
+            minimum = max(minimum, 39 * 2 ** self.pq_nbits)
+        return minimum
+
+
+class FaissIndex:
+    """A faiss index addressed by caller-chosen int64 ids.
+
+    IVF indexes are trained automatically: vectors are kept in a flat
+    staging index until there are enough of them, then a sample is used to
+    train the configured index and everything is moved across.
+
+    HNSW graphs cannot drop nodes, so removed vectors are tombstoned by
+    their position in the graph and skipped at search time; the graph is
+    rebuilt once tombstones pass `max_tombstone_ratio` of it. A removed id
+    can be added again, since tombstones refer to positions, not ids.
+    """
+
+    def __init__(self, dim: int, config: Optional[IndexConfig] = None, index: Optional[faiss.Index] = None):
+        self.dim = dim
+        self.config = config or IndexConfig()
+        self.mmapped = False
+        self.path: Optional[str] = None
+        self.tombstones = np.empty(0, dtype=np.int64)  # HNSW: sorted graph positions of removed vectors
+        self._id_map: Optional[np.ndarray] = None  # HNSW: id at every graph position, built on demand
+        self._selector = None
+        if index is None:
+            index = self._new_staging_index() if self.config.needs_training else self._new_index()
+        self.index = index
+        self.apply_search_params()
+
+    @property
+    def ntotal(self) -> int:
+        """Number of searchable vectors"""
+        return self.index.ntotal - len(self.tombstones)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Estimated RAM held by the index.
+
+        Only the inverted lists of a memory-mapped IVF index are left to the
+        OS page cache; its coarse quantizer and PQ codebooks are resident.
+        """
+        config = self.config
+        trained = config.needs_training and not self.is_staging
+        resident = config.nlist * self.dim * 4 if trained else 0  # Centroids
+        if trained and config.index_type == 'ivf_pq':
+            resident += 2 ** config.pq_nbits * self.dim * 4  # Codebooks
+        if self.mmapped:
+            return resident
+        if config.index_type == 'ivf_pq' and trained:
+            per_vector = config.pq_m * config.pq_nbits // 8
+        else:
+            per_vector = self.dim * 4
+        if config.index_type == 'hnsw':
+            per_vector += config.hnsw_m * 2 * 4  # Graph links
+        # Tombstoned vectors stay in memory until the graph is rebuilt
+        return self.index.ntotal * (per_vector + 8) + resident
+
+    @property
+    def is_staging(self) -> bool:
+        """True while an IVF index is still collecting vectors to train on"""
+        return self.config.needs_training and not isinstance(self.index, faiss.IndexIVF)
+
+    def _new_staging_index(self) -> faiss.Index:
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+
+    def _new_index(self) -> faiss.Index:
+        config = self.config
+        if config.index_type == 'flat':
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+        if config.index_type == 'hnsw':
+            hnsw = faiss.IndexHNSWFlat(self.dim, config.hnsw_m)
+            hnsw.hnsw.efConstruction = config.ef_construction
+            return faiss.IndexIDMap2(hnsw)
+        # IVF indexes take ids natively; wrapping them in an IDMap would break removal
+        if config.index_type == 'ivf_flat':
+            return faiss.index_factory(self.dim, f"IVF{config.nlist},Flat")
+        return faiss.index_factory(self.dim, f"IVF{config.nlist},PQ{config.pq_m}x{config.pq_nbits}")
+
+    def apply_search_params(self):
+        """Set nprobe / efSearch from the config"""
+        if isinstance(self.index, faiss.IndexIVF):
+            self.index.nprobe = self.config.nprobe
+        elif self.config.index_type == 'hnsw':
+            inner = faiss.downcast_index(self.index.index)
+            inner.hnsw.efSearch = self.config.ef_search
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Change query-time parameters without rebuilding"""
+        update = {}
+        if nprobe is not None:
+            update['nprobe'] = nprobe
+        if ef_search is not None:
+            update['ef_search'] = ef_search
+        self.config = self.config.model_copy(update=update)
+        self.apply_search_params()
+
+    def _ensure_writable(self):
+        """Reload a memory-mapped index into RAM before modifying it"""
+        if self.mmapped and self.path:
+            self.index = faiss.read_index(self.path)
+            self.mmapped = False
+            self.apply_search_params()
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        """Add vectors under the given ids"""
+        if len(ids) == 0:
+            return
+        self._ensure_writable()
+        self.index.add_with_ids(self._as_vectors(vectors), np.asarray(ids, dtype=np.int64))
+        self._id_map = None
+        if self.is_staging and self.index.ntotal >= self.config.min_train_vectors:
+            self.train()
+
+    def train(self):
+        """Train the configured IVF index on a sample of the staged vectors and move them over"""
+        ids, vectors = self.reconstruct_all()
+        if len(ids) == 0:
+            return
+        rng = np.random.default_rng(0)
+        sample_size = min(len(vectors), self.config.train_size)
+        sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+
+        index = self._new_index()
+        logger.info(f"Training {self.config.index_type} index on {sample_size} of {len(ids)} vectors")
+        index.train(sample)
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        self.apply_search_params()
+
+    def remove(self, ids: np.ndarray) -> int:
+        """Remove vectors by id; returns the number removed"""
+        if len(ids) == 0 or self.index.ntotal == 0:
+            return 0
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.config.index_type == 'hnsw':
+            return self._tombstone(ids)
+        self._ensure_writable()
+        return int(self.index.remove_ids(faiss.IDSelectorBatch(ids)))
+
+    def _positions(self) -> np.ndarray:
+        """The id stored at every position of an HNSW graph"""
+        if self._id_map is None:
+            self._id_map = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        return self._id_map
+
+    def _tombstone(self, ids: np.ndarray) -> int:
+        """Hide the live vectors of the given ids from searches; rebuilds once too many are hidden"""
+        positions = np.flatnonzero(np.isin(self._positions(), ids))
+        positions = np.setdiff1d(positions, self.tombstones, assume_unique=True)
+        if len(positions) == 0:
+            return 0
+        self.tombstones = np.union1d(self.tombstones, positions)
+        self._selector = None
+        if len(self.tombstones) > self.config.max_tombstone_ratio * self.index.ntotal:
+            self.compact()
+        return len(positions)
+
+    def compact(self):
+        """Rebuild an HNSW graph without its tombstoned vectors"""
+        if len(self.tombstones) == 0:
+            return
+        self._ensure_writable()
+        ids, vectors = self.reconstruct_all()
+        logger.info(f"Rebuilding HNSW graph without {len(self.tombstones)} removed vectors")
+        index = self._new_index()
+        index.add_with_ids(vectors, ids)
+        self.index = index
+        self.tombstones = np.empty(0, dtype=np.int64)
+        self._id_map = None
+        self._selector = None
+        self.apply_search_params()
+
+    def reconstruct_all(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, vectors) of every live vector; IVF-PQ vectors are approximate"""
+        if isinstance(self.index, faiss.IndexIDMap2):
+            ids = faiss.vector_to_array(self.index.id_map).astype(np.int64)
+            vectors = np.asarray(self.index.index.reconstruct_n(0, self.index.ntotal), dtype=np.float32)
+            if len(self.tombstones):
+                keep = np.ones(len(ids), dtype=bool)
+                keep[self.tombstones] = False
+                ids, vectors = ids[keep], vectors[keep]
+            return ids, vectors
+        ivf = faiss.extract_index_ivf(self.index)
+        invlists = ivf.invlists
+        ids_parts: List[np.ndarray] = []
+        vector_parts: List[np.ndarray] = []
+        for list_no in range(ivf.nlist):
+            size = invlists.list_size(list_no)
+            if size == 0:
+                continue
+            list_ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+            ids_parts.append(list_ids)
+            vector_parts.append(np.vstack([ivf.reconstruct_from_offset(list_no, offset) for offset in range(size)]))
+        if not ids_parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32)
+        return np.concatenate(ids_parts).astype(np.int64), np.vstack(vector_parts).astype(np.float32)
+
+    def search(self, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (distances, ids) arrays of shape (n, k); missing hits have id -1"""
+        if len(self.tombstones):
+            return self._search_live(self._as_vectors(vectors), k)
+        return self.index.search(self._as_vectors(vectors), k)
+
+    def _search_live(self, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search an HNSW graph by position, skipping tombstoned vectors during the graph walk"""
+        if self._selector is None:
+            removed = faiss.IDSelectorBatch(self.tombstones)
+            # IDSelectorNot only points at the selector it wraps, so both are kept alive
+            self._selector = (removed, faiss.IDSelectorNot(removed))
+        params = faiss.SearchParametersHNSW(sel=self._selector[1], efSearch=self.config.ef_search)
+        # The IDMap wrapper would apply the selector to ids, which a re-added page shares with its tombstones
+        distances, positions = self.index.index.search(vectors, k, params=params)
+        ids = np.where(positions >= 0, self._positions()[positions], -1)
+        return distances, ids
+
+    def _as_vectors(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+
+    def save(self, directory: str):
+        """Write the index and its config into a directory"""
+        faiss.write_index(self.index, os.path.join(directory, INDEX_FILE))
+        if len(self.tombstones):
+            np.save(os.path.join(directory, TOMBSTONES_FILE), self.tombstones)
+        with open(os.path.join(directory, CONFIG_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'dim': self.dim, 'config': self.config.model_dump()}, f)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, CONFIG_FILE))
+
+    @classmethod
+    def load(cls, directory: str) -> 'FaissIndex':
+        """Load an index, memory-mapping its inverted lists when it is an IVF index larger than the threshold.
+
+        faiss only maps IVF inverted lists; flat and HNSW indexes are always read into RAM.
+        """
+        with open(os.path.join(directory, CONFIG_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+        config = IndexConfig(**meta['config'])
+        path = os.path.join(directory, INDEX_FILE)
+
+        mmapped = False
+        index = None
+        if config.needs_training and os.path.getsize(path) > config.mmap_threshold_mb * 1024 * 1024:
+            try:
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+                # An IVF index still in its flat staging form is read into RAM all the same
+                mmapped = isinstance(index, faiss.IndexIVF)
+            except RuntimeError as e:
+                logger.warning(f"Memory-mapped load not supported for this index, reading into RAM: {str(e)}")
+        if index is None:
+            index = faiss.read_index(path)
+
+        faiss_index = cls(meta['dim'], config, index=index)
+        faiss_index.mmapped = mmapped
+        faiss_index.path = path
+        tombstones_path = os.path.join(directory, TOMBSTONES_FILE)
+        if os.path.exists(tombstones_path):
+            faiss_index.tombstones = np.load(tombstones_path).astype(np.int64)
+        return faiss_index
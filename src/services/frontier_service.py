@@ -0,0 +1,206 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+import hashlib
+import logging
+
+from sqlalchemy import func, select, update, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+from src.models.database import FrontierEntry, get_engine
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def host_partition(url: str, partitions: int) -> int:
+    """Stable partition of a URL's host, so one worker owns all URLs of a host"""
+    if partitions <= 1:
+        return 0
+    host = urlparse(url).netloc.lower().encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(host, digest_size=8).digest(), 'big') % partitions
+
+
+class FrontierBackend(ABC):
+    """Shared crawl queue and URL dedupe state.
+
+    A frontier may be split into host partitions: `push` files every URL
+    under its host's partition, and a frontier opened for one `partition`
+    only pops and resumes that partition's URLs, while `counts` and `is_idle`
+    always cover the whole crawl. `partition=None` means every partition.
+    """
+
+    crawl_key: str
+    partitions: int = 1
+    partition: Optional[int] = None
+
+    @abstractmethod
+    def push(self, urls: Iterable[str], depth: int = 0, priorities: Optional[Dict[str, float]] = None) -> int:
+        """Queue URLs that have not been seen by this crawl; returns how many were new.
+
+        `priorities` maps URLs to a sort key; lower values pop first and
+        unlisted URLs get 0.
+        """
+
+    @abstractmethod
+    def pop_batch(self, size: int) -> List[str]:
+        """Claim up to `size` queued URLs, lowest priority first, and mark them in flight"""
+
+    @abstractmethod
+    def mark(self, url: str, state: str):
+        """Record the final state of a URL (done or failed)"""
+
+    @abstractmethod
+    def resume(self) -> int:
+        """Requeue URLs left in flight; returns the number of queued URLs"""
+
+    @abstractmethod
+    def repartition(self) -> int:
+        """Reassign queued URLs after the number of partitions changed; returns rows moved"""
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Return the number of URLs in each state, across all partitions"""
+
+    @abstractmethod
+    def clear(self):
+        """Forget every URL of this crawl"""
+
+    def is_idle(self) -> bool:
+        """True when no URL of the crawl is queued or in flight in any partition"""
+        counts = self.counts()
+        return not counts.get(QUEUED) and not counts.get(IN_FLIGHT)
+
+
+class CrawlFrontier(FrontierBackend):
+    """Disk-backed crawl queue stored in the `crawl_frontier` table.
+
+    URLs are deduplicated per crawl key by a unique constraint, and popped by
+    priority, then discovery order, through the (crawl_key, state, priority,
+    id) index, so push and pop
+    cost the same regardless of frontier size and nothing is held in memory.
+    Workers of a partitioned crawl share the table, so the unique constraint
+    is also their shared dedupe state.
+    """
+
+    def __init__(
+        self,
+        crawl_key: str,
+        engine: Optional[Engine] = None,
+        partitions: int = 1,
+        partition: Optional[int] = None
+    ):
+        self.crawl_key = crawl_key
+        self.engine = engine or get_engine()
+        self.table = FrontierEntry.__table__
+        self.partitions = partitions
+        self.partition = partition
+
+    def _scope(self):
+        """Filter for this frontier's rows: the crawl, narrowed to its partition if it has one"""
+        conditions = [self.table.c.crawl_key == self.crawl_key]
+        if self.partition is not None:
+            conditions.append(self.table.c.partition == self.partition)
+        return conditions
+
+    def push(self, urls: Iterable[str], depth: int = 0, priorities: Optional[Dict[str, float]] = None) -> int:
+        """Queue URLs that have not been seen by this crawl; returns rows inserted"""
+        now = datetime.utcnow()
+        priorities = priorities or {}
+        rows = [
+            {
+                'crawl_key': self.crawl_key,
+                'url': url,
+                'state': QUEUED,
+                'depth': depth,
+                'partition': host_partition(url, self.partitions),
+                'priority': priorities.get(url, 0.0),
+                'updated_at': now
+            }
+            for url in dict.fromkeys(urls)
+        ]
+        if not rows:
+            return 0
+        statement = insert(self.table).on_conflict_do_nothing(index_elements=['crawl_key', 'url'])
+        with self.engine.begin() as conn:
+            result = conn.execute(statement, rows)
+        return max(result.rowcount, 0)
+
+    def pop_batch(self, size: int) -> List[str]:
+        """Claim up to `size` queued URLs, lowest priority first, and mark them in flight"""
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(self.table.c.id, self.table.c.url)
+                .where(*self._scope(), self.table.c.state == QUEUED)
+                .order_by(self.table.c.priority, self.table.c.id)
+                .limit(size)
+            ).all()
+            if not rows:
+                return []
+            conn.execute(
+                update(self.table)
+                .where(self.table.c.id.in_([row.id for row in rows]))
+                .values(state=IN_FLIGHT, attempts=self.table.c.attempts + 1, updated_at=datetime.utcnow())
+            )
+        return [row.url for row in rows]
+
+    def mark(self, url: str, state: str):
+        """Record the final state of a URL (done or failed)"""
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.table)
+                .where(self.table.c.crawl_key == self.crawl_key, self.table.c.url == url)
+                .values(state=state, updated_at=datetime.utcnow())
+            )
+
+    def resume(self) -> int:
+        """Requeue URLs left in flight by an interrupted crawl.
+
+        Returns the number of URLs waiting to be crawled; zero means there is
+        nothing to resume.
+        """
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(self.table)
+                .where(*self._scope(), self.table.c.state == IN_FLIGHT)
+                .values(state=QUEUED, updated_at=datetime.utcnow())
+            )
+            return conn.execute(
+                select(func.count()).select_from(self.table).where(*self._scope(), self.table.c.state == QUEUED)
+            ).scalar_one()
+
+    def repartition(self) -> int:
+        """Reassign queued URLs to partitions for the current partition count"""
+        moved = 0
+        with self.engine.begin() as conn:
+            rows = conn.execute(
+                select(self.table.c.id, self.table.c.url, self.table.c.partition)
+                .where(self.table.c.crawl_key == self.crawl_key, self.table.c.state == QUEUED)
+            ).all()
+            for row in rows:
+                partition = host_partition(row.url, self.partitions)
+                if row.partition != partition:
+                    conn.execute(update(self.table).where(self.table.c.id == row.id).values(partition=partition))
+                    moved += 1
+        return moved
+
+    def counts(self) -> Dict[str, int]:
+        """Return the number of URLs in each state"""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(self.table.c.state, func.count())
+                .where(self.table.c.crawl_key == self.crawl_key)
+                .group_by(self.table.c.state)
+            ).all()
+        return {state: count for state, count in rows}
+
+    def clear(self):
+        """Forget every URL of this crawl"""
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.crawl_key == self.crawl_key))
@@ -0,0 +1,157 @@
+import asyncio
+import time
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket that hands out one token every `1 / rate` seconds"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate: float):
+        """Change the refill rate, e.g. after reading robots.txt"""
+        self._refill()
+        self.rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        """Wait until a token is available and consume it"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostScheduler:
+    """Per-host politeness scheduler with a global concurrency cap.
+
+    Every host gets its own token bucket, so requests to different hosts run
+    in parallel while each host sees at most one request per crawl delay.
+    The delay comes from robots.txt `Crawl-delay` when present.
+    """
+
+    def __init__(
+        self,
+        default_delay: float = 1.0,
+        max_concurrency: int = 10,
+        burst: int = 1,
+        user_agent: str = '*',
+        respect_robots: bool = True,
+        max_crawl_delay: float = 30.0,
+    ):
+        self.default_delay = default_delay
+        self.max_concurrency = max_concurrency
+        self.burst = burst
+        self.user_agent = user_agent
+        self.respect_robots = respect_robots
+        self.max_crawl_delay = max_crawl_delay
+        self.reset()
+
+    def reset(self):
+        """Drop per-loop state; call at the start of every crawl.
+
+        asyncio primitives bind to the running event loop, and the app runs
+        each crawl in a fresh loop.
+        """
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._robots: Dict[str, Optional[RobotFileParser]] = {}
+        self._robots_locks: Dict[str, asyncio.Lock] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        """Return the scheme://netloc key used to group requests"""
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc.lower()}"
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(rate=1.0 / self.get_delay(host), capacity=self.burst)
+            self._buckets[host] = bucket
+        return bucket
+
+    def get_delay(self, host: str) -> float:
+        """Return the delay in seconds between requests to a host"""
+        delay = self.default_delay
+        parser = self._robots.get(host)
+        if parser is not None:
+            crawl_delay = parser.crawl_delay(self.user_agent)
+            if crawl_delay:
+                delay = max(delay, min(float(crawl_delay), self.max_crawl_delay))
+        return max(delay, 0.001)
+
+    async def load_robots(self, session: aiohttp.ClientSession, url: str):
+        """Fetch and parse robots.txt once per host"""
+        if not self.respect_robots:
+            return
+        host = self.host_key(url)
+        if host in self._robots:
+            return
+        lock = self._robots_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            if host in self._robots:
+                return
+            self._robots[host] = await self._fetch_robots(session, host)
+            if host in self._buckets:
+                self._buckets[host].set_rate(1.0 / self.get_delay(host))
+
+    async def _fetch_robots(self, session: aiohttp.ClientSession, host: str) -> Optional[RobotFileParser]:
+        robots_url = f"{host}/robots.txt"
+        try:
+            async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=10), ssl=False) as response:
+                if response.status != 200:
+                    return None
+                text = await response.text(errors='replace')
+        except Exception as e:
+            logger.warning(f"Could not fetch {robots_url}: {str(e)}")
+            return None
+
+        parser = RobotFileParser(robots_url)
+        parser.parse(text.splitlines())
+        logger.info(f"Loaded robots.txt for {host} (Crawl-delay: {parser.crawl_delay(self.user_agent)})")
+        return parser
+
+    def get_robots(self, url: str) -> Optional[RobotFileParser]:
+        """Return the parsed robots.txt for the URL's host, if loaded"""
+        return self._robots.get(self.host_key(url))
+
+    def can_fetch(self, url: str) -> bool:
+        """Check robots.txt rules for a URL (allowed when unknown)"""
+        parser = self._robots.get(self.host_key(url))
+        if parser is None:
+            return True
+        return parser.can_fetch(self.user_agent, url)
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """Wait for the host's turn, then hold one global concurrency slot"""
+        # Wait on the host bucket first so idle waiters do not hold global slots
+        await self._get_bucket(self.host_key(url)).acquire()
+        async with self._get_semaphore():
+            yield
@@ -0,0 +1,108 @@
+from bs4 import BeautifulSoup
+from typing import Dict, List, Optional, Union
+from urllib.parse import urljoin
+import codecs
+import logging
+import sys
+import time
+
+import chardet
+
+from src.services.near_duplicate import simhash
+
+# Deeply nested pages overflow the default limit inside BeautifulSoup
+sys.setrecursionlimit(10000)
+
+logger = logging.getLogger(__name__)
+
+MAX_LINKS = 100
+MAX_TITLE_LENGTH = 500
+
+
+def charset_from_content_type(content_type: str) -> Optional[str]:
+    """Return the charset named in a Content-Type header, if it is a known codec"""
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset':
+            charset = value.strip().strip('"\'')
+            try:
+                return codecs.lookup(charset).name
+            except LookupError:
+                return None
+    return None
+
+
+def decode_body(content: bytes, content_type: str = '') -> str:
+    """Decode a body using the header charset, falling back to chardet detection"""
+    encoding = charset_from_content_type(content_type)
+    if encoding is None:
+        encoding = chardet.detect(content)['encoding'] or 'utf-8'
+    return content.decode(encoding, errors='replace')
+
+
+def parse_html(
+    url: str,
+    content: bytes,
+    content_type: str = '',
+    max_content_length: int = 100000
+) -> Optional[Dict[str, Union[str, List[str]]]]:
+    """Parse an HTML body into url, title, text, links, canonical link and a SimHash of the text.
+
+    Takes and returns only plain data so it can be sent to a process pool.
+    `timings` holds the seconds spent decoding, parsing and extracting links,
+    measured inside the worker.
+    """
+    try:
+        start = time.perf_counter()
+        text = decode_body(content, content_type)
+        decoded = time.perf_counter()
+
+        # Try lxml first, fall back to html.parser if lxml is not available
+        try:
+            soup = BeautifulSoup(text, 'lxml')
+        except Exception:
+            soup = BeautifulSoup(text, 'html.parser')
+
+        # Remove unwanted elements
+        for element in soup(['script', 'style', 'nav', 'footer', 'iframe']):
+            element.decompose()
+
+        # Get text and title
+        text = ' '.join(soup.get_text(separator=' ', strip=True).split())
+        text = text[:max_content_length]  # Truncate long content
+        title = (soup.title.string if soup.title else None) or url
+        parsed = time.perf_counter()
+
+        # The page's own <link rel="canonical">, resolved by the crawler
+        canonical = soup.find('link', rel='canonical', href=True)
+        canonical = canonical.get('href').strip() if canonical else None
+
+        # Extract links (limited number)
+        links = []
+        for link in soup.find_all('a', href=True, limit=MAX_LINKS):
+            href = link.get('href')
+            if href:
+                links.append(urljoin(url, href))
+
+        # Clear soup to free memory
+        soup.decompose()
+        linked = time.perf_counter()
+        fingerprint = simhash(text)
+
+        return {
+            'url': url,
+            'title': str(title)[:MAX_TITLE_LENGTH],
+            'content': text,
+            'links': links[:MAX_LINKS],
+            'canonical': canonical or None,
+            'simhash': fingerprint,
+            'timings': {
+                'decode': decoded - start,
+                'parse': parsed - decoded + time.perf_counter() - linked,
+                'links': linked - parsed
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Error extracting content from {url}: {str(e)}")
+        return None
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from src.services.crawler_service import CrawlerService
+from src.services.distributed_crawler import DistributedCrawler
+from src.services.vector_store_service import VectorStoreService
+from src.utils.metrics import Trace, registry
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+@dataclass
+class ChunkBatch:
+    """Chunks travelling from the split stage to the index stage"""
+    texts: List[str] = field(default_factory=list)
+    metadatas: List[Dict] = field(default_factory=list)
+    ids: List[int] = field(default_factory=list)
+    # Pages whose first chunks are in this batch; their old chunks are replaced
+    replace_urls: List[str] = field(default_factory=list)
+    vectors: List[List[float]] = field(default_factory=list)
+
+
+class IndexingPipeline:
+    """Streams a crawl into the vector store.
+
+    Stages run concurrently and are connected by bounded queues:
+    fetch/parse -> split -> batch-embed -> index add. A slow stage makes the
+    stages before it wait, so memory stays flat however many pages are
+    crawled, and embedding overlaps with crawling.
+    
+    Crawl and indexing stage timings share one `trace` per run. `on_progress`
+    is called with the running stats after every page and indexed batch.
+    """
+
+    def __init__(
+        self,
+        crawler_service: Union[CrawlerService, DistributedCrawler],
+        vector_store_service: VectorStoreService,
+        queue_size: int = 32,
+        embed_batch_size: int = 64,
+        save_every: int = 5000,
+        on_progress: Optional[Callable[[Dict[str, int]], None]] = None,
+        crawl_id: Optional[int] = None
+    ):
+        self.crawler_service = crawler_service
+        self.vector_store_service = vector_store_service
+        self.queue_size = queue_size
+        self.embed_batch_size = embed_batch_size
+        self.save_every = save_every  # Chunks between intermediate saves
+        self.stats: Dict[str, int] = {}
+        self.on_progress = on_progress
+        self.crawl_id = crawl_id  # Recorded on every chunk when set
+        self.trace: Optional[Trace] = None
+
+    async def run(self, start_url: str, max_pages: int = 10, **crawl_kwargs: Any) -> Dict[str, int]:
+        """Crawl `start_url` and index pages as they arrive; returns page and chunk counts"""
+        self.stats = {'pages': 0, 'chunks': 0, 'removed_pages': 0, 'near_duplicates': 0}
+        pages: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        batches: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        embedded: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self.trace = Trace('crawl', start_url)
+
+        try:
+            await self._run_stages(
+                self._crawl_stage(pages, start_url, max_pages, crawl_kwargs),
+                self._split_stage(pages, batches),
+                self._embed_stage(batches, embedded),
+                self._index_stage(embedded),
+            )
+        finally:
+            self.trace.counters.update(self.stats)
+            self.trace.finish()
+            registry.write()
+        logger.info(f"Indexing pipeline finished for {start_url}: {self.stats}")
+        return self.stats
+
+    async def _run_stages(self, *stages: Awaitable[None]):
+        """Run stages together; if one fails the others are cancelled.
+
+        A stage only sends `_DONE` when it finishes normally: a cancelled
+        stage must not wait on a full queue whose consumer is gone.
+        """
+        tasks = [asyncio.create_task(stage) for stage in stages]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _crawl_stage(self, pages: asyncio.Queue, start_url: str, max_pages: int, crawl_kwargs: Dict):
+        crawl = self.crawler_service.iter_crawl(start_url, max_pages, trace=self.trace, **crawl_kwargs)
+        async for page in crawl:
+            await pages.put(page)
+        self.stats['near_duplicates'] = self.crawler_service.crawl_stats.get('near_duplicates', 0)
+        await pages.put(_DONE)
+
+    async def _split_stage(self, pages: asyncio.Queue, batches: asyncio.Queue):
+        batch = ChunkBatch()
+        while (page := await pages.get()) is not _DONE:
+            with self.trace.stage('split', pipeline='index'):
+                texts, metadatas, ids = await asyncio.to_thread(self.vector_store_service.split_document, page)
+            self.stats['pages'] += 1
+            self._report_progress()
+            batch.replace_urls.append(page['url'])
+            for text, metadata, chunk_id in zip(texts, metadatas, ids):
+                if self.crawl_id is not None:
+                    metadata['crawl_id'] = self.crawl_id
+                batch.texts.append(text)
+                batch.metadatas.append(metadata)
+                batch.ids.append(chunk_id)
+                if len(batch.texts) >= self.embed_batch_size:
+                    await batches.put(batch)
+                    batch = ChunkBatch()
+        if batch.texts or batch.replace_urls:
+            await batches.put(batch)
+        await batches.put(_DONE)
+
+    async def _embed_stage(self, batches: asyncio.Queue, embedded: asyncio.Queue):
+        embeddings = self.vector_store_service.embeddings
+        while (batch := await batches.get()) is not _DONE:
+            if batch.texts:
+                with self.trace.stage('embed', pipeline='index'):
+                    batch.vectors = await asyncio.to_thread(embeddings.embed_documents, batch.texts)
+            await embedded.put(batch)
+        await embedded.put(_DONE)
+
+    async def _index_stage(self, embedded: asyncio.Queue):
+        store = self.vector_store_service
+        unsaved = 0
+        while (batch := await embedded.get()) is not _DONE:
+            with self.trace.stage('index_add', pipeline='index'):
+                await asyncio.to_thread(
+                    store.add_embedded_chunks,
+                    batch.texts, batch.vectors, batch.metadatas, batch.ids, batch.replace_urls
+                )
+            self.stats['chunks'] += len(batch.texts)
+            registry.inc('index_chunks_total', len(batch.texts))
+            self._report_progress()
+            unsaved += len(batch.texts)
+            if unsaved >= self.save_every:
+                with self.trace.stage('save', pipeline='index'):
+                    await asyncio.to_thread(store.save_vector_store)
+                unsaved = 0
+
+        removed_urls = self.crawler_service.removed_urls
+        if removed_urls:
+            with self.trace.stage('delete', pipeline='index'):
+                await asyncio.to_thread(store.delete_urls, removed_urls, False)
+            self.stats['removed_pages'] = len(removed_urls)
+        with self.trace.stage('save', pipeline='index'):
+            await asyncio.to_thread(store.save_vector_store)
+
+    def _report_progress(self):
+        if self.on_progress is not None:
+            try:
+                self.on_progress(dict(self.stats))
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {str(e)}")
@@ -0,0 +1,164 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+import math
+import re
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, delete, func, select
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+docs_table = Table(
+    'lexical_docs',
+    metadata,
+    Column('doc_id', Integer, primary_key=True, autoincrement=False),
+    Column('length', Integer, nullable=False),
+)
+
+postings_table = Table(
+    'lexical_postings',
+    metadata,
+    Column('term', String, primary_key=True),
+    Column('doc_id', Integer, primary_key=True, index=True),
+    Column('tf', Integer, nullable=False),
+)
+
+# Words, plus compound tokens such as error codes and dotted identifiers
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-.:/]\w+)*")
+_PART_PATTERN = re.compile(r"\w+")
+
+# SQLite caps the number of bound parameters per statement
+_BATCH = 500
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case tokens; compounds like `ERR-404` yield the whole token and its parts"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 inverted index stored in SQLite, keyed by vector-store chunk id.
+
+    Lookups run in-process without an embedding call. Documents can be
+    added and removed one chunk at a time as the vector store changes.
+
+    Like `ChunkStore`, every change goes through one connection whose
+    transaction stays open until `commit`, which the vector store calls
+    when it saves, so the index never holds chunks the saved store lacks.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75, engine: Optional[Engine] = None):
+        # One connection is shared by the caller's threads under the vector store's lock
+        self.engine = engine or create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+        self.k1 = k1
+        self.b = b
+        metadata.create_all(self.engine)
+        self._conn: Optional[Connection] = None
+        self._load_stats()
+
+    @property
+    def conn(self) -> Connection:
+        if self._conn is None:
+            self._conn = self.engine.connect()
+        return self._conn
+
+    def _load_stats(self):
+        row = self.conn.execute(select(func.count(), func.coalesce(func.sum(docs_table.c.length), 0))).first()
+        self.doc_count, self.total_length = int(row[0]), int(row[1])
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / self.doc_count if self.doc_count else 0.0
+
+    def add(self, ids: Sequence[int], texts: Sequence[str]):
+        """Index chunks, replacing any existing entries with the same ids"""
+        if not ids:
+            return
+        self.remove(ids)
+        doc_rows = []
+        posting_rows = []
+        for doc_id, text in zip(ids, texts):
+            terms = Counter(tokenize(text))
+            doc_rows.append({'doc_id': int(doc_id), 'length': sum(terms.values())})
+            posting_rows.extend({'term': term, 'doc_id': int(doc_id), 'tf': tf} for term, tf in terms.items())
+        self.conn.execute(docs_table.insert(), doc_rows)
+        if posting_rows:
+            self.conn.execute(postings_table.insert(), posting_rows)
+        self.doc_count += len(doc_rows)
+        self.total_length += sum(row['length'] for row in doc_rows)
+
+    def remove(self, ids: Iterable[int]):
+        """Drop chunks from the index"""
+        ids = [int(doc_id) for doc_id in ids]
+        for start in range(0, len(ids), _BATCH):
+            batch = ids[start:start + _BATCH]
+            count, length = self.conn.execute(
+                select(func.count(), func.coalesce(func.sum(docs_table.c.length), 0))
+                .where(docs_table.c.doc_id.in_(batch))
+            ).first()
+            if not count:
+                continue
+            self.conn.execute(delete(postings_table).where(postings_table.c.doc_id.in_(batch)))
+            self.conn.execute(delete(docs_table).where(docs_table.c.doc_id.in_(batch)))
+            self.doc_count -= int(count)
+            self.total_length -= int(length)
+
+    def clear(self):
+        self.conn.execute(delete(postings_table))
+        self.conn.execute(delete(docs_table))
+        self.doc_count = self.total_length = 0
+
+    def commit(self):
+        """Make every change since the last commit durable"""
+        if self._conn is not None and self._conn.in_transaction():
+            self._conn.commit()
+
+    def close(self):
+        """Close the connection, dropping uncommitted changes"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """Return (chunk id, BM25 score) pairs, best first"""
+        terms = list(dict.fromkeys(tokenize(query)))[:_BATCH]
+        if not terms or not self.doc_count:
+            return []
+        document_frequency: Dict[str, int] = dict(self.conn.execute(
+            select(postings_table.c.term, func.count())
+            .where(postings_table.c.term.in_(terms))
+            .group_by(postings_table.c.term)
+        ).all())
+        rows = self.conn.execute(
+            select(postings_table.c.term, postings_table.c.doc_id, postings_table.c.tf, docs_table.c.length)
+            .join(docs_table, docs_table.c.doc_id == postings_table.c.doc_id)
+            .where(postings_table.c.term.in_(terms))
+        ).all()
+
+        avg_length = self.avg_length or 1.0
+        scores: Dict[int, float] = {}
+        for term, doc_id, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists; each id scores the sum of 1 / (k + rank) over the lists"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,102 @@
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional
+import hashlib
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+FINGERPRINT_BITS = 64
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """64-bit SimHash of a text's word shingles; similar texts differ in few bits"""
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < shingle_size:
+        shingles = Counter([' '.join(words)])
+    else:
+        shingles = Counter(' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1))
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle, count in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class NearDuplicateDetector:
+    """LSH index of SimHash fingerprints.
+
+    Fingerprints are split into `bands` equal bit ranges. Two fingerprints
+    within `max_distance` bits of each other share at least one band exactly
+    when bands > max_distance, so only pages in a matching bucket are
+    compared.
+
+    Buckets hold only the 8-byte fingerprints; the URL of an original is
+    looked up by its fingerprint in `page_records`, except for originals not
+    saved there yet, which wait in `pending`.
+    """
+
+    def __init__(self, max_distance: int = 3, bands: int = 4):
+        if bands <= max_distance:
+            raise ValueError("bands must exceed max_distance for the LSH lookup to be exact")
+        self.max_distance = max_distance
+        self.bands = bands
+        self.band_bits = FINGERPRINT_BITS // bands
+        self.buckets: List[Dict[int, array]] = [{} for _ in range(bands)]
+        self.pending: Dict[int, str] = {}
+        self.pages = 0
+        self.duplicates = 0
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [fingerprint >> (band * self.band_bits) & mask for band in range(self.bands)]
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """Return the fingerprint of a known near-duplicate, if any"""
+        for band, key in enumerate(self._band_keys(fingerprint)):
+            for other in self.buckets[band].get(key, ()):
+                if bin(fingerprint ^ other).count('1') <= self.max_distance:
+                    return other
+        return None
+
+    def add(self, fingerprint: int, url: Optional[str] = None):
+        """Record an original; pass its URL until the page is saved, then call `saved`"""
+        for band, key in enumerate(self._band_keys(fingerprint)):
+            bucket = self.buckets[band].get(key)
+            if bucket is None:
+                bucket = self.buckets[band][key] = array('Q')
+            bucket.append(fingerprint)
+        if url is not None:
+            self.pending[fingerprint] = url
+
+    def saved(self, fingerprint: int):
+        self.pending.pop(fingerprint, None)
+
+    def check(self, fingerprint: int, url: str) -> Optional[int]:
+        """Record a page; returns the fingerprint of the original it duplicates, or None if it is new"""
+        self.pages += 1
+        original = self.find(fingerprint)
+        if original is not None:
+            self.duplicates += 1
+            return original
+        self.add(fingerprint, url)
+        return None
+
+    def keep(self, fingerprint: int, url: str):
+        """Record a page `check` matched as an original after all, when its match has no URL left"""
+        self.duplicates -= 1
+        self.add(fingerprint, url)
+
+    @property
+    def duplicate_ratio(self) -> float:
+        return self.duplicates / self.pages if self.pages else 0.0
@@ -0,0 +1,294 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from http import HTTPStatus
+from typing import BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple
+import gzip
+import logging
+import os
+import threading
+import uuid
+
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.engine import Engine
+
+from src.models.database import ArchiveRecord, get_engine
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = 'page_archive'
+SEGMENT_SUFFIX = '.warc.gz'
+
+# The archived body is the decoded one, so these no longer describe it
+_STALE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+@dataclass
+class ArchivedPage:
+    """One archived fetch of a page"""
+    url: str
+    status: int
+    title: str
+    text: str
+    body: bytes = b''
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    content_type: str = ''
+    crawl_id: Optional[int] = None
+    fetched_at: Optional[datetime] = None
+
+
+def warc_record(
+    warc_type: str,
+    record_id: str,
+    url: str,
+    date: datetime,
+    content_type: str,
+    block: bytes,
+    refers_to: Optional[str] = None
+) -> bytes:
+    """Serialize one WARC/1.1 record"""
+    lines = [
+        'WARC/1.1',
+        f'WARC-Type: {warc_type}',
+        f'WARC-Record-ID: {record_id}',
+        f'WARC-Date: {date.strftime("%Y-%m-%dT%H:%M:%SZ")}',
+        f'WARC-Target-URI: {url}',
+    ]
+    if refers_to:
+        lines.append(f'WARC-Refers-To: {refers_to}')
+    lines.extend([f'Content-Type: {content_type}', f'Content-Length: {len(block)}'])
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8') + block + b'\r\n\r\n'
+
+
+def read_warc_records(data: bytes) -> List[Tuple[Dict[str, str], bytes]]:
+    """Split uncompressed WARC data into (header fields, content block) pairs"""
+    records = []
+    position = 0
+    while position < len(data):
+        header_end = data.index(b'\r\n\r\n', position)
+        lines = data[position:header_end].decode('utf-8').split('\r\n')[1:]  # Skip the version line
+        fields = dict(line.split(': ', 1) for line in lines)
+        start = header_end + 4
+        end = start + int(fields['Content-Length'])
+        records.append((fields, data[start:end]))
+        position = end + 4
+    return records
+
+
+def http_response(status: int, headers: Iterable[Tuple[str, str]], body: bytes) -> bytes:
+    """Rebuild an HTTP/1.1 response message around a decoded body"""
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    lines = [f'HTTP/1.1 {status} {reason}']
+    lines.extend(f'{name}: {value}' for name, value in headers if name.lower() not in _STALE_HEADERS)
+    lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8', errors='replace') + body
+
+
+def parse_http_response(message: bytes) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """Split an HTTP response message into status, headers and body"""
+    head, _, body = message.partition(b'\r\n\r\n')
+    lines = head.decode('utf-8', errors='replace').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = [tuple(line.split(': ', 1)) for line in lines[1:] if ': ' in line]
+    return status, headers, body
+
+
+def under_url(column, url_prefix: str) -> ColumnElement:
+    """Condition matching the URL and the pages below it, on path boundaries.
+
+    `https://site.com/docs` matches `https://site.com/docs/intro` but not
+    `https://site.com/docs-old` or `https://site.com.evil.org/`; pass the
+    prefix in canonical form, as archived URLs are.
+    """
+    base = url_prefix.split('?', 1)[0].split('#', 1)[0]
+    if base.count('/') < 3:
+        base += '/'  # A bare origin: everything on that host
+    if base.endswith('/'):
+        return column.startswith(base, autoescape=True)
+    return or_(
+        column == base,
+        column.startswith(base + '/', autoescape=True),
+        column.startswith(base + '?', autoescape=True)
+    )
+
+
+def read_archived(path: str, offset: int, length: int) -> Tuple[int, List[Tuple[str, str]], bytes, str]:
+    """Read one archived page from a segment as (status, headers, body, extracted text).
+
+    A module-level function, so parse workers can read pages themselves.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    status, headers, body, text = 0, [], b'', ''
+    for fields, block in read_warc_records(data):
+        if fields['WARC-Type'] == 'response':
+            status, headers, body = parse_http_response(block)
+        elif fields['WARC-Type'] == 'conversion':
+            text = block.decode('utf-8')
+    return status, headers, body, text
+
+
+class PageArchive:
+    """Append-only archive of raw responses and their extracted text.
+
+    Every fetched page is appended to the current segment file as a
+    gzip-compressed WARC `response` record followed by a `conversion`
+    record holding the extracted text, each its own gzip member, so
+    segments can be read by standard WARC tools. `archive_records` in the
+    database indexes every fetch by URL and crawl, with the segment, offset
+    and length of its records, so one page is read back with one seek.
+
+    Segments are never rewritten. Each archive instance writes its own
+    segments, so several crawlers or worker processes can archive at once.
+    Pages that disappear are recorded as index rows without a segment.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, segment_size: int = 1024 * 1024 * 1024, engine: Optional[Engine] = None):
+        self.directory = directory
+        self.segment_size = segment_size  # Bytes after which a new segment is started
+        self.engine = engine or get_engine()
+        self.table = ArchiveRecord.__table__
+        self._segment: Optional[str] = None
+        self._file: Optional[BinaryIO] = None
+        self._prefix = f"{datetime.utcnow():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self._sequence = 0
+        # Appends come from the crawler's worker threads; each must own the file while it writes
+        self._lock = threading.Lock()
+
+    def path(self, segment: str) -> str:
+        return os.path.join(self.directory, segment)
+
+    def _writer(self) -> BinaryIO:
+        """The open segment, starting a new one when it is full"""
+        if self._file is not None and self._file.tell() >= self.segment_size:
+            self._close_segment()
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._sequence += 1
+            self._segment = f"{self._prefix}-{self._sequence:05d}{SEGMENT_SUFFIX}"
+            self._file = open(self.path(self._segment), 'ab')
+        return self._file
+
+    def append(
+        self,
+        url: str,
+        status: int,
+        headers: Iterable[Tuple[str, str]],
+        body: bytes,
+        text: str,
+        title: str = '',
+        crawl_id: Optional[int] = None,
+        duplicate_of: Optional[str] = None,
+        body_hash: Optional[str] = None
+    ) -> int:
+        """Archive one fetched page; returns the id of its index row"""
+        headers = list(headers)
+        fetched_at = datetime.utcnow()
+        content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+        record_id = f'<urn:uuid:{uuid.uuid4()}>'
+        response = warc_record(
+            'response', record_id, url, fetched_at,
+            'application/http; msgtype=response', http_response(status, headers, body)
+        )
+        conversion = warc_record(
+            'conversion', f'<urn:uuid:{uuid.uuid4()}>', url, fetched_at,
+            'text/plain; charset=utf-8', text.encode('utf-8'), refers_to=record_id
+        )
+        data = gzip.compress(response) + gzip.compress(conversion)
+
+        with self._lock:
+            f = self._writer()
+            segment = self._segment
+            offset = f.tell()
+            f.write(data)
+            # The index row must never point past what is in the file
+            f.flush()
+        with self.engine.begin() as conn:
+            result = conn.execute(insert(self.table).values(
+                url=url,
+                crawl_id=crawl_id,
+                fetched_at=fetched_at,
+                status=status,
+                content_type=content_type,
+                title=title,
+                body_hash=body_hash,
+                duplicate_of=duplicate_of,
+                segment=segment,
+                offset=offset,
+                length=len(data)
+            ))
+        return result.inserted_primary_key[0]
+
+    def mark_gone(self, url: str, status: int, crawl_id: Optional[int] = None):
+        """Record that a page no longer exists, so it is left out of `latest`"""
+        with self.engine.begin() as conn:
+            conn.execute(insert(self.table).values(
+                url=url, crawl_id=crawl_id, fetched_at=datetime.utcnow(), status=status
+            ))
+
+    def _newest(self, url_prefix: str, crawl_ids: Optional[Sequence[int]]):
+        """Subquery of the id of every page's newest index row"""
+        newest = select(func.max(self.table.c.id).label('id')).group_by(self.table.c.url)
+        if url_prefix:
+            newest = newest.where(under_url(self.table.c.url, url_prefix))
+        if crawl_ids is not None:
+            newest = newest.where(self.table.c.crawl_id.in_(list(crawl_ids)))
+        return newest.subquery()
+
+    def latest(self, url_prefix: str = '', crawl_ids: Optional[Sequence[int]] = None, limit: Optional[int] = None) -> List:
+        """Index rows of the newest archived fetch of every live, non-duplicate page.
+
+        `url_prefix` and `crawl_ids` narrow the pages considered. Rows come
+        in segment order, so reading them back is mostly sequential.
+        """
+        newest = self._newest(url_prefix, crawl_ids)
+        statement = (
+            select(self.table)
+            .join(newest, newest.c.id == self.table.c.id)
+            .where(self.table.c.segment.is_not(None), self.table.c.duplicate_of.is_(None))
+            .order_by(self.table.c.segment, self.table.c.offset)
+            .limit(limit)
+        )
+        with self.engine.connect() as conn:
+            return conn.execute(statement).all()
+
+    def removed(self, url_prefix: str = '', crawl_ids: Optional[Sequence[int]] = None) -> List[str]:
+        """URLs whose newest index row says the page is gone or a near-duplicate of another"""
+        newest = self._newest(url_prefix, crawl_ids)
+        statement = (
+            select(self.table.c.url)
+            .join(newest, newest.c.id == self.table.c.id)
+            .where(or_(self.table.c.segment.is_(None), self.table.c.duplicate_of.is_not(None)))
+        )
+        with self.engine.connect() as conn:
+            return list(conn.execute(statement).scalars())
+
+    def read(self, row) -> ArchivedPage:
+        """Read the page an index row points to"""
+        status, headers, body, text = read_archived(self.path(row.segment), row.offset, row.length)
+        return ArchivedPage(
+            url=row.url,
+            status=status,
+            title=row.title or row.url,
+            text=text,
+            body=body,
+            headers=headers,
+            content_type=row.content_type or '',
+            crawl_id=row.crawl_id,
+            fetched_at=row.fetched_at
+        )
+
+    def close(self):
+        """Close the current segment; the next write starts a new one"""
+        with self._lock:
+            self._close_segment()
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._segment = None
@@ -0,0 +1,121 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+import hashlib
+import json
+import logging
+
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.engine import Engine
+
+from src.models.database import PageRecord, get_engine
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    """Return the hex digest used to compare page bodies and extracted text"""
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class PageSnapshot:
+    """What we remember about a page between crawls"""
+    url: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    body_hash: Optional[str] = None
+    content_hash: Optional[str] = None
+    title: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+    simhash: Optional[int] = None
+    duplicate_of: Optional[str] = None
+
+    def conditional_headers(self) -> dict:
+        """Headers that turn a refetch into a conditional GET"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageRecordService:
+    """Reads and writes `page_records`, the per-URL state used by incremental recrawls"""
+
+    def __init__(self, engine: Optional[Engine] = None):
+        self.engine = engine or get_engine()
+        self.table = PageRecord.__table__
+
+    def get(self, url: str) -> Optional[PageSnapshot]:
+        with self.engine.connect() as conn:
+            row = conn.execute(select(self.table).where(self.table.c.url == url)).first()
+        if row is None:
+            return None
+        return PageSnapshot(
+            url=row.url,
+            etag=row.etag,
+            last_modified=row.last_modified,
+            body_hash=row.body_hash,
+            content_hash=row.content_hash,
+            title=row.title,
+            links=json.loads(row.links) if row.links else [],
+            simhash=int(row.simhash, 16) if row.simhash else None,
+            duplicate_of=row.duplicate_of,
+        )
+
+    def save(self, snapshot: PageSnapshot):
+        values = {
+            'url': snapshot.url,
+            'etag': snapshot.etag,
+            'last_modified': snapshot.last_modified,
+            'body_hash': snapshot.body_hash,
+            'content_hash': snapshot.content_hash,
+            'title': snapshot.title,
+            'links': json.dumps(snapshot.links),
+            # Stored as hex: SQLite integers are signed 64-bit
+            'simhash': f"{snapshot.simhash:016x}" if snapshot.simhash is not None else None,
+            'duplicate_of': snapshot.duplicate_of,
+            'fetched_at': datetime.utcnow(),
+        }
+        statement = insert(self.table).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=['url'],
+            set_={key: value for key, value in values.items() if key != 'url'}
+        )
+        with self.engine.begin() as conn:
+            conn.execute(statement)
+
+    def urls(self) -> Iterator[str]:
+        """Yield every URL with a stored record"""
+        with self.engine.connect() as conn:
+            for row in conn.execute(select(self.table.c.url)):
+                yield row.url
+
+    def fetched_times(self, urls: Iterable[str], batch_size: int = 500) -> Dict[str, datetime]:
+        """Return when each of `urls` was last fetched; URLs without a record are left out"""
+        urls = list(urls)
+        times = {}
+        with self.engine.connect() as conn:
+            for start in range(0, len(urls), batch_size):
+                rows = conn.execute(
+                    select(self.table.c.url, self.table.c.fetched_at)
+                    .where(self.table.c.url.in_(urls[start:start + batch_size]))
+                )
+                times.update({row.url: row.fetched_at for row in rows if row.fetched_at})
+        return times
+
+    def original_with_simhash(self, simhash: int) -> Optional[str]:
+        """URL of a page with this exact SimHash that is not itself a duplicate"""
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(self.table.c.url)
+                .where(self.table.c.simhash == f"{simhash:016x}", self.table.c.duplicate_of.is_(None))
+                .limit(1)
+            ).scalar()
+
+    def delete(self, url: str):
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.url == url))
@@ -3,13 +3,37 @@ from langchain_core.prompts import PromptTemplate
 from langchain_core.documents import Document
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from src.services.vector_store_service import VectorStoreService
-from typing import Dict, List, Any
+from src.services.collection_manager import CollectionView
+from src.services.answer_cache import SemanticAnswerCache
+from src.services.context_builder import ContextBuilder
+from src.services.trace_service import TraceStore
+from src.utils.metrics import Trace, registry
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple, Union
+import asyncio
+import time
 
 class RAGService:
-    def __init__(self, vector_store_service: VectorStoreService):
+    def __init__(
+        self,
+        vector_store_service: Union[VectorStoreService, CollectionView],
+        answer_cache: Optional[SemanticAnswerCache] = None,
+        context_builder: Optional[ContextBuilder] = None,
+        fetch_k: int = 12,
+        trace_store: Optional[TraceStore] = None,
+        max_llm_concurrency: int = 4
+    ):
         self.vector_store_service = vector_store_service
         self.llm = ChatOpenAI(temperature=0)
         self.chain = None
+        # Shared across sessions when the caller passes one in
+        self.answer_cache = answer_cache or SemanticAnswerCache()
+        # Candidates retrieved before merging, MMR and token-budget packing
+        self.fetch_k = fetch_k
+        self.context_builder = context_builder or ContextBuilder(model_name=self.llm.model_name)
+        # Per-query stage timings are persisted only when a store is given
+        self.trace_store = trace_store
+        # LLM calls in flight at once during `batch_query`
+        self.max_llm_concurrency = max_llm_concurrency
 
     def _create_chain(self, prompt_template: str):
         """Create a chain with the given prompt template."""
@@ -28,12 +52,10 @@ class RAGService:
     def initialize_chain(self):
         """Initialize the chain with conversation context handling."""
         prompt_template = """
-        Context from previous conversation:
-        {context}
-        
-        Based on the following documents and the conversation context above, 
-        please answer the question. If you cannot answer the question based 
-        on the documents provided, please say so.
+        Based on the following documents, please answer the question. The
+        question may include the previous conversation for context. If you
+        cannot answer the question based on the documents provided, please
+        say so.
 
         Documents: {context}
         
@@ -43,44 +65,279 @@ class RAGService:
 
         self.chain = self._create_chain(prompt_template)
 
-    def query(self, query: str) -> Dict[str, Any]:
+    @staticmethod
+    def _with_history(query: str, history: Optional[List[Dict[str, str]]]) -> str:
+        """Prefix a question with the previous conversation, if there is any"""
+        if not history:
+            return query
+        context = "\n".join(f"{message['role']}: {message['content']}" for message in history)
+        return f"""
+        Previous conversation:
+        {context}
+        
+        Current question: {query}
+        
+        Please provide a response that takes into account the conversation history.
+        """
+
+    def _check_cache(
+        self,
+        query: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]], int]:
+        """Look up the answer cache; returns (cached result, query vector, store version).
+
+        Answers to follow-up questions depend on the conversation, so the
+        cache is only used for questions asked without history.
+        """
+        store_version = self.vector_store_service.version
+        if history:
+            return None, None, store_version
+        cached = self.answer_cache.get_exact(query, store_version)
+        if cached is not None:
+            return cached, None, store_version
+        query_vector = self.vector_store_service.embeddings.embed_query(query)
+        return self.answer_cache.get_similar(query_vector, store_version), query_vector, store_version
+
+    def _finish_trace(self, trace: Trace, cache_hit: bool):
+        """Record a finished query in the metrics and, if configured, the trace table"""
+        trace.counters['cache_hit'] = int(cache_hit)
+        trace.finish()
+        registry.inc('rag_queries_total', cache='hit' if cache_hit else 'miss')
+        registry.write()
+        if self.trace_store is not None:
+            self.trace_store.save(trace)
+
+    def query(self, query: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
         """
         Query the RAG system with context awareness.
         
         Args:
             query: The user's question
+            history: Previous messages as {"role", "content"} dicts
             
         Returns:
             Dict containing the answer and source documents
         """
         if not self.chain:
             raise ValueError("Chain not initialized")
+        
+        trace = Trace('query', query)
+        
+        # Answer repeated questions and close paraphrases from the cache
+        with trace.stage('cache_lookup'):
+            cached, query_vector, store_version = self._check_cache(query, history)
+        if cached is not None:
+            self._finish_trace(trace, cache_hit=True)
+            return cached
+        question = self._with_history(query, history)
             
-        # Extract relevant documents
-        docs = self.vector_store_service.vector_store.similarity_search(query)
+        # Extract relevant documents; query_vector is only set when question == query
+        with trace.stage('retrieval'):
+            docs = self.get_relevant_documents(question, query_vector)
         
         try:
             # Use invoke instead of run
-            response = self.chain.invoke({
-                "context": docs,
-                "question": query
-            })
+            with trace.stage('llm'):
+                response = self.chain.invoke({
+                    "context": docs,
+                    "question": question
+                })
             
-            return {
+            result = {
                 "answer": response,
                 "source_documents": docs
             }
+            if query_vector is not None:
+                self.answer_cache.put(query, query_vector, store_version, result)
+            self._finish_trace(trace, cache_hit=False)
+            return result
+        except Exception as e:
+            raise Exception(f"Error during query processing: {str(e)}")
+
+    async def aquery(self, query: str, history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """
+        Async version of `query`; blocking retrieval runs in a worker thread.
+        
+        Args:
+            query: The user's question
+            history: Previous messages as {"role", "content"} dicts
+            
+        Returns:
+            Dict containing the answer and source documents
+        """
+        answer = []
+        docs: List[Document] = []
+        async for event in self.stream_query(query, history):
+            if event["type"] == "sources":
+                docs = event["source_documents"]
+            else:
+                answer.append(event["content"])
+        return {
+            "answer": ''.join(answer),
+            "source_documents": docs
+        }
+
+    async def stream_query(
+        self,
+        query: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an answer token by token.
+        
+        Args:
+            query: The user's question
+            history: Previous messages as {"role", "content"} dicts
+            
+        Yields:
+            A {"type": "sources", "source_documents": [...]} event first, then
+            {"type": "token", "content": str} events as the LLM produces them
+        """
+        if not self.chain:
+            raise ValueError("Chain not initialized")
+        
+        trace = Trace('query', query)
+        with trace.stage('cache_lookup'):
+            cached, query_vector, store_version = await asyncio.to_thread(self._check_cache, query, history)
+        if cached is not None:
+            yield {"type": "sources", "source_documents": cached["source_documents"]}
+            yield {"type": "token", "content": cached["answer"]}
+            await asyncio.to_thread(self._finish_trace, trace, True)
+            return
+        question = self._with_history(query, history)
+        
+        with trace.stage('retrieval'):
+            docs = await asyncio.to_thread(self.get_relevant_documents, question, query_vector)
+        yield {"type": "sources", "source_documents": docs}
+        
+        answer = []
+        llm_start = time.perf_counter()
+        try:
+            async for token in self.chain.astream({
+                "context": docs,
+                "question": question
+            }):
+                if not answer:
+                    trace.record('llm_first_token', time.perf_counter() - llm_start)
+                answer.append(token)
+                yield {"type": "token", "content": token}
         except Exception as e:
             raise Exception(f"Error during query processing: {str(e)}")
+        # Includes time the consumer spent between tokens
+        trace.record('llm', time.perf_counter() - llm_start)
+        
+        if query_vector is not None:
+            self.answer_cache.put(query, query_vector, store_version, {
+                "answer": ''.join(answer),
+                "source_documents": docs
+            })
+        await asyncio.to_thread(self._finish_trace, trace, False)
 
-    def get_relevant_documents(self, query: str) -> List[Document]:
+    def get_relevant_documents(self, query: str, query_vector: Optional[List[float]] = None) -> List[Document]:
         """
-        Get relevant documents for a query.
+        Get relevant documents for a query, merged and packed into the
+        context token budget.
         
         Args:
             query: The search query
+            query_vector: Its embedding, if the caller already has it
             
         Returns:
             List of relevant documents
         """
-        return self.vector_store_service.vector_store.similarity_search(query) 
\ No newline at end of file
+        candidates = self.vector_store_service.similarity_search(
+            query, k=self.fetch_k, query_vector=query_vector
+        )
+        return self.context_builder.build(candidates)
+
+    def batch_retrieve(
+        self,
+        queries: List[str],
+        query_vectors: Optional[List[List[float]]] = None
+    ) -> List[List[Document]]:
+        """
+        `get_relevant_documents` for many queries at once.
+        
+        Queries are embedded in one batched call and searched with one
+        vectorized index search, instead of one embedding call and one
+        search per query.
+        
+        Args:
+            queries: The search queries
+            query_vectors: Their embeddings, if the caller already has them
+            
+        Returns:
+            Relevant documents of every query, in query order
+        """
+        candidates = self.vector_store_service.batch_similarity_search(
+            queries, k=self.fetch_k, query_vectors=query_vectors
+        )
+        return [self.context_builder.build(documents) for documents in candidates]
+
+    def batch_query(self, queries: List[str], max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Answer many questions, for evaluation jobs and bulk question answering.
+        
+        Cached answers are served first; the remaining questions are
+        embedded and retrieved in one batch, and answered with at most
+        `max_concurrency` LLM calls in flight.
+        
+        Args:
+            queries: The questions
+            max_concurrency: Cap on concurrent LLM calls; defaults to `max_llm_concurrency`
+            
+        Returns:
+            Dicts containing the answer and source documents, in query order
+        """
+        if not self.chain:
+            raise ValueError("Chain not initialized")
+        
+        trace = Trace('query', f"Batch of {len(queries)} queries")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        with trace.stage('cache_lookup'):
+            store_version = self.vector_store_service.version
+            for position, query in enumerate(queries):
+                results[position] = self.answer_cache.get_exact(query, store_version)
+            missing = [position for position, result in enumerate(results) if result is None]
+            missing_queries = [queries[position] for position in missing]
+            vectors = self.vector_store_service.embeddings.embed_documents(missing_queries) if missing else []
+            query_vectors = {}
+            for position, vector in zip(missing, vectors):
+                results[position] = self.answer_cache.get_similar(vector, store_version)
+                query_vectors[position] = vector
+        pending = [position for position in missing if results[position] is None]
+        trace.counters['cache_hits'] = len(queries) - len(pending)
+        
+        if pending:
+            with trace.stage('retrieval'):
+                docs = self.batch_retrieve(
+                    [queries[position] for position in pending],
+                    [query_vectors[position] for position in pending]
+                )
+            try:
+                with trace.stage('llm'):
+                    answers = self.chain.batch(
+                        [
+                            {"context": documents, "question": queries[position]}
+                            for position, documents in zip(pending, docs)
+                        ],
+                        config={"max_concurrency": max_concurrency or self.max_llm_concurrency}
+                    )
+            except Exception as e:
+                raise Exception(f"Error during query processing: {str(e)}")
+            for position, documents, answer in zip(pending, docs, answers):
+                results[position] = {
+                    "answer": answer,
+                    "source_documents": documents
+                }
+                self.answer_cache.put(queries[position], query_vectors[position], store_version, results[position])
+        
+        trace.counters['queries'] = len(queries)
+        trace.finish()
+        registry.inc('rag_queries_total', len(queries) - len(pending), cache='hit')
+        registry.inc('rag_queries_total', len(pending), cache='miss')
+        registry.write()
+        if self.trace_store is not None:
+            self.trace_store.save(trace)
+        return results 
\ No newline at end of file
@@ -0,0 +1,169 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+import logging
+import xml.etree.ElementTree as ElementTree
+import zlib
+
+import aiohttp
+
+from src.services.host_scheduler import HostScheduler
+from src.services.page_record_service import PageRecordService
+from src.services.url_canonicalizer import UrlCanonicalizer
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+EPOCH = datetime(1970, 1, 1)
+
+# Frontier priorities of sitemap URLs; changed pages use -lastmod (newest first)
+PRIORITY_UNKNOWN = 0.0
+PRIORITY_UNCHANGED = 1.0
+
+SitemapEntry = Tuple[str, Optional[datetime]]
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[datetime]:
+    """Parse a W3C datetime such as 2024-05-01 or 2024-05-01T10:00:00Z into naive UTC"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_sitemap(content: bytes) -> Tuple[List[str], List[SitemapEntry]]:
+    """Split a sitemap document into (child sitemap URLs, page entries)"""
+    if b'<!DOCTYPE' in content[:1024] or b'<!ENTITY' in content:
+        # Sitemaps never declare entities; refusing them rules out entity expansion attacks
+        raise ValueError("sitemap declares a DTD")
+    root = ElementTree.fromstring(content)
+    sitemaps: List[str] = []
+    pages: List[SitemapEntry] = []
+    for element in root:
+        fields = {child.tag.rsplit('}', 1)[-1]: (child.text or '').strip() for child in element}
+        loc = fields.get('loc')
+        if not loc:
+            continue
+        kind = element.tag.rsplit('}', 1)[-1]
+        if kind == 'sitemap':
+            sitemaps.append(loc)
+        elif kind == 'url':
+            pages.append((loc, parse_lastmod(fields.get('lastmod'))))
+    return sitemaps, pages
+
+
+class SitemapDiscovery:
+    """Finds a site's pages through the sitemaps listed in its robots.txt.
+
+    Follows sitemap indexes and reads gzipped sitemaps, within limits on
+    the number of sitemaps, URLs and decompressed bytes. Sitemap requests
+    go through the crawl's `HostScheduler`, so they obey the same per-host
+    delay as page fetches.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        scheduler: HostScheduler,
+        canonicalizer: Optional[UrlCanonicalizer] = None,
+        page_records: Optional[PageRecordService] = None,
+        max_sitemaps: int = 50,
+        max_urls: int = 100000,
+        max_bytes: int = 50 * 1024 * 1024  # The sitemap protocol's own size limit
+    ):
+        self.session = session
+        self.scheduler = scheduler
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.page_records = page_records or PageRecordService()
+        self.max_sitemaps = max_sitemaps
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+
+    async def sitemap_urls(self, start_url: str) -> List[str]:
+        """Sitemaps declared in robots.txt, or the conventional /sitemap.xml"""
+        await self.scheduler.load_robots(self.session, start_url)
+        robots = self.scheduler.get_robots(start_url)
+        declared = (robots.site_maps() if robots else None) or []
+        return declared or [urljoin(start_url, '/sitemap.xml')]
+
+    async def fetch(self, url: str) -> Optional[bytes]:
+        """Download a sitemap, decompressing gzip bodies; None if missing or too large"""
+        try:
+            async with self.scheduler.slot(url):
+                async with self.session.get(url, timeout=aiohttp.ClientTimeout(total=60), ssl=False) as response:
+                    if response.status != 200:
+                        logger.info(f"No sitemap at {url}: Status {response.status}")
+                        return None
+                    chunks = []
+                    size = 0
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            logger.warning(f"Sitemap over {self.max_bytes} bytes, skipped: {url}")
+                            return None
+                        chunks.append(chunk)
+        except Exception as e:
+            logger.warning(f"Could not fetch sitemap {url}: {str(e)}")
+            return None
+
+        content = b''.join(chunks)
+        # .gz sitemaps are usually served without Content-Encoding, so aiohttp leaves them compressed
+        if content[:2] == GZIP_MAGIC:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            try:
+                content = decompressor.decompress(content, self.max_bytes)
+            except zlib.error as e:
+                logger.warning(f"Corrupt gzipped sitemap {url}: {str(e)}")
+                return None
+            if decompressor.unconsumed_tail:
+                logger.warning(f"Sitemap decompresses to over {self.max_bytes} bytes, skipped: {url}")
+                return None
+        return content
+
+    async def discover(self, start_url: str) -> List[SitemapEntry]:
+        """Return canonical page URLs and their lastmod from every reachable sitemap"""
+        pending = await self.sitemap_urls(start_url)
+        seen = set()
+        entries: Dict[str, Optional[datetime]] = {}
+        while pending and len(seen) < self.max_sitemaps and len(entries) < self.max_urls:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            content = await self.fetch(sitemap_url)
+            if content is None:
+                continue
+            try:
+                children, pages = parse_sitemap(content)
+            except (ElementTree.ParseError, ValueError) as e:
+                logger.warning(f"Invalid sitemap {sitemap_url}: {str(e)}")
+                continue
+            pending.extend(urljoin(sitemap_url, child) for child in children)
+            for loc, lastmod in pages[:self.max_urls - len(entries)]:
+                url = self.canonicalizer.canonicalize(urljoin(sitemap_url, loc))
+                if urlparse(url).scheme in ('http', 'https'):
+                    entries[url] = lastmod
+        logger.info(f"Found {len(entries)} URLs in {len(seen)} sitemaps of {start_url}")
+        return list(entries.items())
+
+    def priorities(self, entries: List[SitemapEntry]) -> Dict[str, float]:
+        """Frontier priorities: pages new or modified since their last fetch first, newest first.
+
+        Pages whose lastmod is not after their last fetch go last, and pages
+        without a lastmod keep the default priority of discovered links.
+        """
+        fetched = self.page_records.fetched_times(url for url, _ in entries)
+        priorities = {}
+        for url, lastmod in entries:
+            if lastmod is None:
+                priorities[url] = PRIORITY_UNKNOWN
+            elif url in fetched and lastmod <= fetched[url]:
+                priorities[url] = PRIORITY_UNCHANGED
+            else:
+                priorities[url] = -(lastmod - EPOCH).total_seconds()
+        return priorities
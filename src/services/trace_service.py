@@ -0,0 +1,59 @@
+from typing import Dict, List, Optional
+import json
+import logging
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from src.models.database import PipelineTrace, get_engine
+from src.utils.metrics import Trace
+
+logger = logging.getLogger(__name__)
+
+
+class TraceStore:
+    """Persists crawl and query traces to `pipeline_traces`, next to `crawl_history`"""
+
+    def __init__(self, engine: Optional[Engine] = None):
+        self.engine = engine or get_engine()
+        self.table = PipelineTrace.__table__
+
+    def save(self, trace: Trace, crawl_history_id: Optional[int] = None) -> Optional[int]:
+        """Store a finished trace; returns its id, or None if it could not be written"""
+        trace.finish()
+        try:
+            with self.engine.begin() as conn:
+                result = conn.execute(self.table.insert().values(
+                    crawl_history_id=crawl_history_id,
+                    kind=trace.kind,
+                    subject=trace.subject,
+                    started_at=trace.started_at,
+                    duration_seconds=trace.duration,
+                    stages=json.dumps(trace.stages),
+                    counters=json.dumps(trace.counters)
+                ))
+            return result.inserted_primary_key[0]
+        except Exception as e:
+            logger.error(f"Error saving {trace.kind} trace: {str(e)}")
+            return None
+
+    def recent(self, kind: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Return the latest traces, newest first"""
+        statement = select(self.table).order_by(self.table.c.started_at.desc()).limit(limit)
+        if kind:
+            statement = statement.where(self.table.c.kind == kind)
+        with self.engine.connect() as conn:
+            rows = conn.execute(statement).all()
+        return [
+            {
+                'id': row.id,
+                'crawl_history_id': row.crawl_history_id,
+                'kind': row.kind,
+                'subject': row.subject,
+                'started_at': row.started_at,
+                'duration_seconds': row.duration_seconds,
+                'stages': json.loads(row.stages) if row.stages else {},
+                'counters': json.loads(row.counters) if row.counters else {},
+            }
+            for row in rows
+        ]
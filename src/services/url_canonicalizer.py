@@ -0,0 +1,157 @@
+from fnmatch import fnmatchcase
+from typing import Dict, List, Literal, Optional
+from urllib.parse import parse_qsl, quote, urlencode, urljoin, urlparse, urlunparse
+import json
+import logging
+import posixpath
+import re
+import string
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that never change page content. Names that select content
+# on some sites, such as `ref` or `sid`, belong in a site's `strip_params`.
+TRACKING_PARAMS = [
+    'utm_*', 'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', '_hsenc', '_hsmi', 'ref_src',
+    'sessionid', 'session_id', 'phpsessid', 'jsessionid',
+]
+
+# Characters allowed unencoded in a path
+_PATH_SAFE = "/:@!$&'()*+,;=-._~"
+_UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+_PERCENT_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+
+
+def normalize_percent_encoding(text: str, safe: str = _PATH_SAFE) -> str:
+    """Decode escaped unreserved characters, uppercase other escapes and encode unsafe characters"""
+    def replace(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in _UNRESERVED else '%' + match.group(1).upper()
+    return quote(_PERCENT_ESCAPE.sub(replace, text), safe=safe + '%')
+
+
+class SiteRules(BaseModel):
+    """How URLs of one site are normalized"""
+    strip_params: List[str] = Field(default_factory=lambda: list(TRACKING_PARAMS),
+                                    description="Query parameters to drop; glob patterns, case-insensitive")
+    keep_params: Optional[List[str]] = Field(None, description="If set, only these query parameters are kept")
+    drop_query: bool = Field(False, description="Drop the whole query string")
+    sort_query: bool = Field(True, description="Order query parameters by name")
+    lowercase_path: bool = Field(False, description="For case-insensitive servers")
+    # Relative links resolve against the URL as requested, so only strip or add on sites that serve both forms
+    trailing_slash: Literal['keep', 'strip', 'add'] = 'keep'
+    index_files: List[str] = Field(default_factory=lambda: ['index.html', 'index.htm', 'index.php', 'default.aspx'],
+                                   description="Directory index documents to drop from paths")
+    force_https: bool = False
+    strip_www: bool = False
+    honor_rel_canonical: bool = True
+
+
+class UrlCanonicalizer:
+    """Maps the many spellings of a URL to one, so each page is fetched once.
+
+    Always lowercases the scheme and host, drops default ports, fragments
+    and dot segments, and normalizes percent-encoding. The rest follows the
+    `SiteRules` of the URL's host (or of its parent domain), falling back to
+    `default`.
+    """
+
+    def __init__(self, rules: Optional[Dict[str, SiteRules]] = None, default: Optional[SiteRules] = None):
+        self.rules = {host.lower(): rule for host, rule in (rules or {}).items()}
+        self.default = default or SiteRules()
+
+    @classmethod
+    def from_file(cls, path: str) -> 'UrlCanonicalizer':
+        """Load rules from JSON: {"default": {...}, "sites": {"example.com": {...}}}"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(
+            rules={host: SiteRules(**rule) for host, rule in data.get('sites', {}).items()},
+            default=SiteRules(**data['default']) if 'default' in data else None
+        )
+
+    def rules_for(self, host: str) -> SiteRules:
+        """Rules of the host, or of the nearest parent domain that has some"""
+        host = host.lower()
+        while host:
+            if host in self.rules:
+                return self.rules[host]
+            _, _, host = host.partition('.')
+        return self.default
+
+    def canonicalize(self, url: str) -> str:
+        """Return the canonical form of an absolute http(s) URL; other URLs are returned unchanged"""
+        parsed = urlparse(url.strip())
+        scheme = parsed.scheme.lower()
+        if scheme not in DEFAULT_PORTS or not parsed.hostname:
+            return url
+        host = parsed.hostname.lower().rstrip('.')
+        rules = self.rules_for(host)
+
+        if rules.force_https:
+            scheme = 'https'
+        if rules.strip_www and host.startswith('www.'):
+            host = host[4:]
+        netloc = host
+        try:
+            port = parsed.port
+        except ValueError:
+            port = None
+        if port and port != DEFAULT_PORTS[scheme]:
+            netloc = f"{host}:{port}"
+        if parsed.username:
+            netloc = f"{parsed.username}{':' + parsed.password if parsed.password else ''}@{netloc}"
+
+        return urlunparse((scheme, netloc, self._path(parsed.path, rules), '', self._query(parsed.query, rules), ''))
+
+    def _path(self, path: str, rules: SiteRules) -> str:
+        # Drop ;jsessionid=... style path parameters
+        path = ';'.join(part for part in path.split(';') if not part.lower().startswith('jsessionid='))
+        path = normalize_percent_encoding(path)
+        if rules.lowercase_path:
+            path = path.lower()
+        had_slash = path.endswith('/')
+        path = posixpath.normpath(path) if path else '/'
+        if path.startswith('//'):
+            path = '/' + path.lstrip('/')
+        directory, _, name = path.rpartition('/')
+        if name.lower() in rules.index_files:
+            path, had_slash = directory + '/', True
+        if had_slash and not path.endswith('/'):
+            path += '/'
+
+        if path != '/':
+            if rules.trailing_slash == 'strip':
+                path = path.rstrip('/')
+            elif rules.trailing_slash == 'add' and not path.endswith('/') and '.' not in path.rsplit('/', 1)[-1]:
+                path += '/'
+        return path
+
+    def _query(self, query: str, rules: SiteRules) -> str:
+        if rules.drop_query or not query:
+            return ''
+        params = []
+        for name, value in parse_qsl(query, keep_blank_values=True):
+            lowered = name.lower()
+            if rules.keep_params is not None and lowered not in (param.lower() for param in rules.keep_params):
+                continue
+            if any(fnmatchcase(lowered, pattern.lower()) for pattern in rules.strip_params):
+                continue
+            params.append((name, value))
+        if rules.sort_query:
+            params.sort()
+        return urlencode(params, quote_via=quote, safe=_PATH_SAFE.replace('&', '').replace('=', '').replace('+', ''))
+
+    def resolve_canonical(self, page_url: str, canonical_href: Optional[str]) -> Optional[str]:
+        """Canonical URL declared by a page's <link rel=canonical>, if the site's rules honor it"""
+        if not canonical_href:
+            return None
+        if not self.rules_for(urlparse(page_url).hostname or '').honor_rel_canonical:
+            return None
+        canonical = self.canonicalize(urljoin(page_url, canonical_href))
+        return canonical if urlparse(canonical).scheme in DEFAULT_PORTS else None
@@ -1,80 +1,464 @@
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from src.services.chunk_store import ChunkStore
+from src.services.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.services.faiss_index import FaissIndex, IndexConfig, INDEX_FILE
+from src.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from typing import List, Dict, Iterable, Optional, Tuple
+import numpy as np
+import hashlib
+import pickle
 import os
+import shutil
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Format before the SQLite chunk store
+LEGACY_DOCSTORE_FILE = 'index.pkl'  # langchain FAISS.save_local format
+
+RETRIEVAL_MODES = ('vector', 'lexical', 'hybrid')
+
+def chunk_id(url: str, position: int) -> int:
+    """Stable positive int64 id for the n-th chunk of a page"""
+    digest = hashlib.sha1(f"{url}#{position}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') & 0x7FFF_FFFF_FFFF_FFFF
+
 class VectorStoreService:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-        )
+    def __init__(
+        self,
+        store_dir: str = 'vector_store',
+        embeddings: Optional[Embeddings] = None,
+        index_config: Optional[IndexConfig] = None,
+        retrieval_mode: str = 'hybrid'
+    ):
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        self.store_dir = store_dir
+        self.retrieval_mode = retrieval_mode
+        if embeddings is None:
+            # Imported here: the OpenAI client is slow to import and unused when embeddings are passed in
+            from langchain_openai import OpenAIEmbeddings
+            
+            # Embeddings are looked up by chunk hash before calling the API
+            embeddings = CachedEmbeddings(OpenAIEmbeddings(), EmbeddingCache())
+        self.embeddings = embeddings
+        # Used for new stores; an existing store keeps the config it was built with
+        self.index_config = index_config or IndexConfig()
+        self._text_splitter = None
+        # The chunk and BM25 databases sit beside the store directory, which may not exist yet
+        os.makedirs(os.path.dirname(os.path.abspath(store_dir)), exist_ok=True)
+        # Compressed chunk text and metadata by vector id, read only for search hits;
+        # committed when the index is saved, so it also lives beside the store directory
+        self.chunks = ChunkStore(f"{store_dir}_chunks.db")
+        # BM25 index over the same chunks, committed with them
+        self.lexical_index = BM25Index(f"{store_dir}_lexical.db")
+        # Bumped on every change so caches of search results can invalidate
+        self.version = 0
+        # Serializes index changes, saves and searches between crawl jobs and chat sessions
+        self.lock = threading.RLock()
         # Try to load existing vector store during initialization
-        self.vector_store = self.load_vector_store()
-        
+        self.vector_store: Optional[FaissIndex] = self.load_vector_store()
+
+    @property
+    def text_splitter(self):
+        """Created on first use; importing langchain's splitters is slow"""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                length_function=len,
+                add_start_index=True,
+            )
+        return self._text_splitter
+
+    def split_document(self, doc: Dict[str, str]) -> Tuple[List[str], List[Dict], List[int]]:
+        """Split a crawled page into chunk texts, metadata and stable chunk ids"""
+        pieces = self.text_splitter.create_documents([doc['content']])
+        chunks = [piece.page_content for piece in pieces]
+        ids = [chunk_id(doc['url'], i) for i in range(len(chunks))]
+        # Offsets let overlapping neighbours be merged back together at query time
+        metadatas = [
+            {
+                'url': doc['url'],
+                'title': doc.get('title', ''),
+                'chunk': i,
+                'start_index': piece.metadata.get('start_index', -1)
+            }
+            for i, piece in enumerate(pieces)
+        ]
+        return chunks, metadatas, ids
+
     def create_vector_store(self, documents: List[Dict[str, str]]):
         """Create a new vector store from the provided documents"""
         try:
-            # Process the documents
+            with self.lock:
+                self.vector_store = None
+                self.chunks.clear()
+                self.lexical_index.clear()
+            self.version += 1
+            self.upsert_documents(documents)
+            logger.info("Vector store created and saved successfully")
+
+        except Exception as e:
+            logger.error(f"Error creating vector store: {str(e)}")
+            raise
+
+    def upsert_documents(self, documents: List[Dict[str, str]]):
+        """Add new pages and replace the chunks of pages that are already indexed.
+
+        Only the given documents are embedded; the rest of the index is kept.
+        """
+        try:
             texts = []
             metadatas = []
-            
+            ids = []
             for doc in documents:
-                chunks = self.text_splitter.split_text(doc['content'])
+                chunks, chunk_metadata, chunk_ids = self.split_document(doc)
                 texts.extend(chunks)
-                # Create metadata for each chunk
-                chunk_metadata = [{'url': doc['url'], 'title': doc.get('title', '')} for _ in chunks]
                 metadatas.extend(chunk_metadata)
-            
-            # Create the vector store
-            self.vector_store = FAISS.from_texts(
-                texts=texts,
-                embedding=self.embeddings,
-                metadatas=metadatas
+                ids.extend(chunk_ids)
+
+            vectors = self.embeddings.embed_documents(texts) if texts else []
+            self.add_embedded_chunks(
+                texts, vectors, metadatas, ids,
+                replace_urls=[doc['url'] for doc in documents]
             )
-            
-            # Save the vector store
             self.save_vector_store()
-            logger.info("Vector store created and saved successfully")
-            
+            logger.info(f"Upserted {len(documents)} pages ({len(texts)} chunks) into vector store")
+
         except Exception as e:
-            logger.error(f"Error creating vector store: {str(e)}")
+            logger.error(f"Error updating vector store: {str(e)}")
+            raise
+
+    def add_embedded_chunks(
+        self,
+        texts: List[str],
+        vectors: List[List[float]],
+        metadatas: List[Dict],
+        ids: List[int],
+        replace_urls: Iterable[str] = ()
+    ):
+        """Add already-embedded chunks without saving.
+
+        Existing chunks of `replace_urls` are removed first, so a page that
+        is re-added does not keep stale chunks.
+        """
+        with self.lock:
+            self._remove_chunks(replace_urls)
+            if not texts:
+                return
+            matrix = np.asarray(vectors, dtype=np.float32)
+            if self.vector_store is None:
+                self.vector_store = FaissIndex(matrix.shape[1], self.index_config)
+            self.vector_store.add(np.asarray(ids, dtype=np.int64), matrix)
+            self.chunks.put(ids, texts, metadatas)
+            self.lexical_index.add(ids, texts)
+            self.version += 1
+
+    def delete_urls(self, urls: Iterable[str], save: bool = True):
+        """Remove every chunk of the given pages from the index"""
+        try:
+            with self.lock:
+                removed = self._remove_chunks(urls)
+                if removed and save:
+                    self.save_vector_store()
+            if removed:
+                logger.info(f"Removed {removed} chunks from vector store")
+        except Exception as e:
+            logger.error(f"Error deleting from vector store: {str(e)}")
             raise
-    
+
+    def memory_bytes(self) -> int:
+        """Estimated RAM held by the index; chunk texts and metadata stay on disk"""
+        with self.lock:
+            return self.vector_store.memory_bytes if self.vector_store is not None else 0
+
+    def has_url(self, url: str) -> bool:
+        """Check whether a page has chunks in the index"""
+        with self.lock:
+            return self.chunks.has_url(url)
+
+    def _remove_chunks(self, urls: Iterable[str]) -> int:
+        """Delete the chunks of the given URLs without saving; returns chunks removed"""
+        ids = self.chunks.ids_for_urls(urls)
+        if ids and self.vector_store is not None:
+            self.vector_store.remove(np.asarray(ids, dtype=np.int64))
+        if ids:
+            self.chunks.delete(ids)
+            self.lexical_index.remove(ids)
+            self.version += 1
+        return len(ids)
+
+    def rebuild_index(self, index_config: IndexConfig):
+        """Rebuild the index with a different type or parameters.
+
+        Vectors come from the embedding cache, so this normally makes no
+        embedding API calls.
+        """
+        with self.lock:
+            self.index_config = index_config
+            self.vector_store = None
+            self.version += 1
+            count = 0
+            for ids, texts in self.chunks.iter_texts():
+                matrix = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+                if self.vector_store is None:
+                    self.vector_store = FaissIndex(matrix.shape[1], index_config)
+                self.vector_store.add(np.asarray(ids, dtype=np.int64), matrix)
+                count += len(ids)
+            self.save_vector_store()
+        logger.info(f"Rebuilt vector store as {index_config.index_type} with {count} chunks")
+
     def save_vector_store(self):
-        """Save the vector store to disk"""
-        if self.vector_store:
-            try:
-                os.makedirs('vector_store', exist_ok=True)
-                self.vector_store.save_local('vector_store')  # Removed allow_dangerous_deserialization
-                logger.info("Vector store saved successfully")
-            except Exception as e:
-                logger.error(f"Error saving vector store: {str(e)}")
-                raise
-    
-    def load_vector_store(self):
+        """Save the vector store to disk.
+
+        The index is written to a temporary directory first and swapped in,
+        so a crash mid-save never leaves a half-written index behind. Chunk
+        and BM25 changes are then committed; only rows changed since the
+        last save are written.
+        """
+        with self.lock:
+            if self.vector_store:
+                tmp_dir = f"{self.store_dir}.tmp"
+                old_dir = f"{self.store_dir}.old"
+                try:
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+                    os.makedirs(tmp_dir)
+                    self.vector_store.save(tmp_dir)
+
+                    shutil.rmtree(old_dir, ignore_errors=True)
+                    if os.path.exists(self.store_dir):
+                        os.replace(self.store_dir, old_dir)
+                    os.replace(tmp_dir, self.store_dir)
+                    shutil.rmtree(old_dir, ignore_errors=True)
+                    self.vector_store.path = os.path.join(self.store_dir, INDEX_FILE)
+                    logger.info("Vector store saved successfully")
+                except Exception as e:
+                    logger.error(f"Error saving vector store: {str(e)}")
+                    raise
+            self.chunks.commit()
+            self.lexical_index.commit()
+
+    def load_vector_store(self) -> Optional[FaissIndex]:
         """Load the vector store from disk"""
         try:
-            if os.path.exists('vector_store'):
-                vector_store = FAISS.load_local(
-                    'vector_store',
-                    self.embeddings,
-                    allow_dangerous_deserialization=True  # Only needed for loading
-                )
-                logger.info("Vector store loaded successfully")
+            old_dir = f"{self.store_dir}.old"
+            if not os.path.exists(self.store_dir) and os.path.exists(old_dir):
+                # A save was interrupted after the old copy was moved aside
+                os.replace(old_dir, self.store_dir)
+            if FaissIndex.exists(self.store_dir):
+                vector_store = FaissIndex.load(self.store_dir)
+                self._backfill_lexical_index()
+                logger.info(f"Vector store loaded successfully ({vector_store.ntotal} vectors)")
                 return vector_store
+            if os.path.exists(os.path.join(self.store_dir, LEGACY_DOCSTORE_FILE)):
+                return self._migrate_langchain_store()
+            if len(self.chunks):
+                # Chunks of an index that was deleted would make its pages look indexed
+                logger.warning(f"Dropping chunks without a saved index in {self.store_dir}")
+                self.chunks.clear()
+                self.chunks.commit()
+                self.lexical_index.clear()
+                self.lexical_index.commit()
         except Exception as e:
             logger.error(f"Error loading vector store: {str(e)}")
         return None
 
-    def similarity_search(self, query: str, k: int = 4):
-        """Perform similarity search"""
-        if not self.vector_store:
-            raise ValueError("Vector store not initialized")
-        return self.vector_store.similarity_search(query, k=k) 
\ No newline at end of file
+    def _migrate_langchain_store(self) -> FaissIndex:
+        """Convert a store written by langchain's FAISS.save_local to the current format"""
+        import faiss
+
+        with open(os.path.join(self.store_dir, LEGACY_DOCSTORE_FILE), 'rb') as f:
+            legacy_docstore, index_to_docstore_id = pickle.load(f)
+        legacy_index = faiss.read_index(os.path.join(self.store_dir, INDEX_FILE))
+        vectors = legacy_index.reconstruct_n(0, legacy_index.ntotal)
+
+        ids = []
+        texts = []
+        metadatas = []
+        positions: Dict[str, int] = {}
+        for position in range(legacy_index.ntotal):
+            doc = legacy_docstore.search(index_to_docstore_id[position])
+            url = doc.metadata.get('url', '')
+            ids.append(chunk_id(url, positions.get(url, 0)))
+            positions[url] = positions.get(url, 0) + 1
+            texts.append(doc.page_content)
+            metadatas.append(dict(doc.metadata))
+        self.chunks.put(ids, texts, metadatas)
+
+        vector_store = FaissIndex(legacy_index.d, self.index_config)
+        vector_store.add(np.asarray(ids, dtype=np.int64), vectors)
+        self.vector_store = vector_store
+        self._backfill_lexical_index()
+        self.save_vector_store()
+        logger.info(f"Migrated langchain vector store ({len(ids)} chunks)")
+        return vector_store
+
+    def _backfill_lexical_index(self):
+        """Build the BM25 index for stores created before it existed, or that it drifted from"""
+        chunk_count = len(self.chunks)
+        if self.lexical_index.doc_count == chunk_count:
+            return
+        if self.lexical_index.doc_count:
+            logger.warning(
+                f"Lexical index has {self.lexical_index.doc_count} chunks, the store {chunk_count}; rebuilding it"
+            )
+        self.lexical_index.clear()
+        for ids, texts in self.chunks.iter_texts():
+            self.lexical_index.add(ids, texts)
+        self.lexical_index.commit()
+        logger.info(f"Built lexical index for {chunk_count} existing chunks")
+
+    def get_documents(self, ids: Iterable[int]) -> Dict[int, Document]:
+        """Return the chunks stored under the given ids; missing ids are left out"""
+        # The chunk store's connection is shared with writers
+        with self.lock:
+            entries = self.chunks.get_many(ids)
+        return {
+            doc_id: Document(page_content=text, metadata=metadata)
+            for doc_id, (text, metadata) in entries.items()
+        }
+
+    def get_document(self, doc_id: int) -> Optional[Document]:
+        """Return the chunk stored under an id, if any"""
+        return self.get_documents([doc_id]).get(int(doc_id))
+
+    def get_page_chunks(self, url: str) -> List[Document]:
+        """Every indexed chunk of a page, in page order"""
+        with self.lock:
+            entries = self.chunks.for_url(url)
+        return [Document(page_content=text, metadata=metadata) for _, text, metadata in entries]
+
+    def close(self):
+        """Release the chunk store's and BM25 index's connections; unsaved changes are dropped"""
+        with self.lock:
+            self.chunks.close()
+            self.lexical_index.close()
+
+    def search_by_vector(self, vector: List[float], k: int = 4) -> List[Tuple[int, float]]:
+        """Return (chunk id, L2 distance) pairs of the nearest chunks"""
+        return self.search_by_vectors([vector], k)[0]
+
+    def search_by_vectors(self, vectors: List[List[float]], k: int = 4) -> List[List[Tuple[int, float]]]:
+        """Nearest chunks of every vector, found with one search over the whole batch"""
+        if not len(vectors):
+            return []
+        with self.lock:
+            if not self.vector_store:
+                raise ValueError("Vector store not initialized")
+            distances, ids = self.vector_store.search(np.asarray(vectors, dtype=np.float32), k)
+        return [
+            [(int(doc_id), float(distance)) for doc_id, distance in zip(row_ids, row_distances) if doc_id != -1]
+            for row_ids, row_distances in zip(ids, distances)
+        ]
+
+    def embed_query(self, query: str, query_vector: Optional[List[float]] = None) -> List[float]:
+        """Embed a query unless the caller already has its vector"""
+        return query_vector if query_vector is not None else self.embeddings.embed_query(query)
+
+    def embed_queries(self, queries: List[str], query_vectors: Optional[List[List[float]]] = None) -> List[List[float]]:
+        """Embed queries in one batched call unless the caller already has their vectors"""
+        if query_vectors is not None:
+            return query_vectors
+        return self.embeddings.embed_documents(queries) if queries else []
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> List[Tuple[Document, float]]:
+        """Perform similarity search, returning documents with their L2 distance"""
+        hits = self.search_by_vector(self.embeddings.embed_query(query), k)
+        documents = self.get_documents(doc_id for doc_id, _ in hits)
+        return [(documents[doc_id], distance) for doc_id, distance in hits if doc_id in documents]
+
+    def search_ids(
+        self,
+        query: str,
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Tuple[int, float]]:
+        """Return (chunk id, score) pairs using vector, lexical or hybrid retrieval.
+
+        Scores are L2 distances (lower is better) in vector mode, BM25 scores
+        in lexical mode and reciprocal-rank-fusion scores in hybrid mode.
+        Lexical mode makes no embedding call; pass `query_vector` to reuse an
+        embedding across stores.
+        """
+        mode = mode or self.retrieval_mode
+        if mode == 'vector':
+            return self.search_by_vector(self.embed_query(query, query_vector), k)
+        if mode == 'lexical':
+            return self._lexical_search(query, k)
+        if mode == 'hybrid':
+            vector_hits = self.search_by_vector(self.embed_query(query, query_vector), self._fetch_k(k))
+            return self._fuse(query, vector_hits, k)
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+
+    def _lexical_search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        # The BM25 index's connection is shared with writers
+        with self.lock:
+            return self.lexical_index.search(query, k)
+
+    @staticmethod
+    def _fetch_k(k: int) -> int:
+        # Fuse deeper candidate lists so either retriever can lift a hit into the top k
+        return max(k * 4, 20)
+
+    def _fuse(self, query: str, vector_hits: List[Tuple[int, float]], k: int) -> List[Tuple[int, float]]:
+        """Fuse vector hits with the query's BM25 hits by reciprocal rank"""
+        lexical_hits = self._lexical_search(query, self._fetch_k(k))
+        fused = reciprocal_rank_fusion([
+            [doc_id for doc_id, _ in vector_hits],
+            [doc_id for doc_id, _ in lexical_hits],
+        ])
+        return fused[:k]
+
+    def batch_search_ids(
+        self,
+        queries: List[str],
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_vectors: Optional[List[List[float]]] = None
+    ) -> List[List[Tuple[int, float]]]:
+        """`search_ids` for many queries at once.
+
+        Queries are embedded in one batched call and searched with one
+        vectorized index search; BM25 lookups still run per query.
+        """
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        if mode == 'lexical':
+            return [self._lexical_search(query, k) for query in queries]
+        vectors = self.embed_queries(queries, query_vectors)
+        if mode == 'vector':
+            return self.search_by_vectors(vectors, k)
+        vector_results = self.search_by_vectors(vectors, self._fetch_k(k))
+        return [self._fuse(query, vector_hits, k) for query, vector_hits in zip(queries, vector_results)]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Perform similarity search with the configured retrieval mode"""
+        hits = self.search_ids(query, k, mode, query_vector)
+        # Only the final top k are read and decompressed
+        documents = self.get_documents(doc_id for doc_id, _ in hits)
+        return [documents[doc_id] for doc_id, _ in hits if doc_id in documents]
+
+    def batch_similarity_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        mode: Optional[str] = None,
+        query_vectors: Optional[List[List[float]]] = None
+    ) -> List[List[Document]]:
+        """`similarity_search` for many queries; the hits of all of them are read in one lookup"""
+        results = self.batch_search_ids(queries, k, mode, query_vectors)
+        documents = self.get_documents(doc_id for hits in results for doc_id, _ in hits)
+        return [[documents[doc_id] for doc_id, _ in hits if doc_id in documents] for hits in results]
@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from typing import Iterable, List, Optional, Set
+import hashlib
+import logging
+import mmap
+import os
+import sys
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BYTES = 8
+
+
+def fingerprint(text: str) -> int:
+    """64-bit blake2b fingerprint of a string"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=FINGERPRINT_BYTES).digest(), 'big')
+
+
+class _Run:
+    """One sorted run of fingerprints, held in memory or memory-mapped from a spill file"""
+
+    def __init__(self, values, path: Optional[str] = None, mapping: Optional[mmap.mmap] = None):
+        self.values = values
+        self.path = path
+        self.mapping = mapping
+
+    @classmethod
+    def spill(cls, values: Iterable[int], directory: Optional[str]) -> '_Run':
+        """Write sorted values to a temporary file and map it read-only"""
+        fd, path = tempfile.mkstemp(prefix='fingerprints-', suffix='.bin', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            chunk = array('Q')
+            for value in values:
+                chunk.append(value)
+                if len(chunk) >= 65536:
+                    chunk.tofile(f)
+                    del chunk[:]
+            chunk.tofile(f)
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(memoryview(mapping).cast('Q'), path, mapping)
+
+    @property
+    def resident(self) -> bool:
+        return self.mapping is None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, value: int) -> bool:
+        index = bisect_left(self.values, value)
+        return index < len(self.values) and self.values[index] == value
+
+    def close(self):
+        if self.mapping is not None:
+            self.values.release()
+            self.mapping.close()
+            os.remove(self.path)
+            self.mapping = None
+        self.values = array('Q')
+
+
+class FingerprintSet:
+    """Set of strings stored as 64-bit fingerprints, about 8 bytes per member.
+
+    New fingerprints collect in a small pending set, which is flushed into
+    sorted `array('Q')` runs once it holds `buffer_size` entries. Runs are
+    merged when the older one is at most twice the size of the newer, so
+    there are O(log n) runs to binary-search and each fingerprint is
+    rewritten O(log n) times. Merged runs that would push resident runs past
+    `memory_limit` bytes are spilled to `spill_dir` and memory-mapped, so
+    only the pages a lookup touches stay in RAM.
+
+    Membership is exact for fingerprints. Two distinct strings share one
+    with probability of about n**2 / 2**65, roughly 3 in a million for a
+    crawl of 10M URLs; a collision makes `add` report a new string as seen.
+    Callers that must never lose a string keep an exact check behind this
+    set, as the crawl frontier does with its unique constraint on URLs.
+    """
+
+    def __init__(self, buffer_size: int = 65536, memory_limit: int = 64 * 1024 * 1024, spill_dir: Optional[str] = None):
+        self.buffer_size = buffer_size
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir  # Defaults to the system temp directory
+        self._pending: Set[int] = set()
+        self._runs: List[_Run] = []
+
+    def __len__(self) -> int:
+        return len(self._pending) + sum(len(run) for run in self._runs)
+
+    def __contains__(self, text: str) -> bool:
+        return self._contains(fingerprint(text))
+
+    def _contains(self, value: int) -> bool:
+        if value in self._pending:
+            return True
+        # Newest runs are the smallest and most likely to hold recent URLs
+        return any(value in run for run in reversed(self._runs))
+
+    def add(self, text: str) -> bool:
+        """Add a string; returns False if it was already a member"""
+        value = fingerprint(text)
+        if self._contains(value):
+            return False
+        self._pending.add(value)
+        if len(self._pending) >= self.buffer_size:
+            self._flush()
+        return True
+
+    def update(self, texts: Iterable[str]):
+        for text in texts:
+            self.add(text)
+
+    def _flush(self):
+        self._runs.append(_Run(array('Q', sorted(self._pending))))
+        self._pending.clear()
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            newer = self._runs.pop()
+            older = self._runs.pop()
+            self._runs.append(self._merge(older, newer))
+
+    def _merge(self, older: _Run, newer: _Run) -> _Run:
+        size = (len(older) + len(newer)) * FINGERPRINT_BYTES
+        resident = sum(len(run) * FINGERPRINT_BYTES for run in self._runs if run.resident)
+        values = merge(older.values, newer.values)
+        if resident + size <= self.memory_limit:
+            merged = _Run(array('Q', values))
+        else:
+            merged = _Run.spill(values, self.spill_dir)
+            logger.debug(f"Spilled {size} bytes of fingerprints to {merged.path}")
+        older.close()
+        newer.close()
+        return merged
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate resident size: pending set plus in-memory runs"""
+        runs = sum(len(run) * FINGERPRINT_BYTES for run in self._runs if run.resident)
+        return sys.getsizeof(self._pending) + len(self._pending) * 32 + runs
+
+    def clear(self):
+        """Remove every member and delete spill files"""
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._pending.clear()
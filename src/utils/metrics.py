@@ -0,0 +1,196 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS_FILE = os.path.join('logs', 'metrics.prom')
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Bucketed distribution of observed values"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket that contains it"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    """Thread-safe histograms and counters, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def observe(self, name: str, value: float, **labels: str):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = self._key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = self._key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the duration of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    @staticmethod
+    def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(key) + ([extra] if extra else [])
+        if not pairs:
+            return ''
+        return '{' + ','.join(
+            f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"') + '"' for name, value in pairs
+        ) + '}'
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{self._format_labels(key)} {value:g}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{self._format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{self._format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path: str = METRICS_FILE):
+        """Write the metrics file atomically, for a node_exporter textfile collector"""
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {str(e)}")
+
+    def summary(self) -> List[Dict]:
+        """One row per histogram series, for display"""
+        rows = []
+        with self._lock:
+            for name, series in sorted(self.histograms.items()):
+                for key, histogram in sorted(series.items()):
+                    rows.append({
+                        'metric': name,
+                        **dict(key),
+                        'count': histogram.count,
+                        'total_s': round(histogram.sum, 3),
+                        'mean_ms': round(histogram.sum / histogram.count * 1000, 2) if histogram.count else 0.0,
+                        'p50_ms': round(histogram.quantile(0.5) * 1000, 2),
+                        'p95_ms': round(histogram.quantile(0.95) * 1000, 2),
+                        'max_ms': round(histogram.max * 1000, 2),
+                    })
+        return rows
+
+
+# Process-wide registry shared by the services
+registry = MetricsRegistry()
+
+
+class Trace:
+    """Stage timings and counters of one crawl or query.
+
+    Every stage duration is also observed into `<pipeline>_stage_seconds` on
+    the registry. Stages of concurrent tasks overlap, so stage totals can
+    exceed the wall-clock duration.
+    """
+
+    def __init__(self, kind: str, subject: str, metrics: MetricsRegistry = registry):
+        self.kind = kind
+        self.subject = subject
+        self.metrics = metrics
+        self.started_at = datetime.utcnow()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+
+    def record(self, stage: str, seconds: float, pipeline: Optional[str] = None):
+        self.metrics.observe(f"{pipeline or self.kind}_stage_seconds", seconds, stage=stage)
+        entry = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += seconds
+
+    def merge(self, stages: Dict[str, Dict[str, float]]):
+        """Add stage totals recorded elsewhere, e.g. by a worker process"""
+        for stage, other in stages.items():
+            entry = self.stages.setdefault(stage, {'count': 0, 'seconds': 0.0})
+            entry['count'] += other['count']
+            entry['seconds'] += other['seconds']
+
+    @contextmanager
+    def stage(self, name: str, pipeline: Optional[str] = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, pipeline)
+
+    def finish(self) -> float:
+        """Stop the clock and observe the total duration"""
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self.metrics.observe(f"{self.kind}_duration_seconds", self.duration)
+        return self.duration
@@ -0,0 +1,51 @@
+import numpy as np
+
+from src.services.collection_manager import CollectionManager
+from src.services.faiss_index import IndexConfig
+
+
+class FixedEmbeddings:
+    def embed_documents(self, texts):
+        return [[0.0] * 64 for _ in texts]
+
+    def embed_query(self, text):
+        return [0.0] * 64
+
+
+def write_collection(manager: CollectionManager, name: str, chunks: int):
+    vectors = np.random.default_rng(0).standard_normal((chunks, 64)).astype(np.float32)
+    with manager.use(name) as store:
+        store.add_embedded_chunks(
+            [f"chunk {i}" for i in range(chunks)],
+            vectors,
+            [{'url': f"https://{name}.example/{i}"} for i in range(chunks)],
+            list(range(1, chunks + 1))
+        )
+        store.save_vector_store()
+
+
+def test_collection_over_the_mmap_threshold_is_evicted(tmp_path):
+    config = IndexConfig(index_type='flat', mmap_threshold_mb=0)
+
+    def manager():
+        return CollectionManager(
+            root_dir=str(tmp_path / 'collections'),
+            memory_budget_mb=1,
+            embeddings=FixedEmbeddings(),
+            index_config=config,
+            default_store_dir=str(tmp_path / 'vector_store')
+        )
+
+    writer = manager()
+    write_collection(writer, 'first', 5000)  # About 1.3 MB of flat vectors
+    write_collection(writer, 'second', 100)
+    for name in list(writer.loaded):
+        writer.evict(name)
+
+    reader = manager()
+    reader.get('first')
+    assert reader.memory['first'] > reader.memory_budget
+
+    reader.get('second')
+    assert 'first' not in reader.loaded
+    assert 'second' in reader.loaded
@@ -0,0 +1,12 @@
+from src.services.embedding_cache import EmbeddingCache
+
+
+def test_eviction_of_one_stamped_batch_stops_at_ninety_percent(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'embeddings.db'), max_entries=100)
+    cache.put_many('model', {f"old-{i}": [float(i)] for i in range(95)})
+    cache.put_many('model', {f"new-{i}": [float(i)] for i in range(10)})
+
+    assert cache.size == 90
+    # The newest batch is kept whole; only the oldest entries are dropped
+    assert len(cache.get_many('model', [f"new-{i}" for i in range(10)])) == 10
+    assert len(cache.get_many('model', [f"old-{i}" for i in range(95)])) == 80
@@ -0,0 +1,80 @@
+import numpy as np
+
+from src.services.faiss_index import FaissIndex, IndexConfig
+
+
+def random_vectors(count: int, dim: int = 16, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_hnsw_replacement_hides_old_vectors_without_rebuilding():
+    index = FaissIndex(16, IndexConfig(index_type='hnsw'))
+    ids = np.arange(1, 1001, dtype=np.int64)
+    old = random_vectors(1000)
+    index.add(ids, old)
+    graph = index.index
+
+    # A re-crawled page keeps its chunk ids but gets new vectors
+    new = random_vectors(20, seed=1)
+    assert index.remove(ids[:20]) == 20
+    index.add(ids[:20], new)
+
+    assert index.index is graph
+    assert len(index.tombstones) == 20
+    assert index.ntotal == 1000
+    _, found = index.search(old[:20], 1)
+    assert not np.any(found[:, 0] == ids[:20])
+    _, found = index.search(new, 1)
+    assert np.array_equal(found[:, 0], ids[:20])
+    _, found = index.search(old[100:120], 10)
+    assert all(len(set(row)) == len(row) for row in found.tolist())
+
+
+def test_hnsw_tombstones_survive_save_and_load(tmp_path):
+    index = FaissIndex(16, IndexConfig(index_type='hnsw'))
+    vectors = random_vectors(200)
+    index.add(np.arange(1, 201, dtype=np.int64), vectors)
+    index.remove(np.arange(1, 11, dtype=np.int64))
+    index.save(str(tmp_path))
+
+    loaded = FaissIndex.load(str(tmp_path))
+    assert len(loaded.tombstones) == 10
+    assert loaded.ntotal == 190
+    _, found = loaded.search(vectors[:10], 1)
+    assert not np.any(np.isin(found, np.arange(1, 11)))
+
+
+def test_hnsw_graph_is_rebuilt_past_the_tombstone_ratio():
+    index = FaissIndex(16, IndexConfig(index_type='hnsw', max_tombstone_ratio=0.1))
+    index.add(np.arange(1, 201, dtype=np.int64), random_vectors(200))
+    index.remove(np.arange(1, 11, dtype=np.int64))
+    assert len(index.tombstones) == 10
+
+    index.remove(np.arange(11, 31, dtype=np.int64))
+    assert len(index.tombstones) == 0
+    assert index.index.ntotal == 170
+    ids, _ = index.reconstruct_all()
+    assert set(ids.tolist()) == set(range(31, 201))
+
+
+def test_flat_index_over_the_mmap_threshold_is_read_into_ram(tmp_path):
+    index = FaissIndex(16, IndexConfig(index_type='flat', mmap_threshold_mb=0))
+    index.add(np.arange(1, 1001, dtype=np.int64), random_vectors(1000))
+    index.save(str(tmp_path))
+
+    loaded = FaissIndex.load(str(tmp_path))
+    assert not loaded.mmapped
+    assert loaded.memory_bytes >= 1000 * 16 * 4
+
+
+def test_mmapped_ivf_index_reports_its_resident_quantizer(tmp_path):
+    config = IndexConfig(index_type='ivf_flat', nlist=4, nprobe=4, mmap_threshold_mb=0)
+    index = FaissIndex(16, config)
+    index.add(np.arange(1, 1001, dtype=np.int64), random_vectors(1000))
+    assert not index.is_staging
+    index.save(str(tmp_path))
+
+    loaded = FaissIndex.load(str(tmp_path))
+    assert loaded.mmapped
+    assert loaded.memory_bytes == 4 * 16 * 4
+    assert loaded.memory_bytes < index.memory_bytes
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+import pytest
+
+from src.services.indexing_pipeline import IndexingPipeline
+
+
+class FakeCrawler:
+    """Yields more pages than the pipeline queues hold"""
+
+    def __init__(self, pages: int):
+        self.pages = pages
+        self.crawl_stats = {}
+        self.removed_urls = []
+
+    async def iter_crawl(self, start_url, max_pages=10, trace=None, **kwargs):
+        for i in range(self.pages):
+            yield {'url': f"{start_url}/{i}", 'title': str(i), 'content': f"page {i}"}
+
+
+class FailingEmbeddings:
+    def embed_documents(self, texts):
+        time.sleep(0.2)  # Let the crawl and split stages fill their queues
+        raise RuntimeError("embedding API unavailable")
+
+
+class FakeStore:
+    embeddings = FailingEmbeddings()
+
+    def split_document(self, page):
+        return [page['content']], [{'url': page['url']}], [hash(page['url'])]
+
+    def add_embedded_chunks(self, *args):
+        raise AssertionError("nothing should reach the index")
+
+    def save_vector_store(self):
+        pass
+
+
+def test_stage_failure_with_full_queues_does_not_hang(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Metrics and traces are written under ./logs
+    pipeline = IndexingPipeline(FakeCrawler(100), FakeStore(), queue_size=2, embed_batch_size=1)
+
+    async def run():
+        await asyncio.wait_for(pipeline.run('https://example.com', max_pages=100), timeout=10)
+
+    with pytest.raises(RuntimeError, match="embedding API unavailable"):
+        asyncio.run(run())
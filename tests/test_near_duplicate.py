@@ -0,0 +1,37 @@
+import asyncio
+
+from sqlalchemy import create_engine
+
+from src.models.database import Base
+from src.services.crawler_service import CrawlerService
+from src.services.page_record_service import PageRecordService, PageSnapshot
+
+
+def make_crawler(tmp_path) -> CrawlerService:
+    engine = create_engine(f"sqlite:///{tmp_path / 'records.db'}")
+    Base.metadata.create_all(engine)
+    return CrawlerService(page_records=PageRecordService(engine), archive=None)
+
+
+def test_duplicates_resolve_to_pending_and_saved_originals(tmp_path):
+    crawler = make_crawler(tmp_path)
+    fingerprint = 0x0123456789abcdef
+
+    assert asyncio.run(crawler.near_duplicate_of('https://site.com/a', fingerprint)) is None
+    # Not saved yet: the URL comes from the detector
+    assert asyncio.run(crawler.near_duplicate_of('https://site.com/b', fingerprint ^ 1)) == 'https://site.com/a'
+
+    crawler.page_records.save(PageSnapshot(url='https://site.com/a', simhash=fingerprint))
+    crawler.near_duplicates.saved(fingerprint)
+    assert crawler.near_duplicates.pending == {}
+    assert asyncio.run(crawler.near_duplicate_of('https://site.com/c', fingerprint ^ 2)) == 'https://site.com/a'
+
+
+def test_page_is_kept_when_its_original_has_no_record(tmp_path):
+    crawler = make_crawler(tmp_path)
+    fingerprint = 0x0123456789abcdef
+    crawler.near_duplicates.add(fingerprint)
+
+    assert asyncio.run(crawler.near_duplicate_of('https://site.com/b', fingerprint ^ 1)) is None
+    assert crawler.near_duplicates.pending == {fingerprint ^ 1: 'https://site.com/b'}
+    assert crawler.near_duplicates.duplicates == 0
@@ -0,0 +1,43 @@
+from sqlalchemy import create_engine
+
+from src.models.database import Base
+from src.services.page_archive import PageArchive
+
+
+def make_archive(tmp_path) -> PageArchive:
+    engine = create_engine(f"sqlite:///{tmp_path / 'archive.db'}")
+    Base.metadata.create_all(engine)
+    return PageArchive(str(tmp_path / 'page_archive'), engine=engine)
+
+
+def archive_page(archive: PageArchive, url: str, **kwargs):
+    archive.append(url, 200, [('Content-Type', 'text/html')], b'<p>text</p>', f"text of {url}", **kwargs)
+
+
+def test_prefix_matches_on_host_and_path_boundaries(tmp_path):
+    archive = make_archive(tmp_path)
+    for url in [
+        'https://site.com/', 'https://site.com/docs', 'https://site.com/docs/intro',
+        'https://site.com/docs-old', 'https://site.com.evil.org/', 'https://site.com-other/page',
+    ]:
+        archive_page(archive, url)
+
+    assert {row.url for row in archive.latest('https://site.com/')} == {
+        'https://site.com/', 'https://site.com/docs', 'https://site.com/docs/intro', 'https://site.com/docs-old'
+    }
+    assert {row.url for row in archive.latest('https://site.com/docs')} == {
+        'https://site.com/docs', 'https://site.com/docs/intro'
+    }
+
+
+def test_gone_and_duplicate_pages_are_removed_not_replayed(tmp_path):
+    archive = make_archive(tmp_path)
+    for url in ['https://site.com/a', 'https://site.com/b', 'https://site.com/c']:
+        archive_page(archive, url)
+    archive.mark_gone('https://site.com/b', 404)
+    archive_page(archive, 'https://site.com/c', duplicate_of='https://site.com/a')
+
+    assert [row.url for row in archive.latest('https://site.com/')] == ['https://site.com/a']
+    assert sorted(archive.removed('https://site.com/')) == ['https://site.com/b', 'https://site.com/c']
+    assert archive.read(archive.latest('https://site.com/')[0]).text == 'text of https://site.com/a'
+    archive.close()
@@ -0,0 +1,67 @@
+import pytest
+
+from src.services.rag_service import RAGService
+from src.utils.metrics import registry
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [1.0, 0.0]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.version = 1
+        self.embeddings = FakeEmbeddings()
+        self.searches = []
+
+    def similarity_search(self, query, k=4, query_vector=None):
+        self.searches.append((query, query_vector))
+        return []
+
+
+class FakeContextBuilder:
+    def build(self, candidates):
+        return candidates
+
+
+class FakeChain:
+    def __init__(self):
+        self.questions = []
+
+    def invoke(self, inputs):
+        self.questions.append(inputs['question'])
+        return f"answer {len(self.questions)}"
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+    monkeypatch.setattr(registry, 'write', lambda *args, **kwargs: None)
+    service = RAGService(FakeVectorStore(), context_builder=FakeContextBuilder())
+    service.chain = FakeChain()
+    return service
+
+
+def test_answers_are_cached_under_the_question_alone(rag):
+    first = rag.query('What is RAG?')
+    assert rag.query('What is RAG?') == first
+    assert rag.chain.questions == ['What is RAG?']
+    # Retrieval reuses the embedding computed for the cache lookup
+    assert rag.vector_store_service.embeddings.calls == 1
+    assert rag.vector_store_service.searches == [('What is RAG?', [1.0, 0.0])]
+
+
+def test_follow_up_questions_skip_the_cache(rag):
+    rag.query('What is RAG?')
+    history = [{'role': 'user', 'content': 'Tell me about retrieval'}]
+
+    result = rag.query('What is RAG?', history)
+
+    assert result['answer'] == 'answer 2'
+    assert 'Tell me about retrieval' in rag.chain.questions[1]
+    assert len(rag.answer_cache.entries) == 1
@@ -0,0 +1,26 @@
+from src.services.url_canonicalizer import SiteRules, UrlCanonicalizer
+
+
+def test_trailing_slash_is_kept_by_default():
+    canonicalizer = UrlCanonicalizer()
+
+    assert canonicalizer.canonicalize('https://Site.com/docs/') == 'https://site.com/docs/'
+    assert canonicalizer.canonicalize('https://site.com/docs') == 'https://site.com/docs'
+    assert canonicalizer.canonicalize('https://site.com/docs/index.html') == 'https://site.com/docs/'
+
+
+def test_only_tracking_parameters_are_stripped_by_default():
+    canonicalizer = UrlCanonicalizer()
+
+    assert canonicalizer.canonicalize(
+        'https://site.com/item?sid=7&utm_source=mail&ref=home&gclid=x'
+    ) == 'https://site.com/item?ref=home&sid=7'
+
+
+def test_site_rules_can_strip_content_parameters_and_slashes():
+    canonicalizer = UrlCanonicalizer({
+        'site.com': SiteRules(strip_params=['utm_*', 'ref'], trailing_slash='strip'),
+    })
+
+    assert canonicalizer.canonicalize('https://www.site.com/docs/?ref=home') == 'https://www.site.com/docs'
+    assert canonicalizer.canonicalize('https://other.org/docs/?ref=home') == 'https://other.org/docs/?ref=home'
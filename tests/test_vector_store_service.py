@@ -0,0 +1,32 @@
+from src.services.faiss_index import IndexConfig
+from src.services.vector_store_service import VectorStoreService
+
+
+class FixedEmbeddings:
+    def embed_documents(self, texts):
+        return [[1.0, 0.0, 0.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+
+def open_store(store_dir: str) -> VectorStoreService:
+    return VectorStoreService(store_dir, embeddings=FixedEmbeddings(), index_config=IndexConfig(index_type='hnsw'))
+
+
+def test_unsaved_changes_roll_back_the_lexical_index_with_the_chunks(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    store = open_store(store_dir)
+    store.add_embedded_chunks(
+        ['alpha beta', 'gamma'], [[1, 0, 0, 0], [0, 1, 0, 0]], [{'url': 'u1'}, {'url': 'u2'}], [1, 2]
+    )
+    store.save_vector_store()
+    store.add_embedded_chunks(['delta'], [[0, 0, 1, 0]], [{'url': 'u3'}], [3], replace_urls=['u1'])
+    store.close()
+
+    store = open_store(store_dir)
+    assert len(store.chunks) == 2
+    assert store.lexical_index.doc_count == 2
+    assert [doc_id for doc_id, _ in store.search_ids('alpha', 4, mode='lexical')] == [1]
+    assert store.search_ids('delta', 4, mode='lexical') == []
+    store.close()